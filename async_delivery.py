@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+import aiohttp
+from delivery import (
+    TokenBucket, GLOBAL_RATE, GLOBAL_BURST, CHAT_RATE, CHAT_BURST, CHAT_BUCKET_IDLE_SECONDS,
+    format_reminder
+)
+from retry import PERMANENT_ERROR_CODES
+from logging_setup import configure_logging
+from metrics import SEND_LATENCY, FAILURES
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Base URL of the Bot API; point it at a local fake server for testing
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# Maximum number of sendMessage requests in flight at once
+ASYNC_MAX_IN_FLIGHT = int(os.environ.get("ASYNC_MAX_IN_FLIGHT", "100"))
+
+# Maximum number of due messages buffered between the dispatcher and the engine
+ASYNC_QUEUE_SIZE = int(os.environ.get("ASYNC_QUEUE_SIZE", "10000"))
+
+class AsyncDeliveryEngine:
+    """
+    Alternate delivery engine built on asyncio and one pooled HTTP session.
+
+    The engine runs its own event loop in a background thread. Due messages are
+    fed in from the dispatcher through a bounded queue (submit() blocks when it
+    is full, pushing back on the dispatcher), and a fixed number of worker
+    coroutines send them over a single long-lived aiohttp session whose
+    connection pool is sized to the in-flight limit. Sends are paced with the
+    same global and per-chat token buckets as the threaded delivery stage, and a
+    429 response requeues the message after its retry_after and pauses every
+    chat for that long. Any other failure
+    is reported to on_failed, which decides whether to retry.
+    """
+
+    def __init__(self, token: str, on_sent: Callable[[int, str], None],
+                 on_failed: Optional[Callable[[int, str, str, bool], None]] = None,
+                 max_in_flight: int = ASYNC_MAX_IN_FLIGHT, queue_size: int = ASYNC_QUEUE_SIZE,
+                 api_url: str = TELEGRAM_API_URL,
+                 global_rate: float = GLOBAL_RATE, global_burst: float = GLOBAL_BURST,
+                 chat_rate: float = CHAT_RATE, chat_burst: float = CHAT_BURST):
+        """
+        Initialize the engine.
+
+        Args:
+            token: The Telegram bot token
+            on_sent: Called as on_sent(user_id, job_id) on a worker thread after a successful send
+            on_failed: Called as on_failed(user_id, job_id, reason, permanent) on a worker
+                thread after a failed send; permanent is True if retrying cannot help
+            max_in_flight: Maximum number of concurrent sendMessage requests
+            queue_size: Capacity of the queue feeding the engine
+            api_url: Base URL of the Bot API
+            global_rate: Messages per second across all chats
+            global_burst: Global bucket capacity
+            chat_rate: Messages per second to any one chat
+            chat_burst: Per-chat bucket capacity
+        """
+        self.on_sent = on_sent
+        self.on_failed = on_failed
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.send_url = f"{api_url.rstrip('/')}/bot{token}/sendMessage"
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._in_flight = 0
+        self._delayed = 0
+        self._last_prune = time.monotonic()
+        self.retry_after_count = 0
+        self.sent_count = 0
+
+    def start(self) -> None:
+        """Start the event loop thread and wait until the engine accepts messages."""
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run_loop, name='async-delivery', daemon=True)
+        self._thread.start()
+        self._started.wait()
+        logger.info(f"Async delivery engine started (max {self.max_in_flight} in flight, "
+                    f"queue size {self.queue_size})")
+
+    def stop(self) -> None:
+        """Stop the workers, close the HTTP session and the event loop."""
+        if not self.loop or not self._thread:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def submit(self, user_id: int, text: str, job_id: str) -> None:
+        """
+        Queue a message for delivery, blocking while the queue is full.
+
+        Args:
+            user_id: The Telegram user ID of the recipient
+            text: The message text
+            job_id: The ID of the scheduled job
+        """
+        future = asyncio.run_coroutine_threadsafe(self._queue.put((user_id, text, job_id)), self.loop)
+        future.result()
+
+    def queued(self) -> int:
+        """Return the number of messages waiting to be sent."""
+        return (self._queue.qsize() if self._queue else 0) + self._delayed
+
+    def in_flight(self) -> int:
+        """Return the number of sends currently running."""
+        return self._in_flight
+
+    def capacity(self) -> int:
+        """Return the maximum number of sends that can run at once."""
+        return self.max_in_flight
+
+    def _run_loop(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._startup())
+        self._started.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def _startup(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_in_flight)]
+
+    async def _shutdown(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        await self.session.close()
+
+    def _chat_bucket(self, user_id: int) -> TokenBucket:
+        now = time.monotonic()
+        if now - self._last_prune >= CHAT_BUCKET_IDLE_SECONDS:
+            # Drop buckets that are full again so the map does not grow forever
+            self._last_prune = now
+            for idle_user in [uid for uid, b in self.chat_buckets.items() if b.is_idle(now)]:
+                del self.chat_buckets[idle_user]
+        bucket = self.chat_buckets.get(user_id)
+        if bucket is None:
+            bucket = self.chat_buckets[user_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _requeue_later(self, item: Tuple[int, str, str], delay: float) -> None:
+        """Put a message back on the queue after a delay without holding a worker."""
+        self._delayed += 1
+
+        def requeue():
+            try:
+                self._queue.put_nowait(item)
+                self._delayed -= 1
+            except asyncio.QueueFull:
+                self.loop.call_later(0.1, requeue)
+
+        self.loop.call_later(delay, requeue)
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._deliver(item)
+            except Exception as e:
+                logger.error(f"Unhandled error delivering job {item[2]}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, item: Tuple[int, str, str]) -> None:
+        user_id, text, job_id = item
+
+        # Per-chat limit: park the message instead of holding a worker slot
+        now = time.monotonic()
+        chat_bucket = self._chat_bucket(user_id)
+        chat_wait = chat_bucket.wait_time(now)
+        if chat_wait > 0:
+            self._requeue_later(item, chat_wait)
+            return
+        chat_bucket.consume(now)
+
+        # Global limit: every worker waits its turn for the shared bucket
+        while True:
+            now = time.monotonic()
+            wait = self.global_bucket.wait_time(now)
+            if wait <= 0:
+                self.global_bucket.consume(now)
+                break
+            await asyncio.sleep(wait)
+
+        self._in_flight += 1
+        started = time.perf_counter()
+        status = None
+        try:
+            async with self.session.post(self.send_url, json={
+                'chat_id': user_id,
+                'text': format_reminder(text),
+                'parse_mode': 'Markdown'
+            }) as response:
+                status = response.status
+                payload = await response.json(content_type=None)
+                if not isinstance(payload, dict):
+                    raise ValueError("not a JSON object")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Error sending scheduled message {job_id}: {e}")
+            FAILURES.inc('send')
+            payload = None
+            reason = str(e) or type(e).__name__
+        except ValueError as e:
+            # An unparsable body, e.g. a proxy's HTML error page; treated as transient
+            logger.error(f"Unreadable response to scheduled message {job_id} (HTTP {status}): {e}")
+            FAILURES.inc('send')
+            payload = None
+            reason = f"HTTP {status}: unreadable response"
+        finally:
+            self._in_flight -= 1
+            SEND_LATENCY.observe(time.perf_counter() - started)
+
+        if payload is None:
+            await self._report_failure(user_id, job_id, reason, False)
+            return
+
+        if payload.get('ok'):
+            self.sent_count += 1
+            await self.loop.run_in_executor(None, self.on_sent, user_id, job_id)
+            return
+
+        retry_after = (payload.get('parameters') or {}).get('retry_after')
+        if retry_after is not None:
+            self.retry_after_count += 1
+            FAILURES.inc('retry_after')
+            now = time.monotonic()
+            chat_bucket.block(now, retry_after)
+            # The flood wait usually applies to the whole bot, not only this chat
+            self.global_bucket.block(now, retry_after)
+            self._requeue_later(item, retry_after)
+            logger.warning(f"Telegram asked to retry job {job_id} after {retry_after}s, requeued")
+            return
+
+        logger.error(f"Telegram rejected scheduled message {job_id}: {payload.get('description')}")
+        FAILURES.inc('send')
+        error_code = payload.get('error_code')
+        await self._report_failure(user_id, job_id, payload.get('description') or f"Error {error_code}",
+                                   error_code in PERMANENT_ERROR_CODES)
+
+    async def _report_failure(self, user_id: int, job_id: str, reason: str, permanent: bool) -> None:
+        if self.on_failed:
+            await self.loop.run_in_executor(None, self.on_failed, user_id, job_id, reason, permanent)
@@ -0,0 +1,102 @@
+"""
+Benchmark the bulk scheduling API: rows/sec and peak memory for a streamed load.
+
+Generates a JSON Lines body of N rows on the fly and feeds it through the
+same path as POST /api/messages/bulk (read_lines -> bulk_schedule ->
+MessageScheduler.schedule_messages_bulk), at several chunk sizes, against
+DATABASE_URL (a temporary SQLite file if unset). Memory used by the load
+itself (tracemalloc peak, minus the pending entries the scheduler keeps for
+the new messages) is measured in a second run and should stay flat as N
+grows. For comparison, a sample of rows
+is also scheduled one at a time through schedule_message, the path the bot
+conversation uses.
+
+Usage:
+    python benchmarks/bench_bulk.py [--rows N]
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_bulk.db")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+os.environ.setdefault("SENT_JOURNAL_PATH", "")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from bulk_api import bulk_schedule, read_lines
+from scheduler import MessageScheduler
+
+CHUNK_SIZES = (100, 1000, 5000)
+
+class GeneratedBody(io.RawIOBase):
+    """A request body of JSON Lines rows generated as it is read."""
+
+    def __init__(self, rows: int, run: str):
+        self.lines = (
+            json.dumps({
+                'user_id': 1 + index % 1000,
+                'text': f"campaign message {index}",
+                'delivery_time': (datetime.now() + timedelta(days=1, seconds=index)).isoformat(),
+                'id': f"{run}-{index}"
+            }).encode() + b"\n"
+            for index in range(rows)
+        )
+
+    def readline(self, size: int = -1) -> bytes:
+        return next(self.lines, b"")
+
+def run_bulk(message_scheduler: MessageScheduler, rows: int, chunk_size: int, traced: bool) -> float:
+    body = GeneratedBody(rows, f"bulk{chunk_size}x{rows}{'t' if traced else ''}")
+    started = time.perf_counter()
+    for result in bulk_schedule(read_lines(body), message_scheduler, chunk_size):
+        # Serialize like the route does, then drop the line
+        json.dumps(result)
+    elapsed = time.perf_counter() - started
+    assert result['summary']['scheduled'] == rows, result
+    return rows / elapsed
+
+def load_memory(message_scheduler: MessageScheduler, rows: int, chunk_size: int) -> int:
+    """Peak memory of a load, minus what the scheduler keeps for the new pending messages."""
+    tracemalloc.start()
+    run_bulk(message_scheduler, rows, chunk_size, traced=True)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - retained
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    message_scheduler = MessageScheduler()
+    time.sleep(1)
+
+    sample = min(args.rows, 1000)
+    delivery_time = datetime.now() + timedelta(days=1)
+    started = time.perf_counter()
+    for index in range(sample):
+        message_scheduler.schedule_message(2000 + index % 1000, f"single message {index}",
+                                           delivery_time + timedelta(seconds=index))
+    single_rate = sample / (time.perf_counter() - started)
+
+    print(f"{'path':>16} {'rows':>8} {'rows/s':>9} {'load MiB':>9}")
+    print(f"{'schedule_message':>16} {sample:>8} {single_rate:>9.0f} {'-':>9}")
+    for chunk_size in CHUNK_SIZES:
+        for rows in (args.rows // 10, args.rows):
+            rate = run_bulk(message_scheduler, rows, chunk_size, traced=False)
+            memory = load_memory(message_scheduler, rows, chunk_size)
+            print(f"{'bulk/' + str(chunk_size):>16} {rows:>8} {rate:>9.0f} {memory / 2**20:>9.1f}")
+
+    message_scheduler.scheduler.shutdown(wait=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark claim-mode delivery throughput with 1, 2 and 4 worker processes.
+
+Inserts due messages, then starts worker processes that each claim batches
+with claim_due_messages(), "send" them with a fixed per-worker concurrency and
+simulated Bot API latency, and mark them sent. Reports messages/sec and
+checks that no message was delivered twice. Runs against DATABASE_URL (a
+temporary SQLite file if unset; SQLite serializes the claims, PostgreSQL
+shows the real SKIP LOCKED behaviour).
+
+Usage:
+    python benchmarks/bench_claim.py [--messages N] [--send-latency SECONDS] [--batch-size N]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_claim.db")
+
+WORKER_COUNTS = (1, 2, 4)
+
+# Concurrent sends per worker, like DELIVERY_WORKERS
+SENDS_PER_WORKER = 10
+
+def worker(worker_id: str, batch_size: int, send_latency: float, results) -> None:
+    import logging
+    logging.disable(logging.CRITICAL)
+    from claims import claim_due_messages
+    from write_behind import mark_sent_in_db
+
+    sent = []
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=SENDS_PER_WORKER) as pool:
+        while True:
+            claimed = claim_due_messages(worker_id, batch_size, lease_seconds=60)
+            if not claimed:
+                break
+            list(pool.map(lambda row: time.sleep(send_latency), claimed))
+            now = datetime.now()
+            mark_sent_in_db([(row[0], now) for row in claimed])
+            sent.extend(row[0] for row in claimed)
+    results.put((started, time.time(), sent))
+
+def insert_due(messages: int, run: int) -> None:
+    from database import app, init_database
+    from models import db, ScheduledMessage
+
+    init_database()
+    now = datetime.now()
+    with app.app_context():
+        db.session.execute(db.insert(ScheduledMessage), [{
+            'user_id': index,
+            'text': f"benchmark message {index}",
+            'scheduled_time': now,
+            'delivery_time': now - timedelta(seconds=1),
+            'job_id': f"claim_{run}_{index}",
+            'is_sent': False
+        } for index in range(messages)])
+        db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--send-latency', type=float, default=0.05)
+    parser.add_argument('--batch-size', type=int, default=SENDS_PER_WORKER)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    context = multiprocessing.get_context('spawn')
+    print(f"{'workers':>8} {'messages/s':>11} {'duplicates':>11}")
+    for run, workers in enumerate(WORKER_COUNTS):
+        insert_due(args.messages, run)
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(f"bench-{run}-{index}", args.batch_size,
+                                                 args.send_latency, results))
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        # Timed from the first worker starting to claim to the last one finishing,
+        # so process start-up and imports are not counted
+        sent = Counter()
+        first_start, last_end = float('inf'), 0.0
+        for _ in processes:
+            worker_start, worker_end, worker_sent = results.get()
+            first_start = min(first_start, worker_start)
+            last_end = max(last_end, worker_end)
+            sent.update(worker_sent)
+        elapsed = last_end - first_start
+        for process in processes:
+            process.join()
+        duplicates = sum(count - 1 for count in sent.values() if count > 1)
+        print(f"{workers:>8} {sum(sent.values()) / elapsed:>11.0f} {duplicates:>11}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark memory held for abandoned scheduling conversations.
+
+Simulates N one-off users who each send a message and never send a time,
+and measures the memory still held afterwards (tracemalloc):
+
+- before: python-telegram-bot's defaults, as the bot used them: a user_data
+  dict holding the message, an empty chat_data dict and a ConversationHandler
+  entry per user, none of which is ever removed.
+- after: TransientDataDict for user_data and chat_data plus a
+  MemoryConversationStore with the default caps.
+
+Usage:
+    python benchmarks/bench_conversations.py [--users 10000,100000,1000000]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from conversations import MemoryConversationStore, TransientDataDict
+
+WAITING_FOR_TIME = 1
+
+def message_text(index: int) -> str:
+    return f"Forwarded from Someone (@someone):\n\nreminder text number {index} " * 3
+
+def before(users: int):
+    user_data = defaultdict(dict)
+    chat_data = defaultdict(dict)
+    conversations = {}
+    for user_id in range(users):
+        chat_data[user_id]
+        user_data[user_id]['message'] = message_text(user_id)
+        conversations[(user_id, user_id)] = WAITING_FOR_TIME
+    return user_data, chat_data, conversations
+
+def after(users: int):
+    user_data = TransientDataDict()
+    chat_data = TransientDataDict()
+    conversations = MemoryConversationStore()
+    for user_id in range(users):
+        chat_data[user_id]
+        user_data[user_id]
+        conversations.set_message((user_id, user_id), message_text(user_id))
+        conversations[(user_id, user_id)] = WAITING_FOR_TIME
+    return user_data, chat_data, conversations
+
+def measure(build, users: int) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    held = build(users)
+    elapsed = time.perf_counter() - started
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return size, users / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', default="10000,100000,1000000",
+                        help="comma-separated numbers of one-off users")
+    args = parser.parse_args()
+
+    print(f"{'users':>9} {'before MiB':>11} {'after MiB':>10} {'after users/s':>14}")
+    for users in (int(value) for value in args.users.split(',')):
+        before_size, _ = measure(before, users)
+        after_size, rate = measure(after, users)
+        print(f"{users:>9} {before_size / 2**20:>11.1f} {after_size / 2**20:>10.1f} {rate:>14.0f}")
+
+if __name__ == "__main__":
+    main()
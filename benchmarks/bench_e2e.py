@@ -0,0 +1,286 @@
+"""
+End-to-end load test of the scheduler and bot handlers against a fake Bot API.
+
+For each scale (pending messages; default 1k, 100k and 1M) two fresh
+processes run against the same database:
+
+1. load: schedules a sample of messages through MessageScheduler.schedule_message
+   from concurrent synthetic users, drives the bot's conversation handlers
+   with "text !schedule 1d" updates served by the fake getUpdates, fills the
+   database up to the scale with schedule_messages_bulk, and sends a
+   burst of messages due a few seconds ahead to measure delivery lag (due
+   time to arrival at the fake server). Reports throughputs, lag
+   percentiles and memory (RSS) with every message pending.
+2. recover: starts a new MessageScheduler on the populated database and
+   reports how long startup recovery takes and the memory it adds.
+
+Results are printed and saved as JSON; pass an earlier results file to
+--compare to print the change for each metric. Uses a temporary SQLite
+database per scale unless DATABASE_URL is set (it must then be empty, and
+only one scale can be run against it).
+The fake Bot API is not rate limited, so TELEGRAM_GLOBAL_RATE defaults to
+--global-rate here to measure the scheduler rather than Telegram's limit.
+
+Usage:
+    python benchmarks/bench_e2e.py [--scales 1000,100000,1000000] [--output FILE] [--compare FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_telegram import FakeTelegramServer, command_update
+
+DEFAULT_SCALES = "1000,100000,1000000"
+
+# Messages scheduled one at a time and through the handlers (at most half and
+# a quarter of the scale), and sent in the lag burst
+SCHEDULE_SAMPLE = 5000
+HANDLER_SAMPLE = 1000
+LAG_SAMPLE = 1000
+
+# Concurrent synthetic users calling schedule_message
+SCHEDULE_THREADS = 50
+
+# Rows per schedule_messages_bulk call when filling up to the scale
+FILL_CHUNK_SIZE = 5000
+
+# Seconds ahead the lag burst is due, and the window it is spread over
+LAG_LEAD_SECONDS = 3
+LAG_SPREAD_SECONDS = 2
+
+def rss_bytes() -> int:
+    """Return the resident set size of this process."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Return the given percentile of a sorted list."""
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def start_environment(send_latency: float) -> FakeTelegramServer:
+    """Start the fake Bot API and point the bot at it; call before importing the app."""
+    server = FakeTelegramServer(send_latency=send_latency).start()
+    os.environ["TELEGRAM_API_URL"] = server.url
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123456:benchmark"
+    os.environ["SENT_JOURNAL_PATH"] = ""
+
+    import logging
+    logging.disable(logging.CRITICAL)
+    return server
+
+def run_load(scale: int, send_latency: float) -> Dict[str, Any]:
+    """Phase 1: schedule, fill, drive the handlers and measure delivery lag."""
+    server = start_environment(send_latency)
+    baseline_rss = rss_bytes()
+
+    # The MessageScheduler the handlers use
+    import bot
+    message_scheduler = bot.get_scheduler()
+    results: Dict[str, Any] = {}
+
+    # schedule_message from concurrent synthetic users
+    sample = min(scale // 2, SCHEDULE_SAMPLE)
+    delivery_time = datetime.now() + timedelta(days=1)
+    per_thread = -(-sample // SCHEDULE_THREADS)
+
+    def user(thread_index: int) -> None:
+        for index in range(thread_index * per_thread, min(sample, (thread_index + 1) * per_thread)):
+            message_scheduler.schedule_message(10_000_000 + index % 1000, f"e2e message {index}",
+                                               delivery_time + timedelta(microseconds=index))
+
+    threads = [threading.Thread(target=user, args=(index,)) for index in range(SCHEDULE_THREADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results['schedule_per_second'] = round(sample / (time.perf_counter() - started), 1)
+
+    # Bot handlers, driven through long polling
+    handler_sample = min(scale // 4, HANDLER_SAMPLE)
+    updater = bot.setup_bot('polling')
+    chats = range(30_000_000, 30_000_000 + handler_sample)
+    sent_before = len(server.sent)
+    started = time.perf_counter()
+    server.push_updates([
+        command_update(index + 1, chat_id, f"handler message {index} !schedule 1d")
+        for index, chat_id in enumerate(chats)
+    ])
+    server.wait_for_sent(sent_before + handler_sample)
+    results['handler_updates_per_second'] = round(handler_sample / (time.perf_counter() - started), 1)
+    replies = [text for _, chat_id, text in server.sent[sent_before:] if chat_id in chats]
+    results['handler_scheduled'] = sum(1 for text in replies if text.startswith('✅'))
+    updater.stop()
+
+    # Fill up to the scale in bulk
+    remaining = scale - sample - handler_sample
+    started = time.perf_counter()
+    now = datetime.now()
+    for start in range(0, remaining, FILL_CHUNK_SIZE):
+        message_scheduler.schedule_messages_bulk([{
+            'user_id': 20_000_000 + index % max(1, scale // 10),
+            'text': f"e2e bulk message {index}",
+            'scheduled_time': now,
+            'delivery_time': delivery_time + timedelta(seconds=index % 86400),
+            'job_id': f"e2e_{index}"
+        } for index in range(start, min(remaining, start + FILL_CHUNK_SIZE))])
+    if remaining:
+        results['bulk_fill_per_second'] = round(remaining / (time.perf_counter() - started), 1)
+
+    # Delivery lag for a burst coming due, one message per chat
+    lag_sample = min(scale, LAG_SAMPLE)
+    due_base = time.time() + LAG_LEAD_SECONDS
+    due = {
+        40_000_000 + index: due_base + LAG_SPREAD_SECONDS * index / lag_sample
+        for index in range(lag_sample)
+    }
+    now = datetime.now()
+    message_scheduler.schedule_messages_bulk([{
+        'user_id': chat_id,
+        'text': f"lag {chat_id}",
+        'scheduled_time': now,
+        'delivery_time': datetime.fromtimestamp(due_ts),
+        'job_id': f"e2e_lag_{chat_id}"
+    } for chat_id, due_ts in due.items()])
+    clock_offset = time.time() - time.perf_counter()
+    sent_before = len(server.sent)
+    server.wait_for_sent(sent_before + lag_sample, timeout=LAG_LEAD_SECONDS + 300)
+    lags = sorted(
+        (sent_at + clock_offset - due[chat_id]) * 1000
+        for sent_at, chat_id, _ in server.sent[sent_before:]
+        if chat_id in due
+    )
+    results['delivered'] = len(lags)
+    for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+        results[f'lag_{name}_ms'] = round(percentile(lags, fraction), 1)
+    results['lag_max_ms'] = round(lags[-1], 1) if lags else None
+
+    results['pending'] = len(message_scheduler.dispatcher)
+    results['rss_mib'] = round(rss_bytes() / 2**20, 1)
+    results['rss_added_mib'] = round((rss_bytes() - baseline_rss) / 2**20, 1)
+
+    # Finish the sends still confirming and commit the buffered "sent" updates
+    # before the recovery phase reads the database
+    message_scheduler.delivery.stop()
+    message_scheduler.sent_writer.stop()
+    server.stop()
+    return results
+
+def run_recover(send_latency: float) -> Dict[str, Any]:
+    """Phase 2: start a scheduler on the populated database."""
+    server = start_environment(send_latency)
+    import scheduler
+    baseline_rss = rss_bytes()
+    started = time.perf_counter()
+    message_scheduler = scheduler.MessageScheduler()
+    elapsed = time.perf_counter() - started
+    results = {
+        'startup_seconds': round(elapsed, 3),
+        'recovered': message_scheduler.recovery_stats.get('loaded_messages'),
+        'recovery_seconds': message_scheduler.recovery_stats.get('duration_seconds'),
+        'recovery_rss_added_mib': round((rss_bytes() - baseline_rss) / 2**20, 1)
+    }
+    server.stop()
+    return results
+
+def run_phase(phase: str, scale: int, database_url: str, args) -> Dict[str, Any]:
+    """Run one phase in a fresh process and return its results."""
+    env = dict(os.environ, DATABASE_URL=database_url)
+    env.setdefault("TELEGRAM_GLOBAL_RATE", str(args.global_rate))
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--phase', phase, '--scales', str(scale),
+         '--send-latency', str(args.send_latency)],
+        env=env, check=True, stdout=subprocess.PIPE, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]) -> None:
+    """Print each numeric metric of both runs and the relative change."""
+    print()
+    print(f"{'scale':>8} {'metric':>26} {'before':>11} {'after':>11} {'change':>8}")
+    for scale, metrics in current['scales'].items():
+        before = previous.get('scales', {}).get(scale, {})
+        for name, value in metrics.items():
+            old = before.get(name)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = f"{(value - old) / old * 100:+.1f}%" if old else "-"
+            print(f"{scale:>8} {name:>26} {old:>11} {value:>11} {change:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', default=DEFAULT_SCALES,
+                        help="comma-separated numbers of pending messages")
+    parser.add_argument('--send-latency', type=float, default=0.02,
+                        help="seconds each fake sendMessage takes")
+    parser.add_argument('--global-rate', type=float, default=1000,
+                        help="TELEGRAM_GLOBAL_RATE for the run")
+    parser.add_argument('--output', help="results file (default benchmarks/results/e2e-<time>.json)")
+    parser.add_argument('--compare', help="earlier results file to compare with")
+    parser.add_argument('--phase', choices=('load', 'recover'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    scales = [int(scale) for scale in args.scales.split(',')]
+    database_url = os.environ.get("DATABASE_URL")
+
+    if args.phase == 'load':
+        print(json.dumps(run_load(scales[0], args.send_latency)))
+        return
+    if args.phase == 'recover':
+        print(json.dumps(run_recover(args.send_latency)))
+        return
+
+    run = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'send_latency': args.send_latency,
+        'global_rate': float(os.environ.get("TELEGRAM_GLOBAL_RATE", args.global_rate)),
+        'database': database_url.split(':', 1)[0] if database_url else 'sqlite',
+        'scales': {}
+    }
+    for scale in scales:
+        url = database_url or f"sqlite:///{tempfile.mkdtemp()}/bench_e2e.db"
+        results = run_phase('load', scale, url, args)
+        results.update(run_phase('recover', scale, url, args))
+        run['scales'][str(scale)] = results
+        print(f"{scale} pending messages:")
+        for name, value in results.items():
+            print(f"  {name:>26}: {value}")
+
+    output = args.output or os.path.join(
+        BENCH_DIR, 'results', f"e2e-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as results_file:
+        json.dump(run, results_file, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            compare(json.load(previous_file), run)
+
+if __name__ == "__main__":
+    main()
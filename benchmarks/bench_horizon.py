@@ -0,0 +1,123 @@
+"""
+Benchmark memory and startup with and without a rolling time horizon.
+
+For each backlog size (pending messages spread over the next 30 days, plus
+a fixed near-term load due in the next few minutes) a fresh process starts
+a MessageScheduler on the filled database, once holding every pending
+message (HORIZON_SECONDS=0) and once with a horizon, and reports the
+messages held, startup recovery time, the memory (RSS) recovery added and
+how long one refill of the horizon takes. With a horizon the memory should
+follow the near-term load rather than the backlog. Runs against a temporary
+SQLite file per size (DATABASE_URL is ignored).
+
+Usage:
+    python benchmarks/bench_horizon.py [--backlog 10000,100000,1000000] [--horizon 900]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_e2e import rss_bytes
+
+# Messages due within the first minutes, whatever the backlog
+NEAR_TERM = 1000
+
+# Rows per INSERT when filling the database
+FILL_CHUNK_SIZE = 5000
+
+def fill(backlog: int) -> None:
+    """Create the schema and insert the near-term load and the backlog."""
+    import logging
+    logging.disable(logging.CRITICAL)
+    from database import app, init_database
+    from models import db, ScheduledMessage
+
+    init_database()
+    now = datetime.now()
+    total = NEAR_TERM + backlog
+    with app.app_context():
+        for start in range(0, total, FILL_CHUNK_SIZE):
+            db.session.execute(db.insert(ScheduledMessage), [{
+                'user_id': 1 + index % 1000,
+                'text': f"benchmark message {index}",
+                'scheduled_time': now,
+                # Near-term messages over the next 5 minutes, the backlog over 30 days
+                'delivery_time': now + (timedelta(seconds=60 + index * 240 / NEAR_TERM) if index < NEAR_TERM
+                                        else timedelta(hours=1, seconds=(index * 7919) % (30 * 86400))),
+                'job_id': f"horizon_{index}",
+                'is_sent': False
+            } for index in range(start, min(total, start + FILL_CHUNK_SIZE))])
+            db.session.commit()
+
+def measure() -> dict:
+    """Run in a fresh process: start a scheduler and time a horizon refill."""
+    from fake_telegram import FakeTelegramServer
+    server = FakeTelegramServer().start()
+    os.environ["TELEGRAM_API_URL"] = server.url
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123456:benchmark"
+    os.environ["SENT_JOURNAL_PATH"] = ""
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    import scheduler
+    baseline_rss = rss_bytes()
+    message_scheduler = scheduler.MessageScheduler()
+    results = {
+        'held': len(message_scheduler.dispatcher),
+        'recovery_seconds': message_scheduler.recovery_stats['duration_seconds'],
+        'rss_added_mib': (rss_bytes() - baseline_rss) / 2**20,
+        'refill_ms': None
+    }
+    if message_scheduler.horizon_end is not None:
+        started = time.perf_counter()
+        message_scheduler._refill_horizon()
+        results['refill_ms'] = (time.perf_counter() - started) * 1000
+    server.stop()
+    return results
+
+def run_measure(env: dict, horizon: float) -> dict:
+    env = dict(env, HORIZON_SECONDS=str(horizon))
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure'],
+                            env=env, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backlog', default="10000,100000,1000000",
+                        help="comma-separated numbers of messages due later than the near-term load")
+    parser.add_argument('--horizon', type=float, default=900,
+                        help="HORIZON_SECONDS for the horizon run")
+    parser.add_argument('--fill', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.fill is not None:
+        fill(args.fill)
+        return
+    if args.measure:
+        print(json.dumps(measure()), flush=True)
+        # Skip the scheduler's shutdown hooks; only the measurements matter
+        os._exit(0)
+
+    print(f"{'backlog':>8} {'mode':>8} {'held':>8} {'recovery s':>11} {'RSS MiB':>8} {'refill ms':>10}")
+    for backlog in (int(value) for value in args.backlog.split(',')):
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{tempfile.mkdtemp()}/bench_horizon.db")
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--fill', str(backlog)],
+                       env=env, check=True)
+        for mode, horizon in (('all', 0), (f"{args.horizon:g}s", args.horizon)):
+            result = run_measure(env, horizon)
+            refill = f"{result['refill_ms']:.1f}" if result['refill_ms'] is not None else "-"
+            print(f"{backlog:>8} {mode:>8} {result['held']:>8} {result['recovery_seconds']:>11.3f} "
+                  f"{result['rss_added_mib']:>8.1f} {refill:>10}")
+
+if __name__ == "__main__":
+    main()
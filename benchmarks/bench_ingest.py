@@ -0,0 +1,80 @@
+"""
+Benchmark schedule_message ingestion: one transaction per message vs group commit.
+
+Measures inserts/sec with 1, 10 and 100 concurrent users against DATABASE_URL
+(a temporary SQLite file if unset).
+
+Usage:
+    python benchmarks/bench_ingest.py [--messages-per-user N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_ingest.db")
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from database import app, init_database
+from models import db, ScheduledMessage
+from ingest import GroupCommitIngestor
+
+CONCURRENCY_LEVELS = (1, 10, 100)
+
+def make_row(user_id: int, index: int, run: str) -> dict:
+    now = datetime.now()
+    return {
+        'user_id': user_id,
+        'text': f"benchmark message {index}",
+        'scheduled_time': now,
+        'delivery_time': now + timedelta(hours=1),
+        'job_id': f"bench_{run}_{user_id}_{index}"
+    }
+
+def insert_per_row(row: dict) -> None:
+    """The original path: SELECT for the job_id, then INSERT and commit."""
+    with app.app_context():
+        existing = ScheduledMessage.query.filter_by(job_id=row['job_id']).first()
+        if not existing:
+            db.session.add(ScheduledMessage(is_sent=False, **row))
+            db.session.commit()
+
+def run_level(name: str, submit, users: int, per_user: int) -> float:
+    def user(user_id):
+        for index in range(per_user):
+            submit(make_row(user_id, index, f"{name}{users}"))
+
+    threads = [threading.Thread(target=user, args=(user_id,)) for user_id in range(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return users * per_user / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages-per-user', type=int, default=20)
+    args = parser.parse_args()
+
+    init_database()
+    ingestor = GroupCommitIngestor()
+    ingestor.start()
+    group_commit = lambda row: ingestor.submit(row).result()
+
+    print(f"{'users':>6} {'per-row inserts/s':>18} {'group-commit inserts/s':>23}")
+    for users in CONCURRENCY_LEVELS:
+        per_row = run_level('row', insert_per_row, users, args.messages_per_user)
+        grouped = run_level('group', group_commit, users, args.messages_per_user)
+        print(f"{users:>6} {per_row:>18.0f} {grouped:>23.0f}")
+
+    ingestor.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark log volume: log records emitted per scheduled message.
+
+Schedules messages for the future through MessageScheduler.schedule_message
+and counts the records that reach the root logger at INFO and at DEBUG, at
+two batch sizes so per-operation dumps that grow with the number of pending
+jobs show up. Runs against DATABASE_URL (a temporary SQLite file if unset).
+
+Usage:
+    python benchmarks/bench_logging.py [--messages N]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_logging.db")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:benchmark")
+os.environ.setdefault("SENT_JOURNAL_PATH", "")
+
+from scheduler import MessageScheduler
+
+class CountingHandler(logging.Handler):
+    """Counts records instead of writing them."""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+def run(message_scheduler: MessageScheduler, level: int, messages: int, user_id: int) -> tuple:
+    root = logging.getLogger()
+    counter = CountingHandler()
+    saved_handlers = root.handlers[:]
+    for handler in saved_handlers:
+        root.removeHandler(handler)
+    root.addHandler(counter)
+    root.setLevel(level)
+
+    delivery_time = datetime.now() + timedelta(days=1)
+    started = time.perf_counter()
+    for index in range(messages):
+        message_scheduler.schedule_message(user_id, f"benchmark {index}",
+                                           delivery_time + timedelta(seconds=index))
+    elapsed = time.perf_counter() - started
+
+    root.removeHandler(counter)
+    for handler in saved_handlers:
+        root.addHandler(handler)
+    return counter.count / messages, elapsed / messages * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000)
+    args = parser.parse_args()
+
+    message_scheduler = MessageScheduler()
+    # Let the startup maintenance jobs finish logging before counting
+    time.sleep(1)
+
+    print(f"{'level':>6} {'messages':>9} {'records/msg':>12} {'us/msg':>8}")
+    user_id = 1
+    for level in (logging.INFO, logging.DEBUG):
+        for messages in (args.messages // 10, args.messages):
+            per_message, micros = run(message_scheduler, level, messages, user_id)
+            user_id += 1
+            print(f"{logging.getLevelName(level):>6} {messages:>9} {per_message:>12.2f} {micros:>8.0f}")
+
+    message_scheduler.scheduler.shutdown(wait=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark the cost of recording a histogram observation.
+
+Compares the per-thread sharded Histogram from metrics.py with the same
+histogram behind a single lock, with 1, 8 and 32 threads recording at once.
+
+Usage:
+    python benchmarks/bench_metrics.py [--observations N]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Histogram, LATENCY_BUCKETS
+
+THREAD_COUNTS = (1, 8, 32)
+
+class LockedHistogram:
+    """The straightforward alternative: one set of counts guarded by a lock."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, label_value: str = '') -> None:
+        with self.lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.total += value
+
+def run(histogram, threads: int, per_thread: int) -> float:
+    def record():
+        observe = histogram.observe
+        for index in range(per_thread):
+            observe((index % 100) / 1000)
+
+    workers = [threading.Thread(target=record) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - started) / (threads * per_thread) * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--observations', type=int, default=200000)
+    args = parser.parse_args()
+
+    print(f"{'threads':>8} {'locked ns/obs':>14} {'sharded ns/obs':>15}")
+    for threads in THREAD_COUNTS:
+        per_thread = args.observations // threads
+        locked = run(LockedHistogram(), threads, per_thread)
+        sharded = run(Histogram(f'bench_{threads}', 'benchmark'), threads, per_thread)
+        print(f"{threads:>8} {locked:>14.0f} {sharded:>15.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark memory per pending message held by the scheduler.
+
+Compares the old representation (a full message dict in a per-user list plus
+one APScheduler job whose args hold the text) with the current one (a
+PendingMessage record, the per-user job_id index and a dispatcher heap entry).
+
+Usage:
+    python benchmarks/bench_pending_memory.py [--messages N] [--users N] [--text-length N]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+logging.disable(logging.CRITICAL)
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.memory import MemoryJobStore
+from dispatcher import DueTimeDispatcher
+from pending import PendingMessage
+
+def sample_rows(count: int, users: int, text_length: int):
+    now = datetime.now()
+    text = "x" * text_length
+    for index in range(count):
+        user_id = 100000000 + index % users
+        delivery_time = now + timedelta(days=1, seconds=index)
+        yield {
+            'id': index,
+            'user_id': user_id,
+            'text': text + str(index),
+            'scheduled_time': now,
+            'delivery_time': delivery_time,
+            'job_id': f"msg_{user_id}_{delivery_time.timestamp()}",
+            'created_at': now,
+            'is_sent': False,
+            'sent_at': None
+        }
+
+def noop(*args):
+    pass
+
+def measure(build, rows) -> int:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    state = build(rows)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del state
+    return size
+
+def build_old(rows):
+    messages = {}
+    scheduler = BackgroundScheduler(jobstores={'default': MemoryJobStore()}, timezone='UTC')
+    scheduler.start(paused=True)
+    for row in rows:
+        messages.setdefault(row['user_id'], []).append(row)
+        scheduler.add_job(noop, 'date', run_date=row['delivery_time'],
+                          args=[row['user_id'], row['text'], row['job_id']], id=row['job_id'])
+    return messages, scheduler
+
+def build_new(rows):
+    pending = {}
+    user_jobs = {}
+    dispatcher = DueTimeDispatcher(noop)
+    entries = []
+    for row in rows:
+        record = PendingMessage(row['job_id'], row['user_id'], row['delivery_time'].timestamp())
+        pending[record.job_id] = record
+        user_jobs.setdefault(record.user_id, set()).add(record.job_id)
+        entries.append((record.job_id, record.due_ts))
+    dispatcher.schedule_many(entries)
+    return pending, user_jobs, dispatcher
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--text-length', type=int, default=200)
+    args = parser.parse_args()
+
+    for name, build in (('dict + APScheduler job', build_old), ('PendingMessage + dispatcher', build_new)):
+        # Rows are generated lazily, as if streamed from the database, so only
+        # what each layout keeps alive is counted
+        rows = sample_rows(args.messages, args.users, args.text_length)
+        started = time.perf_counter()
+        size = measure(build, rows)
+        elapsed = time.perf_counter() - started
+        print(f"{name:<28} {size / args.messages:8.0f} bytes/message  "
+              f"({size / 2**20:.1f} MiB for {args.messages} messages, built in {elapsed:.1f}s)")
+
+if __name__ == "__main__":
+    main()
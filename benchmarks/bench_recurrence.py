@@ -0,0 +1,61 @@
+"""
+Benchmark recurring reminders: one rule vs scheduling every occurrence as a copy.
+
+For an hourly reminder covering a day, a month and a year, compares the rows
+inserted, the pending entries held by the scheduler and the memory they use.
+Also reports the cost of computing the next occurrence, which is the only
+per-send work a rule adds.
+
+Usage:
+    python benchmarks/bench_recurrence.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pending import PendingMessage
+from recurrence import parse_recurrence
+
+OCCURRENCES = (24, 720, 8760)
+
+def pending_memory(records_factory) -> int:
+    tracemalloc.start()
+    records = records_factory()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del records
+    return size
+
+def main():
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    rule = parse_recurrence("every 1h")
+
+    print(f"{'occurrences':>11} {'copies rows':>12} {'copies bytes':>13} {'rule rows':>10} {'rule bytes':>11}")
+    for occurrences in OCCURRENCES:
+        copies = pending_memory(lambda: {
+            f"msg_1_{index}": PendingMessage(f"msg_1_{index}", 1, (start + timedelta(hours=index)).timestamp())
+            for index in range(occurrences)
+        })
+        single = pending_memory(lambda: {
+            "msg_1_rule": PendingMessage("msg_1_rule", 1, start.timestamp(), str(rule))
+        })
+        print(f"{occurrences:>11} {occurrences:>12} {copies:>13} {1:>10} {single:>11}")
+
+    print()
+    print(f"{'rule':>24} {'next occurrence us':>19}")
+    for spec in ("every 1h", "weekdays 8:30", "cron */15 9-17 * * 1-5"):
+        parsed = parse_recurrence(spec)
+        now = datetime.now()
+        iterations = 20000
+        started = time.perf_counter()
+        for _ in range(iterations):
+            parse_recurrence(str(parsed)).next_after(start, now)
+        micros = (time.perf_counter() - started) / iterations * 1e6
+        print(f"{spec:>24} {micros:>19.1f}")
+
+if __name__ == "__main__":
+    main()
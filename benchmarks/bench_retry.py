@@ -0,0 +1,87 @@
+"""
+Benchmark delivery through a Bot API outage with retries and dead letters.
+
+Schedules --messages messages, one per chat, due right away while the local
+fake Bot API answers every sendMessage with 502 for --outage seconds; a
+share of the chats has blocked the bot (403). Failed sends are retried with
+jittered exponential backoff through the dispatcher, so delivery workers
+stay free during the outage, and blocked chats go straight to the
+dead-letter table. Reports how long after the outage every deliverable
+message was sent, the retries and dead letters, and the peak number of
+messages waiting for a retry in the dispatcher while the API was down.
+Uses a temporary SQLite database unless DATABASE_URL is set.
+
+Usage:
+    python benchmarks/bench_retry.py [--messages 2000] [--outage 10] [--blocked 0.05]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_telegram import FakeTelegramServer
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000, help="messages, one per chat")
+    parser.add_argument('--outage', type=float, default=10, help="seconds every send fails with 502")
+    parser.add_argument('--blocked', type=float, default=0.05, help="share of chats that blocked the bot")
+    parser.add_argument('--base-delay', type=float, default=2, help="RETRY_BASE_DELAY for the run")
+    args = parser.parse_args()
+
+    server = FakeTelegramServer().start()
+    os.environ["TELEGRAM_API_URL"] = server.url
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123456:benchmark"
+    os.environ["SENT_JOURNAL_PATH"] = ""
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_retry.db")
+    os.environ.setdefault("TELEGRAM_GLOBAL_RATE", "1000")
+    os.environ["RETRY_BASE_DELAY"] = str(args.base_delay)
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    import scheduler
+    message_scheduler = scheduler.MessageScheduler()
+
+    chats = range(50_000_000, 50_000_000 + args.messages)
+    blocked = set(chats[:int(args.messages * args.blocked)])
+    server.blocked_chats = blocked
+    now = datetime.now()
+    server.start_outage(args.outage)
+    outage_started = time.monotonic()
+    message_scheduler.schedule_messages_bulk([{
+        'user_id': chat_id,
+        'text': f"retry benchmark {chat_id}",
+        'scheduled_time': now,
+        'delivery_time': now,
+        'job_id': f"retry_{chat_id}"
+    } for chat_id in chats])
+
+    deliverable = args.messages - len(blocked)
+    peak_waiting = 0
+    while time.monotonic() - outage_started < args.outage:
+        peak_waiting = max(peak_waiting, len(message_scheduler.dispatcher))
+        time.sleep(0.05)
+    outage_ended = time.monotonic()
+    server.wait_for_sent(deliverable, timeout=600)
+    recovered = time.monotonic() - outage_ended
+    # Let the last confirmations and dead letters land before reading the counts
+    time.sleep(1)
+    message_scheduler._reconcile_counters()
+    counts = message_scheduler.counters.snapshot()
+
+    print(f"messages: {args.messages} ({len(blocked)} to chats that blocked the bot), "
+          f"outage: {args.outage:g}s, RETRY_BASE_DELAY: {args.base_delay:g}s")
+    print(f"  sends failed during the outage: {server.failed_sends}")
+    print(f"  peak messages waiting for a retry in the dispatcher: {peak_waiting}")
+    print(f"  delivered: {len(server.sent)}/{deliverable}, {recovered:.1f}s after the outage ended")
+    print(f"  retries: {counts['delivery_retries']}, dead letters: {counts['dead_letters']}")
+    os._exit(0)
+
+if __name__ == "__main__":
+    main()
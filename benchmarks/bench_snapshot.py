@@ -0,0 +1,116 @@
+"""
+Benchmark restart recovery: loading from the database vs the local snapshot.
+
+For databases holding 10k, 100k and 1M pending messages, a fresh process
+starts a MessageScheduler with SNAPSHOT_PATH set and no snapshot yet (so it
+loads every pending row from the database), writes the first snapshot and
+journals --journal further messages before it exits without a clean
+shutdown. A second process then restarts from the snapshot and journal.
+Reports both recovery times, the snapshot write time and size, and the
+database rows the restart read. Runs against a temporary SQLite file per
+size (DATABASE_URL is ignored).
+
+Usage:
+    python benchmarks/bench_snapshot.py [--pending 10000,100000,1000000] [--journal 1000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_startup import fill
+
+def start_scheduler():
+    """Start a scheduler against a local fake Bot API."""
+    from fake_telegram import FakeTelegramServer
+    server = FakeTelegramServer().start()
+    os.environ["TELEGRAM_API_URL"] = server.url
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123456:benchmark"
+    os.environ["SENT_JOURNAL_PATH"] = ""
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    import scheduler
+    return scheduler.MessageScheduler()
+
+def first_start(journal: int) -> dict:
+    """Run in a fresh process: load from the database, snapshot, then journal more messages."""
+    message_scheduler = start_scheduler()
+    results = {'database_seconds': message_scheduler.recovery_stats['duration_seconds']}
+    # The first snapshot is written right after a database load; wait for it
+    while message_scheduler.snapshots.written_count == 0:
+        time.sleep(0.01)
+    started = time.perf_counter()
+    message_scheduler._write_snapshot()
+    results['write_seconds'] = time.perf_counter() - started
+    results['snapshot_mib'] = os.path.getsize(message_scheduler.snapshots.path) / 2**20
+
+    now = datetime.now()
+    message_scheduler.schedule_messages_bulk([{
+        'user_id': 5_000_000 + index,
+        'text': f"journaled message {index}",
+        'scheduled_time': now,
+        'delivery_time': now + timedelta(days=2, seconds=index),
+        'job_id': f"journaled_{index}"
+    } for index in range(journal)])
+    return results
+
+def restart() -> dict:
+    """Run in a fresh process: restart from the snapshot and journal."""
+    message_scheduler = start_scheduler()
+    stats = message_scheduler.recovery_stats
+    return {'source': stats['source'], 'restore_seconds': stats['duration_seconds'],
+            'restored': stats['loaded_messages'], 'delta': stats.get('delta_messages')}
+
+def run(phase: str, env: dict, journal: int) -> dict:
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--phase', phase,
+                             '--journal', str(journal)],
+                            env=env, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pending', default="10000,100000,1000000",
+                        help="comma-separated numbers of pending messages")
+    parser.add_argument('--journal', type=int, default=1000,
+                        help="messages scheduled after the snapshot, replayed from the journal")
+    parser.add_argument('--fill', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--phase', choices=('first', 'restart'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.fill is not None:
+        fill(args.fill)
+        return
+    if args.phase:
+        results = first_start(args.journal) if args.phase == 'first' else restart()
+        print(json.dumps(results), flush=True)
+        # Exit like a crash: no shutdown snapshot, so the restart replays the journal
+        os._exit(0)
+
+    print(f"{'pending':>8} {'database s':>11} {'snapshot s':>11} {'write s':>8} {'MiB':>6} "
+          f"{'restored':>9} {'delta rows':>11}")
+    for pending in (int(value) for value in args.pending.split(',')):
+        directory = tempfile.mkdtemp()
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{directory}/bench_snapshot.db",
+                   SNAPSHOT_PATH=os.path.join(directory, 'schedule.snapshot'))
+        env.pop('HORIZON_SECONDS', None)
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--fill', str(pending)],
+                       env=env, check=True)
+        first = run('first', env, args.journal)
+        second = run('restart', env, args.journal)
+        if second['source'] != 'snapshot':
+            raise RuntimeError("The restart did not use the snapshot")
+        print(f"{pending:>8} {first['database_seconds']:>11.3f} {second['restore_seconds']:>11.3f} "
+              f"{first['write_seconds']:>8.3f} {first['snapshot_mib']:>6.1f} "
+              f"{second['restored']:>9} {second['delta']:>11}")
+
+if __name__ == "__main__":
+    main()
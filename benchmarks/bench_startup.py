@@ -0,0 +1,108 @@
+"""
+Benchmark startup: time until the app serves /status and until /ready.
+
+For databases holding 0, 10k and 100k pending messages, a fresh process
+imports main, calls create_app() and polls /status and /ready through
+Flask's test client, with the bot pointed at a local fake Bot API. /status
+should answer right after import whatever the database size; /ready follows
+once the schema is checked, pending messages are loaded and the bot is up,
+which is what every import of main used to wait for. Runs against a
+temporary SQLite file per size (DATABASE_URL is ignored so each size starts
+empty).
+
+Usage:
+    python benchmarks/bench_startup.py [--pending 0,10000,100000]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# Rows per INSERT when filling the database
+FILL_CHUNK_SIZE = 5000
+
+def fill(pending: int) -> None:
+    """Create the schema and insert pending messages due tomorrow."""
+    import logging
+    logging.disable(logging.CRITICAL)
+    from database import app, init_database
+    from models import db, ScheduledMessage
+
+    init_database()
+    now = datetime.now()
+    with app.app_context():
+        for start in range(0, pending, FILL_CHUNK_SIZE):
+            db.session.execute(db.insert(ScheduledMessage), [{
+                'user_id': 1 + index % 1000,
+                'text': f"benchmark message {index}",
+                'scheduled_time': now,
+                'delivery_time': now + timedelta(days=1, seconds=index),
+                'job_id': f"startup_{index}",
+                'is_sent': False
+            } for index in range(start, min(pending, start + FILL_CHUNK_SIZE))])
+            db.session.commit()
+
+def measure() -> dict:
+    """Run in a fresh process: import main, create the app and time /status and /ready."""
+    from fake_telegram import FakeTelegramServer
+    server = FakeTelegramServer().start()
+    os.environ["TELEGRAM_API_URL"] = server.url
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123456:benchmark"
+    os.environ["SENT_JOURNAL_PATH"] = ""
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter() - started
+    main.create_app()
+    client = main.app.test_client()
+    while client.get('/status').status_code != 200:
+        time.sleep(0.001)
+    serving = time.perf_counter() - started
+    while client.get('/ready').status_code != 200:
+        if main.startup_stats['state'] == 'failed':
+            raise RuntimeError(main.startup_stats.get('error'))
+        time.sleep(0.01)
+    ready = time.perf_counter() - started
+    return {'import': imported, 'serving': serving, 'ready': ready,
+            'recovered': main.telegram_bot.get_scheduler().recovery_stats.get('loaded_messages')}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pending', default="0,10000,100000",
+                        help="comma-separated numbers of pending messages")
+    parser.add_argument('--fill', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.fill is not None:
+        fill(args.fill)
+        return
+    if args.measure:
+        print(json.dumps(measure()), flush=True)
+        # Skip the scheduler's shutdown hooks; only the timings matter
+        os._exit(0)
+
+    print(f"{'pending':>8} {'import s':>9} {'/status s':>10} {'/ready s':>9} {'recovered':>10}")
+    for pending in (int(value) for value in args.pending.split(',')):
+        # Fill and measure in separate processes so the measured one starts cold
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{tempfile.mkdtemp()}/bench_startup.db")
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--fill', str(pending)],
+                       env=env, check=True)
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure'],
+                                env=env, check=True, stdout=subprocess.PIPE, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{pending:>8} {result['import']:>9.3f} {result['serving']:>10.3f} "
+              f"{result['ready']:>9.3f} {result['recovered']:>10}")
+
+if __name__ == "__main__":
+    main()
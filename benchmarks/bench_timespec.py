@@ -0,0 +1,57 @@
+"""
+Micro-benchmark for time-spec parsing.
+
+Compares the original four-regex parser from bot.py with timespec's
+single-pass tokenizer, cold (memo cleared every call) and warm (memoized).
+
+Usage:
+    python benchmarks/bench_timespec.py [--iterations N]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import timespec
+
+SPECS = ["5m", "2h", "1d", "30 seconds", "3h 30m", "2 hours", "1h 2h", "90 minutes"]
+
+def legacy_parse(time_spec):
+    """The parser bot.py used before timespec, kept here for comparison."""
+    now = datetime.now()
+    minutes_pattern = re.compile(r'(\d+)\s*(?:m|min|minute|minutes)', re.IGNORECASE)
+    hours_pattern = re.compile(r'(\d+)\s*(?:h|hr|hour|hours)', re.IGNORECASE)
+    days_pattern = re.compile(r'(\d+)\s*(?:d|day|days)', re.IGNORECASE)
+    seconds_pattern = re.compile(r'(\d+)\s*(?:s|sec|second|seconds)', re.IGNORECASE)
+    total_seconds = 0
+    for pattern, factor in ((minutes_pattern, 60), (hours_pattern, 3600),
+                            (days_pattern, 86400), (seconds_pattern, 1)):
+        match = pattern.search(time_spec)
+        if match:
+            total_seconds += int(match.group(1)) * factor
+    if total_seconds > 0:
+        return now + timedelta(seconds=total_seconds)
+    return None
+
+def cold_parse(time_spec):
+    timespec._compile_spec.cache_clear()
+    return timespec.parse_time_specification(time_spec)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, parse in (('legacy (4 regexes)', legacy_parse),
+                        ('timespec cold', cold_parse),
+                        ('timespec memoized', timespec.parse_time_specification)):
+        elapsed = timeit.timeit(lambda: [parse(spec) for spec in SPECS], number=args.iterations)
+        per_call = elapsed / (args.iterations * len(SPECS)) * 1e6
+        print(f"{name:<20} {per_call:6.2f} us/parse")
+
+if __name__ == "__main__":
+    main()
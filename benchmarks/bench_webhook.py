@@ -0,0 +1,99 @@
+"""
+Benchmark update handling: long polling vs webhook mode, against a fake Bot API.
+
+Sends N /start updates from N different chats and measures how long it takes
+until every reply has reached the fake server, plus per-update latency. In
+polling mode the updates are served by the fake getUpdates; in webhook mode
+they are POSTed to the app's webhook route (through Flask's test client, with
+as many concurrent requests as Telegram's max_connections), each one twice to
+check that redeliveries are dropped. sendMessage on the fake server takes
+--send-latency seconds to stand in for the round trip to Telegram.
+
+Usage:
+    python benchmarks/bench_webhook.py [--updates N] [--send-latency SECONDS]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_telegram import FakeTelegramServer, command_update
+
+def report(name: str, server: FakeTelegramServer, sent_before: int, started: dict, elapsed: float) -> None:
+    latencies = sorted(
+        (sent_at - started[chat_id]) * 1000
+        for sent_at, chat_id, _ in server.sent[sent_before:]
+        if chat_id in started
+    )
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:>8} {len(latencies) / elapsed:>9.0f} {statistics.median(latencies):>11.0f} "
+          f"{p95:>8.0f} {len(server.sent) - sent_before:>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--updates', type=int, default=400)
+    parser.add_argument('--send-latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(send_latency=args.send_latency).start()
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_webhook.db")
+    os.environ["TELEGRAM_API_URL"] = server.url
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123456:benchmark"
+    os.environ["SENT_JOURNAL_PATH"] = ""
+    os.environ["BOT_MODE"] = "webhook"
+
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    # create_app() starts the bot in webhook mode in the background
+    import main
+    import bot
+    main.create_app()
+    while bot.webhook_queue is None:
+        time.sleep(0.05)
+    client = main.app.test_client()
+
+    print(f"{'mode':>8} {'updates/s':>9} {'median ms':>11} {'p95 ms':>8} {'replies':>8}")
+
+    # Long polling
+    updater = bot.setup_bot('polling')
+    chats = range(1_000_000, 1_000_000 + args.updates)
+    updates = [command_update(index + 1, chat_id) for index, chat_id in enumerate(chats)]
+    sent_before = len(server.sent)
+    started_at = time.perf_counter()
+    started = {chat_id: started_at for chat_id in chats}
+    server.push_updates(updates)
+    server.wait_for_sent(sent_before + args.updates)
+    report('polling', server, sent_before, started, time.perf_counter() - started_at)
+    updater.stop()
+
+    # Webhook
+    chats = range(2_000_000, 2_000_000 + args.updates)
+    updates = [command_update(100_000 + index, chat_id) for index, chat_id in enumerate(chats)]
+    sent_before = len(server.sent)
+    started = {}
+
+    def post(update):
+        started.setdefault(update['message']['chat']['id'], time.perf_counter())
+        response = client.post(bot.WEBHOOK_PATH, json=update)
+        assert response.status_code == 200, response.status_code
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=bot.WEBHOOK_WORKERS) as pool:
+        list(pool.map(post, updates + updates))
+    server.wait_for_sent(sent_before + args.updates)
+    elapsed = time.perf_counter() - started_at
+    # Give any duplicate that slipped through time to show up in the reply count
+    time.sleep(args.send_latency * 4)
+    report('webhook', server, sent_before, started, elapsed)
+
+    server.stop()
+
+if __name__ == "__main__":
+    main()
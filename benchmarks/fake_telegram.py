@@ -0,0 +1,156 @@
+"""
+A local fake of the Telegram Bot API for benchmarks.
+
+Serves getMe, getUpdates (long polling), sendMessage, setWebhook and
+deleteWebhook for any token on 127.0.0.1. sendMessage can be given a fixed
+latency to stand in for the round trip to Telegram, and every message sent
+is recorded with the time it arrived. Chats can be marked as having blocked
+the bot (403) and an outage can be simulated (502 for every sendMessage).
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Set, Tuple
+from urllib.parse import parse_qsl
+
+class FakeTelegramServer:
+    """Fake Bot API server running in a background thread."""
+
+    def __init__(self, send_latency: float = 0.0):
+        """
+        Initialize the server.
+
+        Args:
+            send_latency: Seconds each sendMessage call takes
+        """
+        self.send_latency = send_latency
+        self.updates: List[Dict[str, Any]] = []
+        self.sent: List[Tuple[float, int, str]] = []
+        self.blocked_chats: Set[int] = set()
+        self.outage_until = 0.0
+        self.failed_sends = 0
+        self._cond = threading.Condition()
+        self._message_id = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode() if length else ''
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    params = json.loads(body or '{}')
+                else:
+                    params = dict(parse_qsl(body))
+                method = self.path.rsplit('/', 1)[-1]
+                status, payload = server.handle(method, params)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        """Base URL to use as TELEGRAM_API_URL."""
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> 'FakeTelegramServer':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+
+    def push_updates(self, updates: List[Dict[str, Any]]) -> None:
+        """Make updates available to getUpdates."""
+        with self._cond:
+            self.updates.extend(updates)
+            self._cond.notify_all()
+
+    def wait_for_sent(self, count: int, timeout: float = 120) -> bool:
+        """Wait until at least ``count`` messages have been sent."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self.sent) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def start_outage(self, seconds: float) -> None:
+        """Fail every sendMessage with 502 Bad Gateway for the next ``seconds``."""
+        self.outage_until = time.monotonic() + seconds
+
+    def handle(self, method: str, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': {
+                'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'
+            }}
+        if method in ('setWebhook', 'deleteWebhook'):
+            return 200, {'ok': True, 'result': True}
+        if method == 'getUpdates':
+            offset = int(params.get('offset') or 0)
+            timeout = float(params.get('timeout') or 0)
+            deadline = time.monotonic() + timeout
+            with self._cond:
+                while True:
+                    pending = [u for u in self.updates if u['update_id'] >= offset][:100]
+                    remaining = deadline - time.monotonic()
+                    if pending or remaining <= 0:
+                        return 200, {'ok': True, 'result': pending}
+                    self._cond.wait(remaining)
+        if method == 'sendMessage':
+            if self.send_latency:
+                time.sleep(self.send_latency)
+            chat_id = int(params['chat_id'])
+            if time.monotonic() < self.outage_until:
+                self.failed_sends += 1
+                return 502, {'ok': False, 'error_code': 502, 'description': 'Bad Gateway'}
+            if chat_id in self.blocked_chats:
+                self.failed_sends += 1
+                return 403, {'ok': False, 'error_code': 403,
+                             'description': 'Forbidden: bot was blocked by the user'}
+            with self._cond:
+                self._message_id += 1
+                message_id = self._message_id
+                self.sent.append((time.perf_counter(), chat_id, params.get('text', '')))
+                self._cond.notify_all()
+            return 200, {'ok': True, 'result': {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': params.get('text', '')
+            }}
+        return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+
+def command_update(update_id: int, chat_id: int, text: str = '/start') -> Dict[str, Any]:
+    """Build a private-chat message update, as Telegram would send it."""
+    update = {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': text
+        }
+    }
+    if text.startswith('/'):
+        update['message']['entities'] = [
+            {'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}
+        ]
+    return update
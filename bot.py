@@ -1,24 +1,70 @@
 import os
 import logging
 import re
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime
 from telegram.ext import (
     Updater, CommandHandler, MessageHandler, Filters, 
     CallbackContext, ConversationHandler
 )
 from telegram import Update, ParseMode
-from scheduler import MessageScheduler
+from scheduler import MessageScheduler, TELEGRAM_API_URL
+from timespec import parse_time_specification
+from recurrence import parse_recurrence
+from webhook import WebhookUpdateQueue, WEBHOOK_WORKERS
+from conversations import create_conversation_store, TransientDataDict, CONVERSATION_BACKEND
+from logging_setup import configure_logging
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG, 
-                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# How updates are received: "polling" (getUpdates from a background thread) or
+# "webhook" (Telegram POSTs updates to WEBHOOK_PATH on the web app)
+BOT_MODE = os.environ.get("BOT_MODE", "polling").lower()
+
+# Public base URL of the web app, e.g. https://example.onrender.com (webhook mode)
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+
+# Route that receives webhook updates
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram/webhook")
+
+# Secret Telegram sends in X-Telegram-Bot-Api-Secret-Token; requests without it are rejected
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+
 # Bot states
 WAITING_FOR_MESSAGE, WAITING_FOR_TIME = range(2)
 
-# Initialize scheduler
-scheduler = MessageScheduler()
+# Inline scheduling command, e.g. a forwarded message followed by "!schedule 2h"
+SCHEDULE_COMMAND_RE = re.compile(r'!schedule\s+(.+)$', re.IGNORECASE)
+
+# The scheduler is created on first use (see get_scheduler), not at import,
+# so importing this module does not scan the database
+scheduler = None
+_scheduler_lock = threading.Lock()
+
+# Queue feeding webhook updates to the handler workers (webhook mode only)
+webhook_queue = None
+
+# State of the scheduling conversation and the message waiting for a time,
+# bounded in memory or kept in the database (see conversations.py)
+conversations = create_conversation_store()
+
+# Hours between purges of expired conversations (database backend)
+CONVERSATION_PURGE_INTERVAL_HOURS = 1
+
+def conversation_key(update: Update):
+    """Return the ConversationHandler key of an update: (chat_id, user_id)."""
+    return (update.effective_chat.id, update.effective_user.id)
+
+def get_scheduler() -> MessageScheduler:
+    """Return the message scheduler, creating it (and loading pending messages) on first use."""
+    global scheduler
+    if scheduler is None:
+        with _scheduler_lock:
+            if scheduler is None:
+                scheduler = MessageScheduler()
+    return scheduler
 
 def start(update: Update, context: CallbackContext) -> None:
     """Send a welcome message when the command /start is issued."""
@@ -41,15 +87,26 @@ def help_command(update: Update, context: CallbackContext) -> None:
         "/help - Show this help message\n"
         "/schedule - Start scheduling a new message\n"
         "/cancel - Cancel the current operation\n"
-        "/list - Show your scheduled messages\n\n"
+        "/list - Show your scheduled messages\n"
+        "/stop <number> - Delete a scheduled message by its number in /list\n\n"
         
         "*⏱️ Time Format Examples:*\n"
         "- `5m` or `5 minutes` - 5 minutes from now\n"
         "- `2h` or `2 hours` - 2 hours from now\n"
         "- `1d` or `1 day` - 1 day from now\n"
         "- `30s` or `30 seconds` - 30 seconds from now\n"
+        "- `3h 30m` - 3 hours and 30 minutes from now\n"
         "- `tomorrow 9am` - at 9:00 AM tomorrow\n"
-        "- `3h 30m` - 3 hours and 30 minutes from now\n\n"
+        "- `14:30` or `9:15pm` - today, or tomorrow if that time has passed\n"
+        "- `monday 8:30` - next Monday at 8:30\n"
+        "- `2026-11-01 09:00` - on a specific date\n\n"
+        
+        "*🔁 Repeating Examples:*\n"
+        "- `every 2h` - every 2 hours\n"
+        "- `daily 9am` - every day at 9:00 AM\n"
+        "- `weekdays 8:30` - Monday to Friday at 8:30\n"
+        "- `every mon, thu 18:00` - on those days at 18:00\n"
+        "- `cron 0 9 1 * *` - a cron expression\n\n"
         
         "You can also directly forward a message and include the time in the same message, like:\n"
         "Forward a message and add: `!schedule 2h`"
@@ -58,6 +115,7 @@ def help_command(update: Update, context: CallbackContext) -> None:
 
 def schedule_command(update: Update, context: CallbackContext) -> int:
     """Start the scheduling process."""
+    conversations.discard(conversation_key(update))
     update.message.reply_text(
         "Please send or forward the message you want me to schedule."
     )
@@ -66,7 +124,7 @@ def schedule_command(update: Update, context: CallbackContext) -> int:
 def list_scheduled(update: Update, context: CallbackContext) -> None:
     """List all scheduled messages for the user."""
     user_id = update.effective_user.id
-    messages = scheduler.get_user_scheduled_messages(user_id)
+    messages = get_scheduler().get_user_scheduled_messages(user_id)
     
     if not messages:
         update.message.reply_text("You don't have any scheduled messages.")
@@ -76,12 +134,35 @@ def list_scheduled(update: Update, context: CallbackContext) -> None:
     for idx, msg in enumerate(messages, 1):
         delivery_time = msg['delivery_time'].strftime("%Y-%m-%d %H:%M:%S")
         message_preview = msg['text'][:50] + "..." if len(msg['text']) > 50 else msg['text']
-        response += f"{idx}. {message_preview}\n   📅 Scheduled for: {delivery_time}\n\n"
+        response += f"{idx}. {message_preview}\n   📅 Scheduled for: {delivery_time}\n"
+        rule = parse_recurrence(msg['recurrence']) if msg.get('recurrence') else None
+        if rule:
+            response += f"   🔁 Repeats: {rule.describe()}\n"
+        response += "\n"
     
     update.message.reply_text(response, parse_mode=ParseMode.MARKDOWN)
 
+def stop_scheduled(update: Update, context: CallbackContext) -> None:
+    """Delete one of the user's scheduled messages by its number in /list."""
+    user_id = update.effective_user.id
+    if len(context.args) != 1 or not context.args[0].isdigit():
+        update.message.reply_text("Usage: /stop <number>, using the numbers shown by /list")
+        return
+    
+    messages = get_scheduler().get_user_scheduled_messages(user_id)
+    index = int(context.args[0])
+    if not 1 <= index <= len(messages):
+        update.message.reply_text("There is no scheduled message with that number. Use /list to see them.")
+        return
+    
+    if get_scheduler().cancel_message(user_id, messages[index - 1]['job_id']):
+        update.message.reply_text(f"🗑️ Deleted scheduled message {index}.")
+    else:
+        update.message.reply_text("Sorry, I couldn't delete that message. Please try again.")
+
 def cancel(update: Update, context: CallbackContext) -> int:
     """Cancel the current conversation."""
+    conversations.discard(conversation_key(update))
     update.message.reply_text("Operation cancelled.")
     return ConversationHandler.END
 
@@ -91,37 +172,38 @@ def receive_message(update: Update, context: CallbackContext) -> int:
     
     # Check if the message contains a scheduling command
     message_text = update.message.text or update.message.caption or ""
-    schedule_match = re.search(r'!schedule\s+(.+)$', message_text, re.IGNORECASE)
+    schedule_match = SCHEDULE_COMMAND_RE.search(message_text)
     
     if schedule_match:
         # Extract the time specification and process immediately
         time_spec = schedule_match.group(1).strip()
         # Remove the scheduling command from the message
-        clean_message = re.sub(r'!schedule\s+.+$', '', message_text, flags=re.IGNORECASE).strip()
+        clean_message = message_text[:schedule_match.start()].strip()
         
         # Store the message without the scheduling command
         if update.message.text:
-            context.user_data['message'] = clean_message
+            conversations.set_message(conversation_key(update), clean_message)
         elif update.message.caption:
-            context.user_data['message'] = clean_message
+            conversations.set_message(conversation_key(update), clean_message)
         else:
-            context.user_data['message'] = "Forwarded message"
+            conversations.set_message(conversation_key(update), "Forwarded message")
         
         # Process the time specification and schedule the message
         return process_time(update, context, time_spec)
     
     # Store the message for later scheduling
     if update.message.text:
-        context.user_data['message'] = update.message.text
+        message = update.message.text
     elif update.message.caption:
-        context.user_data['message'] = update.message.caption
+        message = update.message.caption
     else:
-        context.user_data['message'] = "Forwarded message"
+        message = "Forwarded message"
     
     # If it's a forwarded message, add more details
     if update.message.forward_from:
         forward_from = update.message.forward_from
-        context.user_data['message'] = f"Forwarded from {forward_from.first_name} (@{forward_from.username if forward_from.username else 'unknown'}):\n\n{context.user_data['message']}"
+        message = f"Forwarded from {forward_from.first_name} (@{forward_from.username if forward_from.username else 'unknown'}):\n\n{message}"
+    conversations.set_message(conversation_key(update), message)
     
     update.message.reply_text(
         "When should I send this message back to you? Examples:\n"
@@ -140,8 +222,12 @@ def receive_time(update: Update, context: CallbackContext) -> int:
 def process_time(update: Update, context: CallbackContext, time_spec: str) -> int:
     """Process the time specification and schedule the message."""
     try:
-        # Parse the time specification
-        delivery_time = parse_time_specification(time_spec)
+        # Parse the time specification; a repeating one is stored as a single rule
+        recurrence = parse_recurrence(time_spec)
+        if recurrence:
+            delivery_time = recurrence.next_after(datetime.now())
+        else:
+            delivery_time = parse_time_specification(time_spec)
         
         if not delivery_time:
             update.message.reply_text(
@@ -149,16 +235,22 @@ def process_time(update: Update, context: CallbackContext, time_spec: str) -> in
                 "- `5m` or `5 minutes`\n"
                 "- `2h` or `2 hours`\n"
                 "- `1d` or `1 day`\n"
-                "- `3h 30m`"
+                "- `3h 30m`\n"
+                "- `tomorrow 9am`"
             )
             return WAITING_FOR_TIME
         
-        # Get the message from user data
-        message = context.user_data.get('message', "Empty message")
+        # Get the message waiting for this time
+        message = conversations.get_message(conversation_key(update)) or "Empty message"
         
         # Schedule the message
         user_id = update.effective_user.id
-        scheduler.schedule_message(user_id, message, delivery_time)
+        if not get_scheduler().schedule_message(user_id, message, delivery_time,
+                                                recurrence=str(recurrence) if recurrence else None):
+            update.message.reply_text(
+                "Sorry, I couldn't save your message right now. Please try again."
+            )
+            return ConversationHandler.END
         
         # Format the delivery time for display
         formatted_time = delivery_time.strftime("%Y-%m-%d %H:%M:%S")
@@ -168,15 +260,17 @@ def process_time(update: Update, context: CallbackContext, time_spec: str) -> in
         readable_diff = f"{time_diff.days} days, " if time_diff.days else ""
         readable_diff += f"{hours}h {minutes}m {seconds}s"
         
+        repeats = f"🔁 Repeats: {recurrence.describe()}\n" if recurrence else ""
         update.message.reply_text(
             f"✅ Message scheduled successfully!\n\n"
             f"📅 Delivery time: {formatted_time}\n"
-            f"⏱️ That's in: {readable_diff}\n\n"
+            f"⏱️ That's in: {readable_diff}\n"
+            f"{repeats}\n"
             f"I'll send your message at the scheduled time."
         )
         
-        # Clean up user data
-        context.user_data.clear()
+        # Clean up the conversation
+        conversations.discard(conversation_key(update))
         return ConversationHandler.END
         
     except Exception as e:
@@ -186,65 +280,6 @@ def process_time(update: Update, context: CallbackContext, time_spec: str) -> in
         )
         return ConversationHandler.END
 
-def parse_time_specification(time_spec: str) -> datetime | None:
-    """Parse the time specification into a datetime object."""
-    now = datetime.now()
-    
-    # Simple regex patterns for common time formats
-    minutes_pattern = re.compile(r'(\d+)\s*(?:m|min|minute|minutes)', re.IGNORECASE)
-    hours_pattern = re.compile(r'(\d+)\s*(?:h|hr|hour|hours)', re.IGNORECASE)
-    days_pattern = re.compile(r'(\d+)\s*(?:d|day|days)', re.IGNORECASE)
-    seconds_pattern = re.compile(r'(\d+)\s*(?:s|sec|second|seconds)', re.IGNORECASE)
-    
-    # Check for combined formats like "1h 30m"
-    total_seconds = 0
-    
-    # Extract minutes
-    minutes_match = minutes_pattern.search(time_spec)
-    if minutes_match:
-        minutes = int(minutes_match.group(1))
-        total_seconds += minutes * 60
-    
-    # Extract hours
-    hours_match = hours_pattern.search(time_spec)
-    if hours_match:
-        hours = int(hours_match.group(1))
-        total_seconds += hours * 3600
-    
-    # Extract days
-    days_match = days_pattern.search(time_spec)
-    if days_match:
-        days = int(days_match.group(1))
-        total_seconds += days * 86400
-    
-    # Extract seconds
-    seconds_match = seconds_pattern.search(time_spec)
-    if seconds_match:
-        seconds = int(seconds_match.group(1))
-        total_seconds += seconds
-    
-    # If we found any time components, calculate the future time
-    if total_seconds > 0:
-        return now + timedelta(seconds=total_seconds)
-    
-    # Short formats like "5m" or "2h"
-    short_format = re.match(r'^\s*(\d+)([mhds])\s*$', time_spec, re.IGNORECASE)
-    if short_format:
-        value = int(short_format.group(1))
-        unit = short_format.group(2).lower()
-        
-        if unit == 'm':
-            return now + timedelta(minutes=value)
-        elif unit == 'h':
-            return now + timedelta(hours=value)
-        elif unit == 'd':
-            return now + timedelta(days=value)
-        elif unit == 's':
-            return now + timedelta(seconds=value)
-    
-    # If no recognized format, return None
-    return None
-
 def error_handler(update: Update, context: CallbackContext) -> None:
     """Log the error and send a message to the user."""
     logger.error(f"Update {update} caused error {context.error}")
@@ -256,24 +291,44 @@ def error_handler(update: Update, context: CallbackContext) -> None:
     except Exception as e:
         logger.error(f"Error in error handler: {e}")
 
-def setup_bot():
-    """Set up the bot with the necessary handlers."""
+def setup_bot(mode: str = BOT_MODE):
+    """
+    Set up the bot with the necessary handlers.
+    
+    Args:
+        mode: "polling" to start long polling, or "webhook" to register the
+            webhook and start the workers that handle updates posted to it
+    """
+    global webhook_queue
+    
     # Get the token from environment variable
     token = os.environ.get("TELEGRAM_BOT_TOKEN")
     if not token:
         logger.error("No TELEGRAM_BOT_TOKEN found in environment variables!")
         return
     
-    # Create the updater and pass it the bot's token
-    updater = Updater(token)
+    # The handlers need the scheduler; load pending messages before accepting updates
+    get_scheduler()
+    
+    # Create the updater and pass it the bot's token; the connection pool must
+    # cover every thread that replies to users
+    updater = Updater(
+        token,
+        base_url=f"{TELEGRAM_API_URL.rstrip('/')}/bot",
+        request_kwargs={'con_pool_size': WEBHOOK_WORKERS + 4}
+    )
     
-    # Get the dispatcher to register handlers
+    # Get the dispatcher to register handlers; conversation state lives in
+    # the conversation store, so user_data and chat_data are not kept
     dispatcher = updater.dispatcher
+    dispatcher.user_data = TransientDataDict()
+    dispatcher.chat_data = TransientDataDict()
     
     # Add command handlers first (they take precedence)
     dispatcher.add_handler(CommandHandler('start', start))
     dispatcher.add_handler(CommandHandler('help', help_command))
     dispatcher.add_handler(CommandHandler('list', list_scheduled))
+    dispatcher.add_handler(CommandHandler('stop', stop_scheduled))
     
     # Add conversation handler for scheduling messages
     conv_handler = ConversationHandler(
@@ -291,6 +346,15 @@ def setup_bot():
         },
         fallbacks=[CommandHandler('cancel', cancel)]
     )
+    conv_handler.conversations = conversations
+    if CONVERSATION_BACKEND == 'database':
+        get_scheduler().scheduler.add_job(
+            conversations.purge_expired,
+            'interval',
+            hours=CONVERSATION_PURGE_INTERVAL_HOURS,
+            id='conversation_purge_job',
+            replace_existing=True
+        )
     
     dispatcher.add_handler(conv_handler)
     
@@ -298,8 +362,21 @@ def setup_bot():
     dispatcher.add_error_handler(error_handler)
     
     # Start the Bot
-    updater.start_polling()
-    logger.info("Bot started!")
+    if mode == 'webhook':
+        webhook_queue = WebhookUpdateQueue(dispatcher)
+        webhook_queue.start()
+        if WEBHOOK_URL:
+            updater.bot.set_webhook(
+                url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+                max_connections=WEBHOOK_WORKERS,
+                api_kwargs={'secret_token': WEBHOOK_SECRET} if WEBHOOK_SECRET else None
+            )
+        else:
+            logger.warning("WEBHOOK_URL is not set; assuming the webhook is registered elsewhere")
+        logger.info(f"Bot started in webhook mode on {WEBHOOK_PATH}")
+    else:
+        updater.start_polling()
+        logger.info("Bot started!")
     
     # Don't call idle() when running in a thread
     # Just return the updater so it keeps running
@@ -0,0 +1,213 @@
+"""
+Streaming JSON Lines ingestion for the bulk scheduling API.
+
+Each line of the request body is one message:
+
+    {"user_id": 123, "text": "Hello", "delivery_time": "2026-11-01T09:00:00"}
+    {"user_id": 123, "text": "Stand-up", "time": "weekdays 9:30"}
+    {"user_id": 456, "text": "Hi", "time": "2h", "id": "campaign-7-456"}
+
+``delivery_time`` is an ISO 8601 time (local time unless it has an offset);
+``time`` accepts anything the bot accepts, including recurring rules. The
+optional ``id`` makes retries idempotent: a row whose id was already loaded
+is reported as a duplicate instead of being scheduled twice.
+
+The body is read one line at a time and rows are stored in chunks of
+BULK_CHUNK_SIZE, so memory use does not depend on the size of the upload.
+One result line is produced per input line, in input order, as each chunk is
+committed, followed by a summary line.
+"""
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from recurrence import parse_recurrence
+from timespec import parse_time_specification
+from logging_setup import configure_logging
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Bearer token required by the bulk API; the API is disabled when unset
+BULK_API_TOKEN = os.environ.get("BULK_API_TOKEN", "")
+
+# Rows inserted and committed per chunk
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", "1000"))
+
+# Longest accepted line in bytes
+BULK_MAX_LINE_BYTES = int(os.environ.get("BULK_MAX_LINE_BYTES", "16384"))
+
+# Telegram's limit on message length
+MAX_TEXT_LENGTH = 4096
+
+# Longest client-supplied id (job_id is limited to 100 characters)
+MAX_ID_LENGTH = 90
+
+def read_lines(stream, max_bytes: int = BULK_MAX_LINE_BYTES) -> Iterator[Optional[bytes]]:
+    """
+    Yield the lines of a binary stream one at a time.
+
+    Lines longer than max_bytes are skipped and yielded as None so the caller
+    can report them.
+
+    Args:
+        stream: A file-like object with readline()
+        max_bytes: Maximum line length
+    """
+    while True:
+        line = stream.readline(max_bytes + 1)
+        if not line:
+            return
+        if len(line) > max_bytes and not line.endswith(b'\n'):
+            # Discard the rest of the oversized line
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_bytes + 1)
+            yield None
+            continue
+        yield line
+
+def parse_row(line: bytes, now: datetime) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Validate one JSON Lines row and build its message data.
+
+    Args:
+        line: The raw line
+        now: The current time
+
+    Returns:
+        (message_data, None) for a valid row, or (None, error) otherwise
+    """
+    try:
+        item = json.loads(line)
+    except ValueError as e:
+        return None, f"invalid JSON: {e}"
+    if not isinstance(item, dict):
+        return None, "row must be a JSON object"
+
+    user_id = item.get('user_id')
+    if not isinstance(user_id, int) or isinstance(user_id, bool) or user_id <= 0:
+        return None, "user_id must be a positive integer"
+    text = item.get('text')
+    if not isinstance(text, str) or not text.strip():
+        return None, "text must be a non-empty string"
+    if len(text) > MAX_TEXT_LENGTH:
+        return None, f"text is longer than {MAX_TEXT_LENGTH} characters"
+
+    recurrence = None
+    if 'delivery_time' in item:
+        try:
+            delivery_time = datetime.fromisoformat(str(item['delivery_time']))
+            if delivery_time.tzinfo is not None:
+                # Stored times are naive local time
+                delivery_time = delivery_time.astimezone().replace(tzinfo=None)
+        except (ValueError, OverflowError):
+            return None, "delivery_time must be an ISO 8601 time"
+    elif isinstance(item.get('time'), str):
+        # A failure here must become this row's error, not end the streamed response
+        try:
+            recurrence = parse_recurrence(item['time'])
+            if recurrence:
+                delivery_time = recurrence.next_after(now, now)
+            else:
+                delivery_time = parse_time_specification(item['time'], now=now)
+        except (ValueError, OverflowError) as e:
+            return None, f"time has no usable delivery time: {e}"
+        if delivery_time is None:
+            return None, "time is not a time specification the bot understands"
+    else:
+        return None, "delivery_time or time is required"
+    if delivery_time <= now:
+        return None, "delivery time is not in the future"
+
+    client_id = item.get('id')
+    if client_id is not None:
+        if not isinstance(client_id, str) or not client_id or len(client_id) > MAX_ID_LENGTH:
+            return None, f"id must be a non-empty string of at most {MAX_ID_LENGTH} characters"
+        job_id = f"bulk_{client_id}"
+    else:
+        job_id = f"msg_{user_id}_{delivery_time.timestamp()}"
+
+    return {
+        'user_id': user_id,
+        'text': text,
+        'scheduled_time': now,
+        'delivery_time': delivery_time,
+        'job_id': job_id,
+        'recurrence': str(recurrence) if recurrence else None
+    }, None
+
+def bulk_schedule(lines: Iterable[Optional[bytes]], scheduler,
+                  chunk_size: int = BULK_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Parse, store and schedule rows in chunks, yielding a result per line.
+
+    Args:
+        lines: Raw lines, with None for lines that were too long
+        scheduler: The MessageScheduler that stores and schedules the rows
+        chunk_size: Rows per insert and commit
+
+    Yields:
+        One result dict per input line (line number, status, and job_id or
+        error), then a final {"summary": ...} dict
+    """
+    counts = {'received': 0, 'scheduled': 0, 'duplicate': 0, 'error': 0}
+    # (line number, message data or None, error or None) for the current chunk
+    pending: List[Tuple[int, Optional[Dict[str, Any]], Optional[str]]] = []
+    # Rows repeating a job_id earlier in the same chunk are not inserted
+    repeated: Dict[int, str] = {}
+    valid_rows = 0
+
+    def flush() -> Iterator[Dict[str, Any]]:
+        rows = [row for _, row, _ in pending if row is not None]
+        inserted, store_error = set(), None
+        if rows:
+            try:
+                inserted = scheduler.schedule_messages_bulk(rows)
+            except Exception as e:
+                logger.error(f"Error storing bulk chunk of {len(rows)} rows: {e}", exc_info=True)
+                store_error = "could not store the row, retry it"
+        for number, row, error in pending:
+            if number in repeated:
+                result = {'line': number, 'status': 'duplicate', 'job_id': repeated[number]}
+            elif row is None:
+                result = {'line': number, 'status': 'error', 'error': error}
+            elif store_error:
+                result = {'line': number, 'status': 'error', 'error': store_error}
+            elif row['job_id'] in inserted:
+                result = {'line': number, 'status': 'scheduled', 'job_id': row['job_id']}
+            else:
+                result = {'line': number, 'status': 'duplicate', 'job_id': row['job_id']}
+            counts[result['status']] += 1
+            yield result
+        pending.clear()
+        repeated.clear()
+
+    now = datetime.now()
+    seen_job_ids = set()
+    for number, line in enumerate(lines, 1):
+        if line is not None and not line.strip():
+            continue
+        counts['received'] += 1
+        if line is None:
+            row, error = None, f"line is longer than {BULK_MAX_LINE_BYTES} bytes"
+        else:
+            row, error = parse_row(line, now)
+        if row is not None:
+            if row['job_id'] in seen_job_ids:
+                repeated[number] = row['job_id']
+                row = None
+            else:
+                seen_job_ids.add(row['job_id'])
+                valid_rows += 1
+        pending.append((number, row, error))
+        if valid_rows >= chunk_size or len(pending) >= chunk_size * 2:
+            yield from flush()
+            seen_job_ids.clear()
+            valid_rows = 0
+            now = datetime.now()
+    yield from flush()
+
+    logger.info(f"Bulk load finished: {counts}")
+    yield {'summary': counts}
@@ -0,0 +1,154 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from logging_setup import configure_logging
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Maximum number of users whose message lists are cached
+CACHE_MAX_USERS = int(os.environ.get("CACHE_MAX_USERS", "10000"))
+
+# Maximum number of messages held across all cached lists
+CACHE_MAX_MESSAGES = int(os.environ.get("CACHE_MAX_MESSAGES", "100000"))
+
+# Maximum total length of the message texts held across all cached lists
+CACHE_MAX_CHARS = int(os.environ.get("CACHE_MAX_CHARS", "10000000"))
+
+# Seconds a cached list stays valid
+CACHE_TTL_SECONDS = float(os.environ.get("CACHE_TTL_SECONDS", "300"))
+
+class UserMessageCache:
+    """
+    LRU cache of each user's pending message list, with a TTL and a memory cap.
+
+    Entries are evicted least-recently-used first when the number of users,
+    the total number of cached messages or the total length of their texts
+    goes over its limit, and are treated as missing once older than the TTL.
+    The scheduler invalidates a user's entry whenever one of their messages is
+    scheduled or sent.
+
+    A list loaded from the database while the user's messages change must
+    not be cached: the reader takes generation() before loading and passes
+    it to put(), which drops the list if the user was invalidated since.
+    """
+
+    def __init__(self, max_users: int = CACHE_MAX_USERS, max_messages: int = CACHE_MAX_MESSAGES,
+                 ttl: float = CACHE_TTL_SECONDS, max_chars: int = CACHE_MAX_CHARS):
+        """
+        Initialize the cache.
+
+        Args:
+            max_users: Maximum number of cached users
+            max_messages: Maximum number of messages across all cached lists
+            ttl: Seconds before an entry expires
+            max_chars: Maximum total length of the message texts across all cached lists
+        """
+        self.max_users = max_users
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.ttl = ttl
+        # user_id -> (expires_at, messages, total text length)
+        self._entries: "OrderedDict[int, Tuple[float, List[Dict[str, Any]], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._message_count = 0
+        self._char_count = 0
+        # Bumped by every invalidation; a user's generation is the value at their last one
+        self._stamp = 0
+        # user_id -> stamp of their last invalidation, oldest first, kept for max_users users;
+        # users dropped from it count as invalidated at _forgotten_stamp
+        self._invalidated: "OrderedDict[int, int]" = OrderedDict()
+        self._forgotten_stamp = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Return a user's cached message list, or None on a miss.
+
+        Args:
+            user_id: The Telegram user ID
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(user_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self) -> int:
+        """Return the token to pass to put() for a list about to be loaded."""
+        with self._lock:
+            return self._stamp
+
+    def put(self, user_id: int, messages: List[Dict[str, Any]], generation: Optional[int] = None) -> None:
+        """
+        Cache a user's message list, evicting older entries if over a limit.
+
+        Args:
+            user_id: The Telegram user ID
+            messages: The user's pending messages
+            generation: generation() taken before the list was loaded; the list
+                is not cached if the user was invalidated since
+        """
+        chars = sum(len(message.get('text') or "") for message in messages)
+        if len(messages) > self.max_messages or chars > self.max_chars:
+            return
+        with self._lock:
+            if generation is not None and self._invalidated.get(user_id, self._forgotten_stamp) > generation:
+                # Loaded before a change to the user's messages; caching it would hide the change
+                return
+            self._remove(user_id)
+            self._entries[user_id] = (time.monotonic() + self.ttl, messages, chars)
+            self._message_count += len(messages)
+            self._char_count += chars
+            while (len(self._entries) > self.max_users
+                   or self._message_count > self.max_messages
+                   or self._char_count > self.max_chars):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Drop a user's cached list and bump their generation.
+
+        Args:
+            user_id: The Telegram user ID
+        """
+        with self._lock:
+            self._remove(user_id)
+            self._stamp += 1
+            self._invalidated[user_id] = self._stamp
+            self._invalidated.move_to_end(user_id)
+            if len(self._invalidated) > self.max_users:
+                _, self._forgotten_stamp = self._invalidated.popitem(last=False)
+
+    def _remove(self, user_id: int) -> None:
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._message_count -= len(entry[1])
+            self._char_count -= entry[2]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counts, the hit rate and the current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'users': len(self._entries),
+                'messages': self._message_count,
+                'message_chars': self._char_count
+            }
@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from delivery import format_reminder
+from logging_setup import configure_logging
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Seconds to hold a due message for other messages to the same chat; 0 disables coalescing
+COALESCE_WINDOW = float(os.environ.get("COALESCE_WINDOW", "0"))
+
+# Telegram's limit on the length of one message
+MAX_MESSAGE_LENGTH = 4096
+
+# Placed between the texts of a combined message
+SEPARATOR = "\n\n➖➖➖\n\n"
+
+class DeliveryCoalescer:
+    """
+    Coalescing stage in front of the delivery engine.
+
+    The first due message for a chat opens a group that stays open for
+    ``window`` seconds; every message for that chat that comes due meanwhile
+    joins it. When the window closes the group is handed to the delivery
+    engine as one combined message (or several, if the texts do not fit in
+    one Telegram message), so a burst of reminders costs one send, one
+    per-chat rate-limit token and one batched "sent" update instead of one of
+    each per reminder.
+
+    A combined message is submitted under a group ID; the scheduler calls
+    take_group() once it is sent to get back the job IDs it stands for.
+    """
+
+    def __init__(self, submit: Callable[[int, str, str], None], window: float = COALESCE_WINDOW,
+                 max_length: int = MAX_MESSAGE_LENGTH):
+        """
+        Initialize the coalescing stage.
+
+        Args:
+            submit: The delivery engine's submit(user_id, text, job_id)
+            window: Seconds a group stays open after its first message
+            max_length: Longest message, including the reminder header
+        """
+        self.submit_delivery = submit
+        self.window = window
+        self.max_length = max_length
+        # user_id -> (closes_at, [(job_id, text), ...]); insertion order is closing order
+        self._open: Dict[int, Tuple[float, List[Tuple[str, str]]]] = {}
+        self._groups: Dict[str, List[str]] = {}
+        self._buffered = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.coalesced_count = 0
+
+    def start(self) -> None:
+        """Start the thread that closes groups."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='delivery-coalescer', daemon=True)
+        self._thread.start()
+        logger.info(f"Delivery coalescing started (window {self.window}s)")
+
+    def stop(self) -> None:
+        """Stop the thread and hand every open group to the delivery engine."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._close_groups(float('inf'))
+
+    def submit(self, user_id: int, text: str, job_id: str) -> None:
+        """
+        Add a due message to its chat's open group, opening one if needed.
+
+        Args:
+            user_id: The Telegram user ID of the recipient
+            text: The message text
+            job_id: The ID of the scheduled job
+        """
+        with self._cond:
+            group = self._open.get(user_id)
+            if group is None:
+                self._open[user_id] = (time.monotonic() + self.window, [(job_id, text)])
+                if len(self._open) == 1:
+                    self._cond.notify()
+            else:
+                group[1].append((job_id, text))
+            self._buffered += 1
+
+    def queued(self) -> int:
+        """Return the number of messages held in open groups."""
+        return self._buffered
+
+    def take_group(self, job_id: str) -> List[str]:
+        """
+        Return the job IDs a submitted message stands for, forgetting the group.
+
+        Args:
+            job_id: The ID the delivery engine reported as sent (or failed)
+
+        Returns:
+            The member job IDs of a combined message, or [job_id] for a single one
+        """
+        with self._cond:
+            return self._groups.pop(job_id, None) or [job_id]
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                if self._open:
+                    wait = next(iter(self._open.values()))[0] - time.monotonic()
+                else:
+                    wait = 1.0
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+            self._close_groups(time.monotonic())
+
+    def _close_groups(self, now: float) -> None:
+        """Hand every group whose window has closed to the delivery engine."""
+        closed = []
+        with self._cond:
+            for user_id, (closes_at, messages) in list(self._open.items()):
+                if closes_at > now:
+                    break
+                del self._open[user_id]
+                self._buffered -= len(messages)
+                closed.append((user_id, messages))
+        for user_id, messages in closed:
+            for job_id, text, members in self._pack(messages):
+                if len(members) > 1:
+                    with self._cond:
+                        self._groups[job_id] = members
+                    self.coalesced_count += len(members)
+                    logger.debug(f"Coalesced {len(members)} messages for user {user_id} into {job_id}")
+                self.submit_delivery(user_id, text, job_id)
+
+    def _pack(self, messages: List[Tuple[str, str]]) -> List[Tuple[str, str, List[str]]]:
+        """
+        Combine a chat's messages, in order, into as few messages as fit the length limit.
+
+        Returns:
+            (job_id, text, member job_ids) for each message to send
+        """
+        header = len(format_reminder(""))
+        packed = []
+        members: List[str] = []
+        texts: List[str] = []
+        length = header
+        for job_id, text in messages:
+            if texts and length + len(SEPARATOR) + len(text) > self.max_length:
+                packed.append((members, texts))
+                members, texts, length = [], [], header
+            length += len(text) + (len(SEPARATOR) if texts else 0)
+            members.append(job_id)
+            texts.append(text)
+        packed.append((members, texts))
+        return [
+            (members[0] if len(members) == 1 else f"group_{members[0]}", SEPARATOR.join(texts), members)
+            for members, texts in packed
+        ]
@@ -0,0 +1,353 @@
+import abc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from logging_setup import configure_logging
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Where the scheduling conversation is kept: "memory" or "database" (survives restarts)
+CONVERSATION_BACKEND = os.environ.get("CONVERSATION_BACKEND", "memory").lower()
+
+# Seconds an idle conversation is kept before it is dropped
+CONVERSATION_TTL_SECONDS = float(os.environ.get("CONVERSATION_TTL_SECONDS", "3600"))
+
+# Memory backend: maximum number of open conversations ...
+CONVERSATION_MAX_USERS = int(os.environ.get("CONVERSATION_MAX_USERS", "10000"))
+
+# ... and of characters of stored message text across all of them
+CONVERSATION_MAX_CHARS = int(os.environ.get("CONVERSATION_MAX_CHARS", "5000000"))
+
+# ConversationHandler key: (chat_id, user_id)
+ConversationKey = Tuple[int, int]
+
+class TransientDataDict(defaultdict):
+    """
+    Stand-in for the dispatcher's user_data and chat_data.
+
+    python-telegram-bot creates an entry in both for every user and chat that
+    sends an update and never removes it. The handlers keep their state in a
+    ConversationStore instead, so lookups here return a fresh dict that is not
+    retained.
+    """
+
+    def __init__(self):
+        super().__init__(dict)
+
+    def __missing__(self, key):
+        return {}
+
+class ConversationStore(MutableMapping):
+    """
+    State of the scheduling conversation, keyed like ConversationHandler's.
+
+    Used as the ConversationHandler's ``conversations`` mapping (conversation
+    key -> state), and also holds the message a user is scheduling while the
+    bot waits for the time, in place of ``context.user_data``. An entry whose
+    state is None has a message but no conversation state.
+    """
+
+    @abc.abstractmethod
+    def get_message(self, key: ConversationKey) -> Optional[str]:
+        """Return the message stored for a conversation, or None."""
+
+    @abc.abstractmethod
+    def set_message(self, key: ConversationKey, message: str) -> None:
+        """Store the message for a conversation, keeping its state."""
+
+    def discard(self, key: ConversationKey) -> None:
+        """Forget a conversation (state and message) if it exists."""
+        try:
+            del self[key]
+        except KeyError:
+            pass
+
+    def purge_expired(self) -> int:
+        """Drop conversations idle for longer than the TTL; return how many were dropped."""
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the store's size and eviction counts."""
+        return {}
+
+class MemoryConversationStore(ConversationStore):
+    """
+    In-memory conversation store with an idle TTL and a memory cap.
+
+    Entries are kept in least-recently-updated order. Every write drops
+    entries idle for longer than the TTL from the front, then evicts the
+    least recently updated ones while the number of conversations or the
+    total length of stored messages is over its limit, so memory stays
+    bounded however many users start the flow and walk away.
+    """
+
+    def __init__(self, max_users: int = CONVERSATION_MAX_USERS, max_chars: int = CONVERSATION_MAX_CHARS,
+                 ttl: float = CONVERSATION_TTL_SECONDS):
+        """
+        Initialize the store.
+
+        Args:
+            max_users: Maximum number of conversations
+            max_chars: Maximum total length of stored messages
+            ttl: Seconds an idle conversation is kept
+        """
+        self.max_users = max_users
+        self.max_chars = max_chars
+        self.ttl = ttl
+        # key -> [expires_at, state, message]
+        self._entries: "OrderedDict[ConversationKey, List[Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._chars = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _live_entry(self, key: ConversationKey) -> Optional[List[Any]]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self._remove(key)
+            self.expired += 1
+            return None
+        return entry
+
+    def _touch(self, key: ConversationKey) -> List[Any]:
+        """Return the entry for key (creating it), refreshed and moved to the back."""
+        entry = self._live_entry(key)
+        if entry is None:
+            entry = self._entries[key] = [0.0, None, None]
+        else:
+            self._entries.move_to_end(key)
+        entry[0] = time.monotonic() + self.ttl
+        return entry
+
+    def _remove(self, key: ConversationKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[2]:
+            self._chars -= len(entry[2])
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._entries:
+            oldest, entry = next(iter(self._entries.items()))
+            if entry[0] < now:
+                self.expired += 1
+            elif len(self._entries) > self.max_users or self._chars > self.max_chars:
+                self.evictions += 1
+            else:
+                break
+            self._remove(oldest)
+
+    def __getitem__(self, key: ConversationKey):
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None or entry[1] is None:
+                raise KeyError(key)
+            return entry[1]
+
+    def __setitem__(self, key: ConversationKey, state) -> None:
+        with self._lock:
+            self._touch(key)[1] = state
+            self._evict()
+
+    def __delitem__(self, key: ConversationKey) -> None:
+        with self._lock:
+            if key not in self._entries:
+                raise KeyError(key)
+            self._remove(key)
+
+    def __iter__(self) -> Iterator[ConversationKey]:
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry[1] is not None]
+        return iter(keys)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_message(self, key: ConversationKey) -> Optional[str]:
+        with self._lock:
+            entry = self._live_entry(key)
+            return entry[2] if entry is not None else None
+
+    def set_message(self, key: ConversationKey, message: str) -> None:
+        with self._lock:
+            entry = self._touch(key)
+            if entry[2]:
+                self._chars -= len(entry[2])
+            entry[2] = message
+            self._chars += len(message)
+            self._evict()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            before = len(self._entries)
+            now = time.monotonic()
+            for key in [key for key, entry in self._entries.items() if entry[0] < now]:
+                self._remove(key)
+            dropped = before - len(self._entries)
+            self.expired += dropped
+            return dropped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'conversations': len(self._entries),
+                'message_chars': self._chars,
+                'expired': self.expired,
+                'evictions': self.evictions
+            }
+
+class DatabaseConversationStore(ConversationStore):
+    """
+    Conversation store backed by the conversation_states table.
+
+    Conversations survive restarts and are shared by every process; nothing
+    is held in memory. Rows idle for longer than the TTL are ignored on read
+    and deleted by purge_expired(), which the bot runs periodically.
+    """
+
+    def __init__(self, ttl: float = CONVERSATION_TTL_SECONDS):
+        """
+        Initialize the store.
+
+        Args:
+            ttl: Seconds an idle conversation is kept
+        """
+        self.ttl = ttl
+
+    def _cutoff(self) -> datetime:
+        return datetime.now() - timedelta(seconds=self.ttl)
+
+    def _row(self, key: ConversationKey):
+        # Import locally to avoid circular imports
+        from models import db, ConversationState
+
+        row = db.session.get(ConversationState, key)
+        if row is not None and row.updated_at < self._cutoff():
+            return None
+        return row
+
+    def _update(self, key: ConversationKey, **values) -> None:
+        # Import locally to avoid circular imports
+        from database import app
+        from models import db, ConversationState
+
+        with app.app_context():
+            row = db.session.get(ConversationState, key)
+            if row is None:
+                row = ConversationState(chat_id=key[0], user_id=key[1])
+                db.session.add(row)
+            elif row.updated_at < self._cutoff():
+                # Expired but not purged yet: start over
+                row.state = row.message = None
+            for name, value in values.items():
+                setattr(row, name, value)
+            row.updated_at = datetime.now()
+            db.session.commit()
+
+    def __getitem__(self, key: ConversationKey):
+        # Import locally to avoid circular imports
+        from database import app
+
+        with app.app_context():
+            row = self._row(key)
+            if row is None or row.state is None:
+                raise KeyError(key)
+            return row.state
+
+    def __setitem__(self, key: ConversationKey, state) -> None:
+        if not isinstance(state, int):
+            # ConversationHandler stores (old_state, Promise) while a run_async
+            # handler is running; the flow's handlers are all synchronous
+            raise TypeError(f"Only integer states can be stored, got {state!r}")
+        self._update(key, state=state)
+
+    def __delitem__(self, key: ConversationKey) -> None:
+        # Import locally to avoid circular imports
+        from database import app
+        from models import db, ConversationState
+
+        with app.app_context():
+            deleted = db.session.execute(
+                db.delete(ConversationState)
+                .where(ConversationState.chat_id == key[0], ConversationState.user_id == key[1])
+            ).rowcount
+            db.session.commit()
+        if not deleted:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[ConversationKey]:
+        # Import locally to avoid circular imports
+        from database import app
+        from models import db, ConversationState
+
+        with app.app_context():
+            keys = db.session.execute(
+                db.select(ConversationState.chat_id, ConversationState.user_id)
+                .where(ConversationState.state.is_not(None), ConversationState.updated_at >= self._cutoff())
+            ).all()
+        return iter([tuple(key) for key in keys])
+
+    def __len__(self) -> int:
+        # Import locally to avoid circular imports
+        from database import app
+        from models import db, ConversationState
+
+        with app.app_context():
+            return db.session.execute(
+                db.select(db.func.count()).select_from(ConversationState)
+                .where(ConversationState.updated_at >= self._cutoff())
+            ).scalar()
+
+    def get_message(self, key: ConversationKey) -> Optional[str]:
+        # Import locally to avoid circular imports
+        from database import app
+
+        with app.app_context():
+            row = self._row(key)
+            return row.message if row is not None else None
+
+    def set_message(self, key: ConversationKey, message: str) -> None:
+        self._update(key, message=message)
+
+    def purge_expired(self) -> int:
+        # Import locally to avoid circular imports
+        from database import app
+        from models import db, ConversationState
+
+        try:
+            with app.app_context():
+                deleted = db.session.execute(
+                    db.delete(ConversationState).where(ConversationState.updated_at < self._cutoff())
+                ).rowcount
+                db.session.commit()
+        except Exception as e:
+            logger.error(f"Error purging expired conversations: {e}", exc_info=True)
+            return 0
+        if deleted:
+            logger.info(f"Purged {deleted} expired conversations")
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        # Counting rows would cost a query on every /bot-status poll
+        return {'backend': 'database'}
+
+def create_conversation_store(backend: str = CONVERSATION_BACKEND) -> ConversationStore:
+    """
+    Create the conversation store selected by CONVERSATION_BACKEND.
+
+    Args:
+        backend: "memory" or "database"
+    """
+    if backend == 'database':
+        logger.info("Keeping conversations in the database")
+        return DatabaseConversationStore()
+    if backend != 'memory':
+        logger.warning(f"Unknown CONVERSATION_BACKEND {backend!r}, keeping conversations in memory")
+    return MemoryConversationStore()
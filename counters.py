@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+from logging_setup import configure_logging
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+class MessageCounters:
+    """
+    Pending, sent and dead-lettered message counts maintained in memory.
+
+    The scheduler adjusts the counts as messages are scheduled, sent, given up
+    on and cleaned up, and periodically overwrites them with the database's numbers
+    to correct any drift. Reading them is O(1).
+    """
+
+    def __init__(self):
+        """Initialize the counters as not yet reconciled."""
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.sent = 0
+        self.dead_letters = 0
+        # Failed sends rescheduled by this process; not reconciled
+        self.retries = 0
+        self.reconciled_at: Optional[float] = None
+
+    def scheduled(self, count: int = 1) -> None:
+        """Record newly scheduled messages."""
+        with self._lock:
+            self.pending += count
+
+    def delivered(self, count: int = 1) -> None:
+        """Record messages moving from pending to sent."""
+        with self._lock:
+            self.pending -= count
+            self.sent += count
+
+    def retried(self, count: int = 1) -> None:
+        """Record failed sends rescheduled for another attempt."""
+        with self._lock:
+            self.retries += count
+
+    def dead_lettered(self, count: int = 1, pending: bool = True) -> None:
+        """Record messages moved to the dead-letter table (pending=False if the row stays pending)."""
+        with self._lock:
+            if pending:
+                self.pending -= count
+            self.dead_letters += count
+
+    def deleted(self, pending: int = 0, sent: int = 0) -> None:
+        """Record pending and sent messages removed from the database."""
+        with self._lock:
+            self.pending -= pending
+            self.sent -= sent
+
+    def reconcile(self, pending: int, sent: int, dead_letters: int) -> None:
+        """Replace the counts with authoritative values from the database."""
+        with self._lock:
+            drift = (self.pending - pending, self.sent - sent)
+            self.pending = pending
+            self.sent = sent
+            self.dead_letters = dead_letters
+            self.reconciled_at = time.time()
+        if drift != (0, 0):
+            logger.debug(f"Reconciled message counters (drift pending={drift[0]}, sent={drift[1]})")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return the current counts and how stale they may be.
+
+        Returns:
+            Dictionary with pending_messages, sent_messages, dead_letters,
+            delivery_retries and seconds_since_reconcile (None if never reconciled)
+        """
+        with self._lock:
+            pending, sent, reconciled_at = self.pending, self.sent, self.reconciled_at
+            dead_letters, retries = self.dead_letters, self.retries
+        return {
+            'pending_messages': pending,
+            'sent_messages': sent,
+            'dead_letters': dead_letters,
+            'delivery_retries': retries,
+            'seconds_since_reconcile': round(time.time() - reconciled_at, 1) if reconciled_at else None
+        }
@@ -1,11 +1,13 @@
 import os
 import logging
+import threading
 from flask import Flask
 from models import db
+from migrations import run_migrations
+from logging_setup import configure_logging
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG, 
-                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
@@ -25,10 +27,28 @@ if database_url:
 else:
     logger.error("DATABASE_URL environment variable not set")
 
-# Initialize the database
+# Initialize the database; the schema is created on first use, not at import
 db.init_app(app)
 
-# Create all tables
-with app.app_context():
-    db.create_all()
-    logger.info("Database tables created")
\ No newline at end of file
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def init_database() -> None:
+    """
+    Create all tables and apply schema migrations to existing ones.
+
+    Runs once per process; later calls return immediately. Called by the
+    startup thread and by MessageScheduler before it touches the database,
+    so importing this module stays cheap.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        with app.app_context():
+            db.create_all()
+            logger.info("Database tables created")
+            run_migrations(db.engine)
+        _schema_ready = True
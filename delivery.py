@@ -0,0 +1,249 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from telegram.error import RetryAfter
+from logging_setup import configure_logging
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Telegram allows roughly 30 messages per second overall and 1 per second per chat
+GLOBAL_RATE = float(os.environ.get("TELEGRAM_GLOBAL_RATE", "30"))
+GLOBAL_BURST = float(os.environ.get("TELEGRAM_GLOBAL_BURST", str(GLOBAL_RATE)))
+CHAT_RATE = float(os.environ.get("TELEGRAM_CHAT_RATE", "1"))
+CHAT_BURST = float(os.environ.get("TELEGRAM_CHAT_BURST", "1"))
+
+# Per-chat buckets that have been idle this long are full again and can be dropped
+CHAT_BUCKET_IDLE_SECONDS = 60
+
+def format_reminder(text: str) -> str:
+    """Format the text of a scheduled message for delivery."""
+    return f"🔔 *Scheduled Message Reminder*\n\n{text}"
+
+class TokenBucket:
+    """Token bucket rate limiter. Not thread-safe; callers hold their own lock."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Initialize a full bucket.
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens (burst size)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Return how many seconds until a token is available (0 if one is available now)."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float) -> None:
+        """Take one token; call only after wait_time() returned 0."""
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, now: float, seconds: float) -> None:
+        """Refuse tokens for the given number of seconds (used for RetryAfter)."""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+        self.updated = now
+
+    def is_idle(self, now: float) -> bool:
+        """Return True if the bucket has refilled and is not blocked."""
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.blocked_until
+
+class RateLimitedDelivery:
+    """
+    Outbound delivery stage that paces sends to Telegram's limits.
+
+    Due messages are queued in a heap keyed on the time they may next be tried.
+    A single pacing thread takes the next ready message once both the global
+    bucket and that chat's bucket have a token, and hands it to a worker pool.
+    A message that hits a busy chat, or whose send raises RetryAfter, is put back
+    with a later ready time instead of sleeping on a worker thread, so other
+    chats keep flowing at the global ceiling and nothing is dropped. A
+    RetryAfter also pauses the global bucket, since Telegram's flood wait
+    usually covers the whole bot.
+    """
+
+    def __init__(self, send: Callable[[int, str, str], None], workers: int = 20,
+                 global_rate: float = GLOBAL_RATE, global_burst: float = GLOBAL_BURST,
+                 chat_rate: float = CHAT_RATE, chat_burst: float = CHAT_BURST):
+        """
+        Initialize the delivery stage.
+
+        Args:
+            send: Function called as send(user_id, text, job_id); may raise RetryAfter
+            workers: Number of worker threads (and maximum sends in flight)
+            global_rate: Messages per second across all chats
+            global_burst: Global bucket capacity
+            chat_rate: Messages per second to any one chat
+            chat_burst: Per-chat bucket capacity
+        """
+        self.send = send
+        self.workers = workers
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='delivery')
+        self._queue: List[Tuple[float, int, int, str, str]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._last_prune = time.monotonic()
+        self.retry_after_count = 0
+        self.sent_count = 0
+
+    def start(self) -> None:
+        """Start the pacing thread."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='delivery-pacer', daemon=True)
+        self._thread.start()
+        logger.info(f"Rate-limited delivery started (global {self.global_bucket.rate}/s, "
+                    f"per chat {self.chat_rate}/s)")
+
+    def stop(self) -> None:
+        """Stop the pacing thread and wait for in-flight sends to finish."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.executor.shutdown(wait=True)
+
+    def submit(self, user_id: int, text: str, job_id: str, not_before: Optional[float] = None) -> None:
+        """
+        Queue a message for delivery.
+
+        Args:
+            user_id: The Telegram user ID of the recipient
+            text: The message text
+            job_id: The ID of the scheduled job
+            not_before: Monotonic time before which the message must not be sent
+        """
+        ready_at = not_before if not_before is not None else time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queue, (ready_at, next(self._seq), user_id, text, job_id))
+            self._cond.notify()
+
+    def queued(self) -> int:
+        """Return the number of messages waiting to be sent."""
+        return len(self._queue)
+
+    def in_flight(self) -> int:
+        """Return the number of sends currently running."""
+        return self._in_flight
+
+    def capacity(self) -> int:
+        """Return the maximum number of sends that can run at once."""
+        return self.workers
+
+    def _chat_bucket(self, user_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(user_id)
+        if bucket is None:
+            bucket = self.chat_buckets[user_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _prune_chat_buckets(self, now: float) -> None:
+        """Drop per-chat buckets that are full again so the map does not grow forever."""
+        if now - self._last_prune < CHAT_BUCKET_IDLE_SECONDS:
+            return
+        self._last_prune = now
+        idle = [user_id for user_id, bucket in self.chat_buckets.items() if bucket.is_idle(now)]
+        for user_id in idle:
+            del self.chat_buckets[user_id]
+
+    def _run(self) -> None:
+        """Pacing loop: release ready messages to the worker pool as tokens allow."""
+        while True:
+            with self._cond:
+                if not self._running:
+                    break
+                now = time.monotonic()
+                self._prune_chat_buckets(now)
+
+                wait = None
+                if self._in_flight >= self.workers:
+                    wait = 1.0
+                elif self._queue:
+                    ready_at = self._queue[0][0]
+                    if ready_at > now:
+                        wait = ready_at - now
+                    else:
+                        wait = self.global_bucket.wait_time(now)
+                        if wait <= 0:
+                            wait = None
+                else:
+                    wait = 1.0
+
+                if wait is not None:
+                    # Woken early by submit() or a finished send
+                    self._cond.wait(wait)
+                    continue
+
+                _, _, user_id, text, job_id = heapq.heappop(self._queue)
+                chat_bucket = self._chat_bucket(user_id)
+                chat_wait = chat_bucket.wait_time(now)
+                if chat_wait > 0:
+                    # This chat is busy; try again later without holding up other chats
+                    heapq.heappush(self._queue, (now + chat_wait, next(self._seq), user_id, text, job_id))
+                    continue
+
+                chat_bucket.consume(now)
+                self.global_bucket.consume(now)
+                self._in_flight += 1
+
+            self.executor.submit(self._send, user_id, text, job_id)
+
+    def _send(self, user_id: int, text: str, job_id: str) -> None:
+        """Run one send on a worker thread and requeue it if Telegram asks us to back off."""
+        try:
+            self.send(user_id, text, job_id)
+            self.sent_count += 1
+        except RetryAfter as e:
+            now = time.monotonic()
+            with self._cond:
+                self.retry_after_count += 1
+                self._chat_bucket(user_id).block(now, e.retry_after)
+                # Telegram's flood wait usually applies to the whole bot, so
+                # other chats pause too instead of collecting more 429s
+                self.global_bucket.block(now, e.retry_after)
+                heapq.heappush(self._queue, (now + e.retry_after, next(self._seq), user_id, text, job_id))
+            logger.warning(f"Telegram asked to retry job {job_id} after {e.retry_after}s, requeued")
+        except Exception as e:
+            logger.error(f"Unhandled error delivering job {job_id}: {e}", exc_info=True)
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify()
@@ -0,0 +1,182 @@
+import heapq
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from logging_setup import configure_logging
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+class DueTimeDispatcher:
+    """
+    Single-threaded dispatch engine for due-time jobs.
+
+    Pending jobs are kept as compact ``(due_ts, job_id)`` tuples in a min-heap,
+    with a ``job_id -> due_ts`` map used for replacement and cancellation.
+    Cancelled or rescheduled entries are left in the heap and skipped when they
+    surface (lazy deletion); the heap is compacted once stale entries outnumber
+    live ones. One thread wakes once per tick (or earlier when a sooner job is
+    added) and hands every due job_id to the callback in a single batch.
+    """
+
+    def __init__(self, on_due: Callable[[List[str]], None], tick: float = 1.0):
+        """
+        Initialize the dispatcher.
+
+        Args:
+            on_due: Called from the dispatcher thread with the list of due job IDs
+            tick: Maximum number of seconds to sleep between wake-ups
+        """
+        self.on_due = on_due
+        self.tick = tick
+        self._heap: List[Tuple[float, str]] = []
+        self._due: Dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self._due
+
+    def start(self) -> None:
+        """Start the dispatcher thread."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='due-time-dispatcher', daemon=True)
+        self._thread.start()
+        logger.info("Due-time dispatcher started")
+
+    def stop(self) -> None:
+        """Stop the dispatcher thread."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def schedule(self, job_id: str, due_ts: float) -> None:
+        """
+        Add a job, replacing any existing job with the same ID.
+
+        Args:
+            job_id: The ID of the job
+            due_ts: When the job is due, as a Unix timestamp
+        """
+        with self._cond:
+            self._due[job_id] = due_ts
+            heapq.heappush(self._heap, (due_ts, job_id))
+            # Wake the dispatcher early if this job is now the next one due
+            if self._heap[0][1] == job_id:
+                self._cond.notify()
+
+    def schedule_many(self, entries: Iterable[Tuple[str, float]]) -> int:
+        """
+        Add many jobs at once.
+
+        Args:
+            entries: Iterable of (job_id, due_ts) pairs
+
+        Returns:
+            The number of jobs added
+        """
+        new_entries = [(due_ts, job_id) for job_id, due_ts in entries]
+        with self._cond:
+            for due_ts, job_id in new_entries:
+                self._due[job_id] = due_ts
+            # Re-heapify only when the batch is large relative to the heap,
+            # otherwise repeated chunked loads would be quadratic
+            if len(new_entries) > len(self._heap) // 8:
+                self._heap.extend(new_entries)
+                heapq.heapify(self._heap)
+            else:
+                for entry in new_entries:
+                    heapq.heappush(self._heap, entry)
+            self._cond.notify()
+        return len(new_entries)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a pending job.
+
+        Args:
+            job_id: The ID of the job
+
+        Returns:
+            True if the job was pending, False otherwise
+        """
+        with self._cond:
+            if self._due.pop(job_id, None) is None:
+                return False
+            self._maybe_compact()
+            return True
+
+    def next_due(self) -> Optional[float]:
+        """Return the due timestamp of the next live job, if any."""
+        with self._cond:
+            self._drop_stale_head()
+            return self._heap[0][0] if self._heap else None
+
+    def _drop_stale_head(self) -> None:
+        """Pop cancelled or superseded entries off the top of the heap."""
+        heap = self._heap
+        while heap and self._due.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def _maybe_compact(self) -> None:
+        """Rebuild the heap when stale entries outnumber live ones."""
+        if len(self._heap) > 1024 and len(self._heap) > 2 * len(self._due):
+            self._heap = [(due_ts, job_id) for job_id, due_ts in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def pop_due(self, now: Optional[float] = None) -> List[str]:
+        """
+        Remove and return every job that is due.
+
+        Args:
+            now: The current Unix timestamp (defaults to time.time())
+
+        Returns:
+            The due job IDs, earliest first
+        """
+        if now is None:
+            now = time.time()
+        due_jobs = []
+        with self._cond:
+            heap = self._heap
+            while heap and heap[0][0] <= now:
+                due_ts, job_id = heapq.heappop(heap)
+                if self._due.get(job_id) == due_ts:
+                    del self._due[job_id]
+                    due_jobs.append(job_id)
+        return due_jobs
+
+    def _run(self) -> None:
+        """Dispatcher loop: sleep until the next due job or tick, then hand out due jobs."""
+        while True:
+            with self._cond:
+                if not self._running:
+                    break
+                self._drop_stale_head()
+                timeout = self.tick
+                if self._heap:
+                    timeout = min(timeout, max(0.0, self._heap[0][0] - time.time()))
+                if timeout > 0:
+                    self._cond.wait(timeout)
+                if not self._running:
+                    break
+
+            due_jobs = self.pop_due()
+            if not due_jobs:
+                continue
+            try:
+                self.on_due(due_jobs)
+            except Exception as e:
+                logger.error(f"Error dispatching {len(due_jobs)} due jobs: {e}", exc_info=True)
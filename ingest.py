@@ -0,0 +1,200 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Set, Tuple
+from logging_setup import configure_logging
+from metrics import DB_COMMIT_LATENCY, FAILURES
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Extra time (seconds) the committer waits for more rows before committing a group.
+# Rows that arrive while a commit is running are grouped anyway, so 0 is usually best.
+GROUP_COMMIT_MAX_WAIT = float(os.environ.get("GROUP_COMMIT_MAX_WAIT", "0"))
+
+# Maximum number of rows committed in one group
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", "500"))
+
+# Columns written when a scheduled message is inserted
+INSERT_COLUMNS = ('user_id', 'text', 'scheduled_time', 'delivery_time', 'job_id', 'recurrence')
+
+def insert_scheduled_messages(rows: List[Dict[str, Any]]) -> Set[str]:
+    """
+    Insert scheduled messages in bulk, skipping job_ids that already exist.
+
+    Uses ``INSERT ... ON CONFLICT (job_id) DO NOTHING RETURNING job_id`` on
+    PostgreSQL and SQLite, and an existence check plus plain INSERT elsewhere.
+    The caller is responsible for committing (or rolling back) the session.
+
+    Args:
+        rows: Message data dictionaries with the INSERT_COLUMNS keys (recurrence may be omitted)
+
+    Returns:
+        The job_ids that were inserted
+    """
+    # Import locally to avoid circular imports
+    from models import db, ScheduledMessage
+
+    values = [{column: row.get(column) for column in INSERT_COLUMNS} for row in rows]
+    for value in values:
+        value['is_sent'] = False
+    if not values:
+        return set()
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = (
+            insert(ScheduledMessage)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=['job_id'])
+            .returning(ScheduledMessage.job_id)
+        )
+        return set(db.session.execute(statement).scalars())
+
+    job_ids = [value['job_id'] for value in values]
+    existing = set(db.session.execute(
+        db.select(ScheduledMessage.job_id).where(ScheduledMessage.job_id.in_(job_ids))
+    ).scalars())
+    new_values = [value for value in values if value['job_id'] not in existing]
+    if new_values:
+        db.session.execute(db.insert(ScheduledMessage), new_values)
+    return {value['job_id'] for value in new_values}
+
+class GroupCommitIngestor:
+    """
+    Groups concurrent schedule requests into one INSERT and one commit.
+
+    Handler threads call submit() and wait on the returned future. A single
+    committer thread takes everything queued (rows that arrive while a commit
+    is running form the next group, optionally waiting up to
+    GROUP_COMMIT_MAX_WAIT for more), inserts the group with insert_scheduled_messages() and commits once. Each future then
+    resolves to True if its row was inserted or False if the job_id already
+    existed, or raises the commit error, so callers confirm only after the
+    row is durable. A caller that stops waiting can withdraw() its row while
+    it is still queued.
+    """
+
+    def __init__(self, max_wait: float = GROUP_COMMIT_MAX_WAIT, max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        """
+        Initialize the ingestor.
+
+        Args:
+            max_wait: Seconds to wait for more rows before committing a group
+            max_batch: Maximum number of rows per group
+        """
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self._queue: List[Tuple[Dict[str, Any], Future]] = []
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.group_count = 0
+        self.row_count = 0
+
+    def start(self) -> None:
+        """Start the committer thread."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+        self._thread.start()
+        logger.info(f"Group-commit ingestion started (max wait {self.max_wait * 1000:.1f}ms, "
+                    f"max batch {self.max_batch})")
+
+    def stop(self) -> None:
+        """Stop the committer thread after committing anything still queued."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def submit(self, message_data: Dict[str, Any]) -> Future:
+        """
+        Queue a message for insertion in the next group commit.
+
+        Args:
+            message_data: The message data dictionary
+
+        Returns:
+            A future that resolves to True if inserted, False if the job_id already existed
+        """
+        future = Future()
+        with self._cond:
+            self._queue.append((message_data, future))
+            self._cond.notify()
+        return future
+
+    def withdraw(self, future: Future) -> bool:
+        """
+        Take a row back out of the queue, e.g. after its caller gave up waiting.
+
+        Args:
+            future: The future submit() returned for the row
+
+        Returns:
+            True if the row was still queued and will not be stored, False if
+            its group commit has already started
+        """
+        with self._cond:
+            for index, (_, queued) in enumerate(self._queue):
+                if queued is future:
+                    del self._queue[index]
+                    future.cancel()
+                    return True
+        return False
+
+    def _take_group(self) -> List[Tuple[Dict[str, Any], Future]]:
+        """Wait for the first row, then gather more until the batch is full or max_wait passes."""
+        with self._cond:
+            while self._running and not self._queue:
+                self._cond.wait()
+            if self.max_wait > 0 and self._queue and len(self._queue) < self.max_batch and self._running:
+                self._cond.wait(self.max_wait)
+            group = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            return group
+
+    def _run(self) -> None:
+        # Import locally to avoid circular imports
+        from database import app
+        from models import db
+
+        while True:
+            group = self._take_group()
+            if not group:
+                if not self._running:
+                    break
+                continue
+
+            started = time.perf_counter()
+            try:
+                with app.app_context():
+                    try:
+                        inserted = insert_scheduled_messages([row for row, _ in group])
+                        db.session.commit()
+                    except Exception:
+                        db.session.rollback()
+                        raise
+            except Exception as e:
+                logger.error(f"Error committing group of {len(group)} messages: {e}", exc_info=True)
+                FAILURES.inc('db_commit')
+                for _, future in group:
+                    future.set_exception(e)
+                continue
+
+            DB_COMMIT_LATENCY.observe(time.perf_counter() - started, 'ingest')
+            self.group_count += 1
+            self.row_count += len(group)
+            logger.debug(f"Group commit stored {len(inserted)} of {len(group)} messages")
+            for row, future in group:
+                future.set_result(row['job_id'] in inserted)
@@ -0,0 +1,42 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+# Root log level, e.g. DEBUG, INFO, WARNING
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+def configure_logging() -> None:
+    """
+    Route all logging through a queue to a background writer thread.
+
+    Callers (bot handlers, the dispatcher, delivery workers) only pay for
+    putting a record on an in-memory queue; formatting and writing to stderr
+    happen on the listener thread. The level comes from LOG_LEVEL. Safe to call
+    from every module: only the first call configures anything.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # Drain the queue on exit so the last records are not lost
+    atexit.register(_listener.stop)
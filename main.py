@@ -1,30 +1,92 @@
 import os
+import hmac
+import json
 import logging
-from flask import render_template, jsonify
+from flask import render_template, jsonify, request, Response, stream_with_context
 import threading
-from bot import setup_bot
-from database import app, db
+import time
+from datetime import datetime
+import bot as telegram_bot
+from bot import setup_bot, BOT_MODE, WEBHOOK_PATH, WEBHOOK_SECRET
+from database import app, db, init_database
 from models import ScheduledMessage
+from bulk_api import bulk_schedule, read_lines, BULK_API_TOKEN
+import metrics
+from logging_setup import configure_logging
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG, 
-                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Global variable to store the updater
 bot_updater = None
 
+# Startup runs once per process in a background thread; see start_services()
+startup_thread = None
+startup_lock = threading.Lock()
+startup_stats = {'state': 'not started'}
+
 # Define a function to run the bot
 def run_bot():
     global bot_updater
     bot_updater = setup_bot()
     # No need to call idle, just keep the thread alive
 
-# Start the Telegram bot in a separate thread when this module is imported
-logger.info("Setting up Telegram bot...")
-bot_thread = threading.Thread(target=run_bot)
-bot_thread.daemon = True
-bot_thread.start()
+def run_startup():
+    """Create the schema, load the scheduler and start the bot, recording how long each step takes."""
+    started = time.monotonic()
+    try:
+        init_database()
+        startup_stats['schema_seconds'] = round(time.monotonic() - started, 3)
+        telegram_bot.get_scheduler()
+        startup_stats['scheduler_seconds'] = round(time.monotonic() - started, 3)
+        logger.info("Setting up Telegram bot...")
+        run_bot()
+        startup_stats['state'] = 'ready'
+    except Exception as e:
+        logger.error(f"Startup failed: {e}", exc_info=True)
+        startup_stats['state'] = 'failed'
+        startup_stats['error'] = str(e)
+    startup_stats['total_seconds'] = round(time.monotonic() - started, 3)
+    startup_stats['completed_at'] = datetime.now().isoformat()
+    logger.info(f"Startup finished: {startup_stats}")
+
+def start_services():
+    """
+    Start the schema, scheduler and bot initialization in a background thread.
+    
+    Returns immediately and only starts the thread once, so the web server can
+    answer /status while pending messages are loaded. Importing this module
+    does not call it; create_app() does, and so does the first request.
+    """
+    global startup_thread
+    if startup_thread is not None:
+        return
+    with startup_lock:
+        if startup_thread is not None:
+            return
+        startup_stats['state'] = 'starting'
+        startup_thread = threading.Thread(target=run_startup, name='startup', daemon=True)
+        startup_thread.start()
+
+def create_app():
+    """
+    Application factory for gunicorn ("main:create_app()").
+    
+    Returns the Flask app at once and starts the bot and scheduler in the
+    background; /ready reports when they are up.
+    """
+    start_services()
+    return app
+
+def is_ready():
+    """Return True once the scheduler is loaded and the bot is set up."""
+    return startup_stats['state'] == 'ready'
+
+@app.before_request
+def ensure_started():
+    """Start the services on the first request if the app was not created through create_app()."""
+    start_services()
 
 @app.route('/')
 def home():
@@ -36,32 +98,84 @@ def status():
     """Simple status endpoint for uptime monitoring."""
     return "OK", 200
 
+@app.route('/ready')
+def ready():
+    """Readiness endpoint: 200 once the scheduler and bot are running, 503 while starting or if startup failed."""
+    return jsonify(startup_stats), 200 if is_ready() else 503
+
 @app.route('/bot-status')
 def bot_status():
     """Check if the bot is running."""
     global bot_updater
     if bot_updater:
-        try:
-            # Get scheduled message count for additional status info
-            with app.app_context():
-                pending_count = ScheduledMessage.query.filter_by(is_sent=False).count()
-                sent_count = ScheduledMessage.query.filter_by(is_sent=True).count()
-            
-            return jsonify({
-                "status": "running", 
-                "bot_name": "Telegram Message Scheduler Bot",
-                "pending_messages": pending_count,
-                "sent_messages": sent_count
-            })
-        except Exception as e:
-            logger.error(f"Error retrieving message counts: {e}")
-            return jsonify({"status": "running", "bot_name": "Telegram Message Scheduler Bot"})
+        message_scheduler = telegram_bot.get_scheduler()
+        # Counts are maintained in memory by the scheduler, so this stays O(1)
+        # no matter how often uptime monitors poll it
+        return jsonify({
+            "status": "running", 
+            "bot_name": "Telegram Message Scheduler Bot",
+            **message_scheduler.counters.snapshot(),
+            "startup_recovery": message_scheduler.recovery_stats,
+            "list_cache": message_scheduler.list_cache.stats(),
+            "conversations": telegram_bot.conversations.stats()
+        })
     else:
         return jsonify({"status": "not running", "error": "Bot updater not initialized"})
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Latency and lag histograms, queue gauges and failure counters in Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route(WEBHOOK_PATH, methods=['POST'])
+def telegram_webhook():
+    """Receive an update from Telegram in webhook mode and queue it for the handler workers."""
+    if telegram_bot.webhook_queue is None:
+        if BOT_MODE == 'webhook' and startup_stats['state'] != 'failed':
+            # Still starting up; Telegram retries the update later
+            return "Starting", 503
+        return "Webhook mode is not enabled", 404
+    if WEBHOOK_SECRET and not hmac.compare_digest(
+            request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), WEBHOOK_SECRET):
+        return "Forbidden", 403
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return "Bad Request", 400
+    if not telegram_bot.webhook_queue.submit(data):
+        # Telegram retries the update later
+        return "Busy", 503
+    return "OK", 200
+
+@app.route('/api/messages/bulk', methods=['POST'])
+def bulk_messages():
+    """
+    Schedule messages from a JSON Lines body (see bulk_api).
+    
+    The body is streamed: rows are parsed and stored in chunks while it is
+    read, and one JSON result line per input line is streamed back, followed
+    by a summary line.
+    """
+    if not BULK_API_TOKEN:
+        return "Bulk API is not enabled", 404
+    token = request.headers.get('Authorization', '')
+    if not token.startswith('Bearer '):
+        return "Unauthorized", 401
+    if not hmac.compare_digest(token[7:], BULK_API_TOKEN):
+        return "Forbidden", 403
+    if not is_ready():
+        return "Starting", 503
+    
+    results = bulk_schedule(read_lines(request.stream), telegram_bot.get_scheduler())
+    return Response(
+        stream_with_context(json.dumps(result) + "\n" for result in results),
+        mimetype='application/x-ndjson'
+    )
+
 @app.route('/messages/<int:user_id>')
 def get_user_messages(user_id):
     """Get a user's scheduled messages."""
+    if not is_ready():
+        return jsonify({"error": "starting"}), 503
     try:
         messages = ScheduledMessage.query.filter_by(user_id=user_id).order_by(ScheduledMessage.delivery_time.desc()).all()
         return jsonify([msg.to_dict() for msg in messages])
@@ -75,6 +189,7 @@ def run_flask():
 
 def main():
     """Main function to start both the Flask server and the Telegram bot."""
+    create_app()
     # Run Flask in the main thread
     logger.info("Starting Flask web server...")
     run_flask()
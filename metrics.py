@@ -0,0 +1,232 @@
+"""
+In-process metrics exposed in the Prometheus text format by ``/metrics``.
+
+Histograms and counters are sharded per thread: each thread that records a
+value gets its own shard on first use and afterwards updates it without taking
+a lock, so recording on the send path costs a thread-local lookup, a bisect
+and two list increments. A scrape merges the shards (shards of threads that
+have exited are folded into a retired total so they do not pile up). Gauges
+are callbacks evaluated at scrape time.
+"""
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Default latency buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Buckets for how late a message was sent, in seconds
+LAG_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+def register(metric) -> None:
+    """Add a metric to the registry, replacing any metric with the same name."""
+    with _registry_lock:
+        _registry[metric.name] = metric
+
+def render() -> str:
+    """Return every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    rendered = ",".join(f'{name}="{value}"' for name, value in pairs if name)
+    return f"{{{rendered}}}" if rendered else ""
+
+class _ShardedMetric:
+    """Base class for metrics whose values are kept in one shard per thread."""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[Tuple[threading.Thread, Dict[str, list]]] = []
+        self._retired: Dict[str, list] = {}
+        register(self)
+
+    def _new_values(self) -> list:
+        raise NotImplementedError
+
+    def _shard(self) -> Dict[str, list]:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _merged(self) -> Dict[str, list]:
+        """Sum all shards, folding the shards of exited threads into the retired total."""
+        merged: Dict[str, list] = {}
+
+        def add(into: Dict[str, list], shard: Dict[str, list]) -> None:
+            for label_value, values in list(shard.items()):
+                total = into.get(label_value)
+                if total is None:
+                    total = into[label_value] = self._new_values()
+                for index, value in enumerate(list(values)):
+                    total[index] += value
+
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    add(self._retired, shard)
+            self._shards = live
+            add(merged, self._retired)
+            for _, shard in live:
+                add(merged, shard)
+        return merged
+
+class Histogram(_ShardedMetric):
+    """A histogram of observed values, optionally split by one label."""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+                 label: Optional[str] = None):
+        """
+        Initialize and register the histogram.
+
+        Args:
+            name: The metric name
+            documentation: The HELP text
+            buckets: Sorted upper bounds of the buckets (+Inf is added)
+            label: Name of the optional label passed to observe()
+        """
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, label)
+
+    def _new_values(self) -> list:
+        # One count per bucket, one for +Inf, then the sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value: float, label_value: str = '') -> None:
+        """
+        Record a value.
+
+        Args:
+            value: The observed value
+            label_value: Value of the histogram's label, if it has one
+        """
+        shard = self._shard()
+        values = shard.get(label_value)
+        if values is None:
+            values = shard[label_value] = self._new_values()
+        values[bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def collect(self) -> List[str]:
+        lines = []
+        for label_value, values in sorted(self._merged().items()):
+            label_pair = (self.label, label_value)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels((label_pair, ('le', _format_value(bound))))} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_sum{_labels((label_pair,))} {_format_value(values[-1])}")
+            lines.append(f"{self.name}_count{_labels((label_pair,))} {cumulative}")
+        return lines
+
+class Counter(_ShardedMetric):
+    """A monotonically increasing count, optionally split by one label."""
+
+    type = 'counter'
+
+    def _new_values(self) -> list:
+        return [0]
+
+    def inc(self, label_value: str = '', amount: int = 1) -> None:
+        """
+        Increase the counter.
+
+        Args:
+            label_value: Value of the counter's label, if it has one
+            amount: How much to add
+        """
+        shard = self._shard()
+        values = shard.get(label_value)
+        if values is None:
+            values = shard[label_value] = self._new_values()
+        values[0] += amount
+
+    def collect(self) -> List[str]:
+        return [
+            f"{self.name}{_labels(((self.label, label_value),))} {values[0]}"
+            for label_value, values in sorted(self._merged().items())
+        ]
+
+class Gauge:
+    """A value read from a callback at scrape time."""
+
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]):
+        """
+        Initialize and register the gauge.
+
+        Args:
+            name: The metric name
+            documentation: The HELP text
+            function: Called on every scrape to get the current value
+        """
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        register(self)
+
+    def collect(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.function())}"]
+
+SCHEDULE_LATENCY = Histogram(
+    'scheduler_schedule_message_seconds',
+    'Time taken by schedule_message, including the group commit'
+)
+DELIVERY_LAG = Histogram(
+    'scheduler_delivery_lag_seconds',
+    'Seconds between a message\'s delivery time and when it was sent',
+    buckets=LAG_BUCKETS
+)
+SEND_LATENCY = Histogram(
+    'scheduler_telegram_send_seconds',
+    'Duration of sendMessage requests to the Bot API'
+)
+DB_COMMIT_LATENCY = Histogram(
+    'scheduler_db_commit_seconds',
+    'Duration of database writes and their commit',
+    label='operation'
+)
+FAILURES = Counter(
+    'scheduler_failures_total',
+    'Failed operations by kind',
+    label='kind'
+)
+DELIVERY_RETRIES = Counter(
+    'scheduler_delivery_retries_total',
+    'Failed sends rescheduled for another attempt'
+)
+DEAD_LETTERS = Counter(
+    'scheduler_dead_letters_total',
+    'Messages moved to the dead-letter table, by reason',
+    label='reason'
+)
@@ -0,0 +1,250 @@
+"""
+Schema migrations for the scheduler database.
+
+``db.create_all()`` only creates missing tables, so changes to existing tables
+(new indexes, columns) are applied here as numbered migrations recorded in the
+``schema_migrations`` table. Migrations run at startup after create_all and are
+safe on a live table: on PostgreSQL indexes are built with
+``CREATE INDEX CONCURRENTLY`` outside a transaction, and an advisory lock keeps
+concurrent workers from migrating at the same time.
+
+Usage:
+    python migrations.py                 # apply pending migrations
+    python migrations.py --check-plans   # EXPLAIN the hot queries, fail on table scans
+"""
+import logging
+import sys
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex
+from models import db, ScheduledMessage, SchemaMigration
+from logging_setup import configure_logging
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Key for pg_advisory_lock so only one process migrates at a time
+MIGRATION_LOCK_KEY = 7425001
+
+def _model_index(table, name: str):
+    for index in table.indexes:
+        if index.name == name:
+            return index
+    raise KeyError(f"No index named {name} on {table.name}")
+
+def create_index(conn: Connection, table, name: str) -> None:
+    """
+    Create an index declared on a model's table if it does not exist.
+
+    Args:
+        conn: An autocommit connection
+        table: The SQLAlchemy table the index is declared on
+        name: The index name
+    """
+    index = _model_index(table, name)
+    ddl = str(CreateIndex(index).compile(dialect=conn.dialect))
+    if conn.dialect.name == 'postgresql':
+        # A failed concurrent build leaves an invalid index behind; rebuild it
+        valid = conn.execute(text(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name"
+        ), {'name': name}).scalar()
+        if valid is False:
+            logger.warning(f"Dropping invalid index {name} before rebuilding it")
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY IF NOT EXISTS", 1)
+    else:
+        ddl = ddl.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1)
+    conn.execute(text(ddl))
+    logger.info(f"Ensured index {name}")
+
+def drop_index(conn: Connection, name: str) -> None:
+    """
+    Drop an index if it exists.
+
+    Args:
+        conn: An autocommit connection
+        name: The index name
+    """
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    else:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    logger.info(f"Dropped index {name} if it existed")
+
+def add_column(conn: Connection, table, name: str) -> None:
+    """
+    Add a column declared on a model's table if it does not exist.
+
+    Only nullable columns without a server default should be added this way;
+    on PostgreSQL that is a catalog-only change that does not rewrite the table.
+
+    Args:
+        conn: An autocommit connection
+        table: The SQLAlchemy table the column is declared on
+        name: The column name
+    """
+    existing = {column['name'] for column in inspect(conn).get_columns(table.name)}
+    if name in existing:
+        return
+    column = table.columns[name]
+    column_type = column.type.compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}"))
+    logger.info(f"Added column {table.name}.{name}")
+
+def _hot_query_indexes(conn: Connection) -> None:
+    """Composite and partial indexes for the hot ScheduledMessage queries."""
+    table = ScheduledMessage.__table__
+    for name in (
+        'ix_scheduled_messages_user_delivery',
+        'ix_scheduled_messages_user_pending',
+        'ix_scheduled_messages_pending_delivery',
+        'ix_scheduled_messages_sent_at',
+    ):
+        create_index(conn, table, name)
+    # Covered by the leading column of ix_scheduled_messages_user_delivery
+    drop_index(conn, 'ix_scheduled_messages_user_id')
+
+def _claim_columns(conn: Connection) -> None:
+    """Columns recording which worker has claimed a message and until when."""
+    table = ScheduledMessage.__table__
+    add_column(conn, table, 'claimed_by')
+    add_column(conn, table, 'lease_expires_at')
+
+def _recurrence_column(conn: Connection) -> None:
+    """Column holding the rule of a recurring message."""
+    add_column(conn, ScheduledMessage.__table__, 'recurrence')
+
+def _attempts_column(conn: Connection) -> None:
+    """Column counting failed delivery attempts."""
+    add_column(conn, ScheduledMessage.__table__, 'attempts')
+
+# Ordered list of (version, description, function taking an autocommit connection).
+# Migrations must be idempotent: a crash can leave one partly applied.
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "Composite and partial indexes for hot queries", _hot_query_indexes),
+    (2, "Claim columns for multi-worker delivery", _claim_columns),
+    (3, "Recurrence rule column", _recurrence_column),
+    (4, "Failed delivery attempts column", _attempts_column),
+]
+
+def run_migrations(engine: Engine) -> int:
+    """
+    Apply every migration that has not been recorded in schema_migrations.
+
+    Args:
+        engine: The database engine (tables must already exist)
+
+    Returns:
+        The number of migrations applied
+    """
+    applied_count = 0
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        is_postgres = conn.dialect.name == 'postgresql'
+        if is_postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+        try:
+            applied = set(conn.execute(db.select(SchemaMigration.version)).scalars())
+            for version, description, migrate in MIGRATIONS:
+                if version in applied:
+                    continue
+                logger.info(f"Applying migration {version}: {description}")
+                migrate(conn)
+                conn.execute(db.insert(SchemaMigration).values(
+                    version=version,
+                    description=description,
+                    applied_at=datetime.utcnow()
+                ))
+                applied_count += 1
+        finally:
+            if is_postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': MIGRATION_LOCK_KEY})
+
+    if applied_count:
+        logger.info(f"Applied {applied_count} schema migration(s)")
+    return applied_count
+
+def hot_queries() -> Dict[str, object]:
+    """Return the scheduler's hot queries, keyed by a short name."""
+    now = datetime.now()
+    week_ago = now - timedelta(days=7)
+    return {
+        'list_pending_for_user': db.select(ScheduledMessage).where(
+            ScheduledMessage.user_id == 1, ScheduledMessage.is_sent == False
+        ).order_by(ScheduledMessage.delivery_time.asc()),
+        'user_history': db.select(ScheduledMessage).where(
+            ScheduledMessage.user_id == 1
+        ).order_by(ScheduledMessage.delivery_time.desc()),
+        'pending_due': db.select(ScheduledMessage.job_id).where(
+            ScheduledMessage.is_sent == False, ScheduledMessage.delivery_time <= now
+        ).order_by(ScheduledMessage.delivery_time),
+        'horizon_refill': db.select(ScheduledMessage.job_id).where(
+            ScheduledMessage.is_sent == False,
+            ScheduledMessage.delivery_time > now, ScheduledMessage.delivery_time <= now + timedelta(minutes=15)
+        ),
+        'cleanup_sent': db.select(ScheduledMessage.id).where(
+            ScheduledMessage.is_sent == True, ScheduledMessage.sent_at <= week_ago
+        ),
+        'cleanup_expired': db.select(ScheduledMessage.id).where(
+            ScheduledMessage.is_sent == False, ScheduledMessage.delivery_time <= week_ago
+        ),
+        'job_lookup': db.select(ScheduledMessage.id).where(ScheduledMessage.job_id == 'msg_1_0'),
+    }
+
+def explain(conn: Connection, query) -> str:
+    """Return the query plan for a SQLAlchemy query as text."""
+    sql = str(query.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    if conn.dialect.name == 'sqlite':
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        return "\n".join(row[-1] for row in rows)
+    return "\n".join(row[0] for row in conn.execute(text(f"EXPLAIN {sql}")).all())
+
+def uses_index(plan: str) -> bool:
+    """Return True if a query plan reads the table through an index."""
+    if 'USING INDEX' in plan or 'USING COVERING INDEX' in plan or 'USING INTEGER PRIMARY KEY' in plan:
+        return True
+    return 'Index Scan' in plan or 'Index Only Scan' in plan or 'Bitmap Index Scan' in plan
+
+def check_hot_query_plans(engine: Engine) -> Dict[str, Tuple[bool, str]]:
+    """
+    EXPLAIN each hot query and report whether it uses an index.
+
+    On PostgreSQL sequential scans are disabled for the check, so on a small
+    table it reports whether an index *can* serve the query rather than what
+    the planner prefers for that table size.
+
+    Args:
+        engine: The database engine
+
+    Returns:
+        Mapping of query name to (uses_index, plan)
+    """
+    results = {}
+    with engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text("SET enable_seqscan = off"))
+        for name, query in hot_queries().items():
+            plan = explain(conn, query)
+            results[name] = (uses_index(plan), plan)
+    return results
+
+def main():
+    # Import locally so importing this module has no side effects
+    from database import app, init_database
+
+    # Creates missing tables and applies pending migrations
+    init_database()
+    with app.app_context():
+        if '--check-plans' in sys.argv:
+            failures = 0
+            for name, (indexed, plan) in check_hot_query_plans(db.engine).items():
+                print(f"{'OK  ' if indexed else 'SCAN'} {name}\n    " + plan.replace("\n", "\n    "))
+                failures += not indexed
+            sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
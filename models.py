@@ -11,9 +11,31 @@ db = SQLAlchemy(model_class=Base)
 class ScheduledMessage(db.Model):
     """Model for storing scheduled messages."""
     __tablename__ = 'scheduled_messages'
+    __table_args__ = (
+        # /messages/<user_id>: all of a user's messages ordered by delivery time
+        db.Index('ix_scheduled_messages_user_delivery', 'user_id', 'delivery_time'),
+        # /list: a user's pending messages ordered by delivery time
+        db.Index(
+            'ix_scheduled_messages_user_pending', 'user_id', 'delivery_time',
+            postgresql_where=db.text('NOT is_sent'),
+            sqlite_where=db.text('is_sent = 0')
+        ),
+        # Startup recovery and expired-message cleanup: pending messages by delivery time
+        db.Index(
+            'ix_scheduled_messages_pending_delivery', 'delivery_time',
+            postgresql_where=db.text('NOT is_sent'),
+            sqlite_where=db.text('is_sent = 0')
+        ),
+        # Sent-message cleanup
+        db.Index(
+            'ix_scheduled_messages_sent_at', 'sent_at',
+            postgresql_where=db.text('is_sent'),
+            sqlite_where=db.text('is_sent = 1')
+        ),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.BigInteger, nullable=False, index=True)
+    user_id = db.Column(db.BigInteger, nullable=False)
     text = db.Column(db.Text, nullable=False)
     scheduled_time = db.Column(db.DateTime, nullable=False)
     delivery_time = db.Column(db.DateTime, nullable=False, index=True)
@@ -21,6 +43,13 @@ class ScheduledMessage(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_sent = db.Column(db.Boolean, default=False)
     sent_at = db.Column(db.DateTime, nullable=True)
+    # Recurrence rule (see recurrence.py); delivery_time is then the next occurrence
+    recurrence = db.Column(db.String(100), nullable=True)
+    # Claim mode: the worker delivering this message and when its claim expires
+    claimed_by = db.Column(db.String(64), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    # Failed delivery attempts of the current occurrence (NULL for none)
+    attempts = db.Column(db.Integer, nullable=True)
     
     def __repr__(self):
         return f"<ScheduledMessage(id={self.id}, user_id={self.user_id}, delivery_time={self.delivery_time})>"
@@ -36,5 +65,50 @@ class ScheduledMessage(db.Model):
             'job_id': self.job_id,
             'created_at': self.created_at,
             'is_sent': self.is_sent,
-            'sent_at': self.sent_at
-        }
\ No newline at end of file
+            'sent_at': self.sent_at,
+            'recurrence': self.recurrence
+        }
+
+class DeadLetter(db.Model):
+    """Model for messages given up on after failed deliveries, with the last error."""
+    __tablename__ = 'dead_letters'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Not unique: every occurrence of a recurring message that failed is kept
+    job_id = db.Column(db.String(100), nullable=False, index=True)
+    user_id = db.Column(db.BigInteger, nullable=False, index=True)
+    text = db.Column(db.Text, nullable=False)
+    delivery_time = db.Column(db.DateTime, nullable=False)
+    recurrence = db.Column(db.String(100), nullable=True)
+    attempts = db.Column(db.Integer, nullable=False)
+    error = db.Column(db.String(500), nullable=False)
+    failed_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<DeadLetter(job_id={self.job_id}, user_id={self.user_id}, error={self.error})>"
+
+class SchemaMigration(db.Model):
+    """Model recording which schema migrations have been applied."""
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<SchemaMigration(version={self.version}, description={self.description})>"
+
+class ConversationState(db.Model):
+    """Model for the scheduling conversation of a user (CONVERSATION_BACKEND=database)."""
+    __tablename__ = 'conversation_states'
+    
+    chat_id = db.Column(db.BigInteger, primary_key=True)
+    user_id = db.Column(db.BigInteger, primary_key=True)
+    # ConversationHandler state, or NULL while only a message is stored
+    state = db.Column(db.Integer, nullable=True)
+    # The message waiting for a delivery time
+    message = db.Column(db.Text, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f"<ConversationState(chat_id={self.chat_id}, user_id={self.user_id}, state={self.state})>"
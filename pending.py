@@ -0,0 +1,35 @@
+import sys
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+class PendingMessage:
+    """
+    Compact in-memory record of a message waiting to be delivered.
+
+    Only what the scheduler needs to dispatch the message is kept: the
+    interned job ID, the integer user ID, the due time as epoch seconds and,
+    for recurring messages, the interned recurrence rule.
+    The message text stays in the database and is fetched in batches when the
+    message comes due.
+    """
+
+    __slots__ = ('job_id', 'user_id', 'due_ts', 'recurrence')
+
+    def __init__(self, job_id: str, user_id: int, due_ts: float, recurrence: Optional[str] = None):
+        self.job_id = sys.intern(job_id)
+        self.user_id = int(user_id)
+        self.due_ts = due_ts
+        self.recurrence = sys.intern(recurrence) if recurrence else None
+
+    @classmethod
+    def from_message_data(cls, message_data: Dict[str, Any]) -> 'PendingMessage':
+        """Build a record from a message data dictionary or ScheduledMessage.to_dict()."""
+        return cls(message_data['job_id'], message_data['user_id'], message_data['delivery_time'].timestamp(),
+                   message_data.get('recurrence'))
+
+    @property
+    def delivery_time(self) -> datetime:
+        return datetime.fromtimestamp(self.due_ts)
+
+    def __repr__(self):
+        return f"<PendingMessage(job_id={self.job_id}, user_id={self.user_id}, delivery_time={self.delivery_time})>"
@@ -0,0 +1,242 @@
+"""
+Recurring reminder rules.
+
+A recurring reminder is stored as a single ScheduledMessage row whose
+``recurrence`` column holds the rule and whose ``delivery_time`` is the next
+occurrence. After each send the next occurrence is computed from the rule and
+written back to the same row, so a rule costs one row and one pending entry
+however many times it fires. Occurrences missed while the bot was down are
+not replayed one by one: the overdue occurrence is sent once and the rule
+continues from the current time.
+
+Supported forms (case-insensitive):
+    every 30m, every 2 hours, every day     a fixed interval (at least MIN_INTERVAL_SECONDS)
+    daily 9am, every day at 21:30           every day at a time
+    weekdays 8:30, weekends 10am            Monday-Friday or Saturday-Sunday at a time
+    every monday 9am, every mon, thu 18:00  the given weekdays at a time
+
+A day or weekday without "every" ("monday 8:30", "day 9am") is not a
+recurrence; timespec reads it as a one-off time.
+    cron */15 9-17 * * 1-5                  a five-field cron expression
+
+Rules are stored in a canonical form, ``interval <seconds>`` or
+``cron <minute> <hour> <day> <month> <weekday>``.
+"""
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import FrozenSet, Optional, Tuple
+from timespec import WEEKDAYS
+
+# Shortest interval a recurring reminder may use
+MIN_INTERVAL_SECONDS = 60
+
+# Seconds per interval unit, keyed by the first letter of the unit
+UNIT_SECONDS = {'w': 604800, 'd': 86400, 'h': 3600, 'm': 60}
+
+WEEKDAY_NAMES = ('Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat')
+
+# (minimum, maximum) of each cron field; weekday 7 is also Sunday
+CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+# Day words that make a spec repeat on their own; others need "every"
+REPEATING_DAY_WORDS = ('daily', 'weekdays', 'weekends')
+
+_WEEKDAY = r'(?:mon|tue|wed|thu|fri|sat|sun)[a-z]*'
+
+_INTERVAL_RE = re.compile(
+    r'every\s+(?P<amount>\d+)?\s*(?P<unit>minutes?|mins?|m|hours?|hrs?|h|days?|d|weeks?|wks?|w)'
+)
+
+_AT_TIME_RE = re.compile(
+    r'(?:every\s+)?(?P<days>daily|day|weekdays?|weekends?|' + _WEEKDAY +
+    r'(?:\s*(?:,|and)?\s*' + _WEEKDAY + r')*)\s+(?:at\s+)?'
+    r'(?:(?P<hour>\d{1,2})(?::(?P<minute>\d{2}))?\s*(?P<ampm>am|pm)?|(?P<named>noon|midnight))'
+)
+
+class Recurrence:
+    """A parsed recurrence rule that can compute its next occurrence."""
+
+    __slots__ = ('interval', 'fields', 'matches')
+
+    def __init__(self, interval: Optional[int] = None,
+                 fields: Optional[Tuple[str, str, str, str, str]] = None):
+        """
+        Initialize the rule; give either an interval or cron fields.
+
+        Args:
+            interval: Seconds between occurrences
+            fields: The five cron fields
+        """
+        self.interval = interval
+        self.fields = fields
+        self.matches = None
+        if fields:
+            minutes, hours, days, months, weekdays = (
+                _parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_RANGES)
+            )
+            self.matches = (minutes, hours, days, months, frozenset(day % 7 for day in weekdays))
+
+    def __str__(self) -> str:
+        if self.interval is not None:
+            return f"interval {self.interval}"
+        return "cron " + " ".join(self.fields)
+
+    def next_after(self, previous: datetime, now: Optional[datetime] = None) -> datetime:
+        """
+        Return the first occurrence after both the previous occurrence and now.
+
+        Args:
+            previous: The occurrence that was just sent (or the time the rule was created)
+            now: The current time (defaults to datetime.now())
+        """
+        if now is None:
+            now = datetime.now()
+        if self.interval is not None:
+            # Stay on the rule's original cadence, skipping occurrences already missed
+            step = timedelta(seconds=self.interval)
+            missed = max(0, int((now - previous) / step))
+            candidate = previous + step * (missed + 1)
+            return candidate if candidate > now else candidate + step
+        return self._next_cron(max(previous, now))
+
+    def _next_cron(self, after: datetime) -> datetime:
+        minutes, hours, days, months, weekdays = self.matches
+        # With both day of month and weekday restricted, cron matches either one
+        either_day = self.fields[2] != '*' and self.fields[4] != '*'
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.date()
+        for _ in range(366 * 5):
+            cron_weekday = (day.weekday() + 1) % 7
+            if either_day:
+                day_matches = day.day in days or cron_weekday in weekdays
+            else:
+                day_matches = day.day in days and cron_weekday in weekdays
+            if day.month in months and day_matches:
+                first_hour = start.hour if day == start.date() else 0
+                for hour in sorted(h for h in hours if h >= first_hour):
+                    first_minute = start.minute if (day == start.date() and hour == start.hour) else 0
+                    for minute in sorted(m for m in minutes if m >= first_minute):
+                        return datetime(day.year, day.month, day.day, hour, minute)
+            day += timedelta(days=1)
+        raise ValueError(f"Recurrence {self} has no occurrence in the next five years")
+
+    def describe(self) -> str:
+        """Return a short human-readable form for /list."""
+        if self.interval is not None:
+            for unit, seconds in (('w', 604800), ('d', 86400), ('h', 3600), ('m', 60)):
+                if self.interval % seconds == 0:
+                    return f"every {self.interval // seconds}{unit}"
+            return f"every {self.interval}s"
+        minute, hour, day, month, weekday = self.fields
+        if minute.isdigit() and hour.isdigit() and day == '*' and month == '*':
+            at = f"{int(hour):02d}:{int(minute):02d}"
+            if weekday == '*':
+                return f"daily at {at}"
+            if weekday == '1-5':
+                return f"weekdays at {at}"
+            if weekday == '0,6':
+                return f"weekends at {at}"
+            names = ", ".join(WEEKDAY_NAMES[number] for number in sorted(self.matches[4]))
+            return f"every {names} at {at}"
+        return str(self)
+
+def _parse_cron_field(field: str, low: int, high: int) -> FrozenSet[int]:
+    """Expand a cron field (*, n, a-b, lists and /step) into the set of matching values."""
+    values = set()
+    for part in field.split(','):
+        base, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if base == '*':
+            start, end = low, high
+        elif '-' in base:
+            start, end = (int(value) for value in base.split('-', 1))
+        else:
+            start = end = int(base)
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f"Invalid cron field {field!r}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+def _cron_weekdays(days: str) -> Optional[str]:
+    if days in ('daily', 'day'):
+        return '*'
+    if days.startswith('weekday'):
+        return '1-5'
+    if days.startswith('weekend'):
+        return '0,6'
+    numbers = set()
+    for name in re.findall(_WEEKDAY, days):
+        weekday = WEEKDAYS.get(name)
+        if weekday is None:
+            return None
+        # Python counts from Monday, cron from Sunday
+        numbers.add((weekday + 1) % 7)
+    return ",".join(str(number) for number in sorted(numbers)) if numbers else None
+
+def _if_it_fires(rule: Recurrence) -> Optional[Recurrence]:
+    """Return the rule if it has a next occurrence, or None for one that never fires (e.g. February 31)."""
+    try:
+        rule.next_after(datetime.now())
+    except (ValueError, OverflowError):
+        return None
+    return rule
+
+@lru_cache(maxsize=1024)
+def parse_recurrence(spec: str) -> Optional[Recurrence]:
+    """
+    Parse a user's recurrence spec or a stored canonical rule.
+
+    Args:
+        spec: The spec (see the module docstring)
+
+    Returns:
+        The rule, or None if the spec is not a recurrence this module understands
+        or never fires
+    """
+    spec = " ".join(spec.strip().lower().split())
+
+    if spec.startswith('interval '):
+        seconds = spec[9:]
+        if not seconds.isdigit() or int(seconds) < MIN_INTERVAL_SECONDS:
+            return None
+        return _if_it_fires(Recurrence(interval=int(seconds)))
+
+    if spec.startswith('cron '):
+        fields = tuple(spec[5:].split())
+        if len(fields) != 5:
+            return None
+        try:
+            return _if_it_fires(Recurrence(fields=fields))
+        except ValueError:
+            return None
+
+    match = _INTERVAL_RE.fullmatch(spec)
+    if match:
+        seconds = int(match.group('amount') or 1) * UNIT_SECONDS[match.group('unit')[0]]
+        return _if_it_fires(Recurrence(interval=seconds)) if seconds >= MIN_INTERVAL_SECONDS else None
+
+    match = _AT_TIME_RE.fullmatch(spec)
+    if match:
+        # Without "every", only daily/weekdays/weekends repeat; "monday 8:30"
+        # is a one-off time for timespec
+        if not spec.startswith('every ') and match.group('days') not in REPEATING_DAY_WORDS:
+            return None
+        weekdays = _cron_weekdays(match.group('days'))
+        if weekdays is None:
+            return None
+        if match.group('named'):
+            hour, minute = (12, 0) if match.group('named') == 'noon' else (0, 0)
+        else:
+            hour = int(match.group('hour'))
+            minute = int(match.group('minute') or 0)
+            ampm = match.group('ampm')
+            if ampm:
+                if not 1 <= hour <= 12:
+                    return None
+                hour = hour % 12 + (12 if ampm == 'pm' else 0)
+            if hour > 23 or minute > 59:
+                return None
+        return Recurrence(fields=(str(minute), str(hour), '*', '*', weekdays))
+
+    return None
@@ -0,0 +1,116 @@
+import gzip
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Optional
+from logging_setup import configure_logging
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Days to keep sent messages after they were sent
+RETENTION_SENT_DAYS = float(os.environ.get("RETENTION_SENT_DAYS", "7"))
+
+# Days to keep messages that were never sent after their delivery time passed
+RETENTION_UNSENT_DAYS = float(os.environ.get("RETENTION_UNSENT_DAYS", "7"))
+
+# Rows deleted per DELETE statement and transaction
+RETENTION_CHUNK_SIZE = int(os.environ.get("RETENTION_CHUNK_SIZE", "1000"))
+
+# Hours between retention runs
+RETENTION_INTERVAL_HOURS = float(os.environ.get("RETENTION_INTERVAL_HOURS", "24"))
+
+# Directory for gzipped JSON Lines archives of deleted rows; empty disables archiving
+RETENTION_ARCHIVE_DIR = os.environ.get("RETENTION_ARCHIVE_DIR", "")
+
+class RetentionArchive:
+    """Gzipped JSON Lines file that rows are written to before they are deleted."""
+
+    def __init__(self, directory: str, label: str):
+        """
+        Open a new archive file.
+
+        Args:
+            directory: Directory to write the archive into
+            label: Name prefix for the file (e.g. "sent" or "expired")
+        """
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%dT%H%M%S')
+        self.path = os.path.join(directory, f"scheduled_messages-{label}-{stamp}.jsonl.gz")
+        self._file = gzip.open(self.path, 'wt', encoding='utf-8')
+        self.count = 0
+
+    def write(self, row) -> None:
+        """Append one row (a SQLAlchemy Row) to the archive."""
+        record = {
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in row._asdict().items()
+        }
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.count += 1
+
+    def close(self) -> None:
+        self._file.close()
+        if not self.count:
+            os.remove(self.path)
+
+def purge_in_chunks(condition, label: str, chunk_size: int = RETENTION_CHUNK_SIZE,
+                    archive_dir: Optional[str] = RETENTION_ARCHIVE_DIR) -> int:
+    """
+    Delete every ScheduledMessage matching a condition in bounded chunks.
+
+    Each chunk selects up to chunk_size ids, optionally archives those rows,
+    and removes them with one ``DELETE ... WHERE id IN (...)`` in its own
+    transaction, so memory and lock time stay bounded however many rows match.
+    Must be called inside an app context.
+
+    Args:
+        condition: SQLAlchemy filter expression selecting the rows to delete
+        label: Short name used in logs and archive file names
+        chunk_size: Maximum rows per chunk
+        archive_dir: Directory to archive deleted rows into, or empty to skip
+
+    Returns:
+        The number of rows deleted
+    """
+    # Import locally to avoid circular imports
+    from models import db, ScheduledMessage
+
+    archive = RetentionArchive(archive_dir, label) if archive_dir else None
+    columns = (
+        ScheduledMessage.__table__.columns if archive else (ScheduledMessage.id,)
+    )
+    total = 0
+    try:
+        while True:
+            rows = db.session.execute(
+                db.select(*columns).where(condition).limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            if archive:
+                for row in rows:
+                    archive.write(row)
+            ids = [row.id for row in rows]
+            db.session.execute(
+                db.delete(ScheduledMessage)
+                .where(ScheduledMessage.id.in_(ids))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            total += len(ids)
+            if len(ids) < chunk_size:
+                break
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if archive:
+            archive.close()
+
+    if total:
+        logger.info(f"Deleted {total} {label} messages in chunks of {chunk_size}"
+                    + (f", archived to {archive.path}" if archive and archive.count else ""))
+    return total
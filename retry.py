@@ -0,0 +1,152 @@
+import logging
+import os
+import random
+from datetime import datetime
+from typing import Optional
+from telegram.error import BadRequest, ChatMigrated, Unauthorized
+from logging_setup import configure_logging
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Delivery attempts before a failing message is moved to the dead-letter table
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "6"))
+
+# Seconds before the first retry; the delay doubles with every further attempt ...
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "30"))
+
+# ... up to this many seconds
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "3600"))
+
+# Bot API error codes that another attempt cannot fix: 400 (chat not found,
+# unparsable message) and 403 (bot blocked by the user, user deactivated)
+PERMANENT_ERROR_CODES = {400, 403}
+
+def retry_delay(attempt: int, base: float = RETRY_BASE_DELAY, maximum: float = RETRY_MAX_DELAY) -> float:
+    """
+    Return the delay before retrying after a message's attempt-th failed attempt.
+
+    The delay grows exponentially and is jittered over its upper half, so
+    messages that failed together (e.g. during an outage) are not all retried
+    at the same moment.
+
+    Args:
+        attempt: The number of failed attempts so far (1 for the first failure)
+        base: Delay after the first failure
+        maximum: Upper bound on the delay
+
+    Returns:
+        Seconds to wait before the next attempt
+    """
+    delay = min(maximum, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def is_permanent_error(error: Exception) -> bool:
+    """Return True if a send failure raised by python-telegram-bot will not go away by retrying."""
+    # BadRequest is a NetworkError subclass, so it must be checked explicitly
+    return isinstance(error, (BadRequest, Unauthorized, ChatMigrated))
+
+def record_failed_attempt(job_id: str) -> Optional[int]:
+    """
+    Count a failed delivery attempt on a pending message.
+
+    Args:
+        job_id: The ID of the job
+
+    Returns:
+        The number of failed attempts including this one, or None if the
+        message is no longer pending
+    """
+    # Import locally to avoid circular imports
+    from database import app
+    from models import db, ScheduledMessage
+
+    with app.app_context():
+        try:
+            attempts = db.session.execute(
+                db.update(ScheduledMessage)
+                .where(ScheduledMessage.job_id == job_id, ScheduledMessage.is_sent == False)
+                .values(attempts=db.func.coalesce(ScheduledMessage.attempts, 0) + 1)
+                .returning(ScheduledMessage.attempts)
+                .execution_options(synchronize_session=False)
+            ).scalar()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return attempts
+
+def postpone_claim(job_id: str, retry_at: datetime) -> None:
+    """
+    Release a claimed message so that it can be claimed again from retry_at on.
+
+    Args:
+        job_id: The ID of the job
+        retry_at: When the next attempt is due
+    """
+    # Import locally to avoid circular imports
+    from database import app
+    from models import db, ScheduledMessage
+
+    with app.app_context():
+        try:
+            db.session.execute(
+                db.update(ScheduledMessage)
+                .where(ScheduledMessage.job_id == job_id, ScheduledMessage.is_sent == False)
+                .values(claimed_by=None, lease_expires_at=retry_at)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+def move_to_dead_letters(job_id: str, reason: str, keep_row: bool = False) -> bool:
+    """
+    Copy a pending message into the dead-letter table, with why it failed.
+
+    Args:
+        job_id: The ID of the job
+        reason: The last error
+        keep_row: Leave the scheduled row in place (a recurring message moving
+            on to its next occurrence) instead of deleting it
+
+    Returns:
+        True if the message was moved, False if it was no longer pending
+    """
+    # Import locally to avoid circular imports
+    from database import app
+    from models import db, ScheduledMessage, DeadLetter
+
+    pending = db.select(ScheduledMessage).where(
+        ScheduledMessage.job_id == job_id, ScheduledMessage.is_sent == False
+    ).subquery()
+    with app.app_context():
+        try:
+            moved = db.session.execute(
+                db.insert(DeadLetter).from_select(
+                    ['job_id', 'user_id', 'text', 'delivery_time', 'recurrence', 'attempts', 'error', 'failed_at'],
+                    db.select(
+                        pending.c.job_id, pending.c.user_id, pending.c.text, pending.c.delivery_time,
+                        pending.c.recurrence, db.func.coalesce(pending.c.attempts, 0),
+                        db.literal(reason[:DeadLetter.error.type.length]), db.literal(datetime.now())
+                    )
+                )
+            ).rowcount
+            if moved and not keep_row:
+                db.session.execute(db.delete(ScheduledMessage).where(ScheduledMessage.job_id == job_id))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return bool(moved)
+
+def count_dead_letters() -> int:
+    """Return the number of rows in the dead-letter table."""
+    # Import locally to avoid circular imports
+    from database import app
+    from models import db, DeadLetter
+
+    with app.app_context():
+        return db.session.execute(db.select(db.func.count()).select_from(DeadLetter)).scalar()
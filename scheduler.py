@@ -1,19 +1,90 @@
+import atexit
 import logging
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.executors.pool import ThreadPoolExecutor
 from telegram import Bot, ParseMode
+from telegram.error import RetryAfter
+from telegram.utils.request import Request
+from delivery import RateLimitedDelivery, format_reminder
+from cache import UserMessageCache
+from counters import MessageCounters
+from pending import PendingMessage
+from recurrence import parse_recurrence
+from dispatcher import DueTimeDispatcher
+from coalesce import DeliveryCoalescer, COALESCE_WINDOW
+from claims import ClaimDispatcher, ClaimedMessage, CLAIM_BATCH_SIZE, WORKER_ID
+from ingest import GroupCommitIngestor, insert_scheduled_messages
+from retention import (
+    purge_in_chunks, RETENTION_SENT_DAYS, RETENTION_UNSENT_DAYS, RETENTION_INTERVAL_HOURS
+)
+from write_behind import (
+    SentWriteBehind, replay_sent_journal, sent_journal_path, lock_sent_journal,
+    replay_orphaned_sent_journals
+)
+from retry import (
+    RETRY_MAX_ATTEMPTS, retry_delay, is_permanent_error, record_failed_attempt, postpone_claim,
+    move_to_dead_letters, count_dead_letters
+)
+from snapshot import SnapshotStore, SnapshotError, SNAPSHOT_PATH, SNAPSHOT_INTERVAL
+from metrics import (
+    Gauge, SCHEDULE_LATENCY, DELIVERY_LAG, SEND_LATENCY, DB_COMMIT_LATENCY, FAILURES,
+    DELIVERY_RETRIES, DEAD_LETTERS
+)
 import os
+import threading
 import time
 import flask
+from logging_setup import configure_logging
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Number of pending rows fetched and registered per chunk during startup recovery
+RECOVERY_CHUNK_SIZE = int(os.environ.get("RECOVERY_CHUNK_SIZE", "5000"))
+
+# Memory mode: only messages due within this many seconds are held in memory; later
+# ones stay in the database until a periodic refill loads them (0 = hold every message)
+HORIZON_SECONDS = float(os.environ.get("HORIZON_SECONDS", "0"))
+
+# Seconds between horizon refills; must be shorter than HORIZON_SECONDS
+HORIZON_REFILL_INTERVAL = float(os.environ.get("HORIZON_REFILL_INTERVAL", "60"))
+
+# Messages per second sent by the catch-up pass for messages that came due while down
+CATCHUP_RATE = float(os.environ.get("CATCHUP_RATE", "20"))
+
+# Dispatch mode: "memory" (this process loads and sends every pending message) or
+# "claim" (workers claim due rows from the database, safe with several workers/instances)
+DISPATCH_MODE = os.environ.get("DISPATCH_MODE", "memory").lower()
+
+# Delivery engine: "threaded" (worker pool + python-telegram-bot) or "async" (asyncio + aiohttp)
+DELIVERY_ENGINE = os.environ.get("DELIVERY_ENGINE", "threaded").lower()
+
+# Number of worker threads used by the threaded delivery engine
+DELIVERY_WORKERS = int(os.environ.get("DELIVERY_WORKERS", "20"))
+
+# Base URL of the Bot API; point it at a local fake server for testing
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# Seconds a schedule request waits for its group commit before giving up
+INGEST_TIMEOUT = float(os.environ.get("INGEST_TIMEOUT", "10"))
+
+# Seconds between reconciling the in-memory message counters with the database
+COUNTER_RECONCILE_INTERVAL = int(os.environ.get("COUNTER_RECONCILE_INTERVAL", "300"))
+
+# Seconds between the summary log lines (pending count, next delivery, delivery queue)
+LOG_SUMMARY_INTERVAL = int(os.environ.get("LOG_SUMMARY_INTERVAL", "60"))
+
+# Maximum number of job IDs per query when loading the text of due messages
+TEXT_FETCH_CHUNK_SIZE = 1000
+
+# Seconds to wait before retrying due messages whose text could not be loaded
+TEXT_FETCH_RETRY_SECONDS = 5
+
 # Global instance of scheduler to prevent garbage collection
 _scheduler_instance = None
 
@@ -24,6 +95,12 @@ class MessageScheduler:
         """Initialize the scheduler and message store."""
         global _scheduler_instance
         
+        # Import locally to avoid circular imports
+        from database import init_database
+        
+        # The schema must exist before pending messages are loaded or claimed
+        init_database()
+        
         # Configure the scheduler with thread pool executor and job store
         job_stores = {
             'default': MemoryJobStore()
@@ -53,74 +130,320 @@ class MessageScheduler:
             self.scheduler.start()
             logger.info("Message scheduler started")
         
-        # We'll still keep an in-memory cache for quick access
-        self.messages = {}  
+        # Compact pending records by job_id, plus the job_ids pending for each user
+        self._pending = {}
+        self._user_jobs = {}
+        # End of the time horizon held in memory (None: every pending message is held);
+        # the lock keeps a refill and new messages from registering the same row twice
+        self.horizon_end = None
+        self._horizon_lock = threading.Lock()
+        # Local snapshot and journal of the pending schedule, for fast restarts
+        self.snapshots = None
+        # Bounded cache of the per-user lists shown by /list
+        self.list_cache = UserMessageCache()
+        self.recovery_stats = {}
+        # Pending/sent counts for /bot-status, reconciled with the database periodically
+        self.counters = MessageCounters()
         self.bot = None
         
-        # Initialize the bot
+        # Initialize the bot with a connection pool shared by all delivery workers
         token = os.environ.get("TELEGRAM_BOT_TOKEN")
         if token:
-            self.bot = Bot(token)
+            self.bot = Bot(
+                token,
+                base_url=f"{TELEGRAM_API_URL.rstrip('/')}/bot",
+                request=Request(con_pool_size=DELIVERY_WORKERS + 4)
+            )
             logger.info("Bot initialized for scheduler")
         else:
             logger.error("No TELEGRAM_BOT_TOKEN found in environment variables!")
+        
+        # New messages are inserted by group commit, sent confirmations are
+        # committed in batches by a write-behind queue
+        self.ingestor = GroupCommitIngestor()
+        self.ingestor.start()
+        # Claim-mode workers share the working directory, so each journals to its own file
+        journal_path = sent_journal_path(WORKER_ID if DISPATCH_MODE == 'claim' else None)
+        self.sent_writer = SentWriteBehind(journal_path)
+        self._sent_journal_lock = None
+        
+        # Message deliveries go through a single due-time dispatcher instead of
+        # one APScheduler job per message; APScheduler only runs maintenance jobs.
+        # Due messages are paced to Telegram's rate limits by the delivery engine.
+        self.delivery = self._create_delivery_engine(token)
+        self.delivery.start()
+        # Optionally hold due messages briefly so a chat's burst goes out as one message
+        self.coalescer = None
+        self.outbox = self.delivery
+        if COALESCE_WINDOW > 0:
+            self.coalescer = DeliveryCoalescer(self.delivery.submit, window=COALESCE_WINDOW)
+            self.coalescer.start()
+            self.outbox = self.coalescer
+        self.dispatcher = DueTimeDispatcher(self._dispatch_due_messages)
+        self.claimer = None
+        if DISPATCH_MODE == 'claim':
+            # Due rows are claimed from the database instead of held in memory,
+            # and only while the delivery stage has room for another batch
+            self.claimer = ClaimDispatcher(
+                self._deliver_claimed,
+                has_capacity=lambda: self._outbox_queued() < CLAIM_BATCH_SIZE
+            )
+        else:
+            self.dispatcher.start()
             
-        # Load any existing scheduled messages from the database
-        self._load_messages_from_db()
+        # Apply confirmations journaled by a previous run before loading pending
+        # messages, so anything already sent is not sent again; in claim mode
+        # that includes the journals of workers that have stopped
+        try:
+            if DISPATCH_MODE == 'claim':
+                self._sent_journal_lock = lock_sent_journal(journal_path)
+                replay_orphaned_sent_journals(own_path=journal_path)
+            replay_sent_journal(journal_path)
+        except Exception as e:
+            logger.error(f"Error replaying sent journal: {e}", exc_info=True)
+        self.sent_writer.start()
+        
+        self._register_gauges()
+        
+        # Load any existing scheduled messages from the database, or in claim
+        # mode start claiming due ones
+        if self.claimer:
+            self.claimer.start()
+        else:
+            if HORIZON_SECONDS > 0:
+                self.horizon_end = datetime.now() + timedelta(seconds=HORIZON_SECONDS)
+                if SNAPSHOT_PATH:
+                    logger.warning("SNAPSHOT_PATH is ignored when HORIZON_SECONDS is set")
+            elif SNAPSHOT_PATH:
+                self.snapshots = SnapshotStore(SNAPSHOT_PATH)
+            restored = self._restore_from_snapshot()
+            if not restored:
+                self._load_messages_from_db()
+            if self.horizon_end is not None:
+                self._schedule_horizon_refill()
+            if self.snapshots:
+                self.snapshots.open()
+                self._schedule_snapshots(restored)
         
         # Schedule regular database cleanup
         self._schedule_database_cleanup()
         
+        # Schedule regular reconciliation of the message counters
+        self._schedule_counter_reconciliation()
+        
+        # Log a periodic summary instead of dumping every job after each change
+        self._schedule_log_summary()
+        
+    def _register_gauges(self):
+        """Expose queue depths and delivery saturation on /metrics."""
+        Gauge('scheduler_pending_messages', 'Messages held in memory waiting for their delivery time',
+              lambda: len(self.dispatcher))
+        Gauge('scheduler_delivery_queued', 'Due messages waiting for the delivery engine',
+              lambda: self.delivery.queued())
+        Gauge('scheduler_coalescing_held', 'Due messages held to be combined with others for the same chat',
+              lambda: self.coalescer.queued() if self.coalescer else 0)
+        Gauge('scheduler_delivery_in_flight', 'Sends currently running',
+              lambda: self.delivery.in_flight())
+        Gauge('scheduler_delivery_saturation', 'Fraction of the delivery engine\'s send capacity in use',
+              lambda: self.delivery.in_flight() / self.delivery.capacity())
+        Gauge('scheduler_sent_unflushed', 'Sent confirmations not yet committed to the database',
+              lambda: self.sent_writer.pending())
+    
+    def _outbox_queued(self) -> int:
+        """Return the number of due messages not yet handed to a delivery worker."""
+        queued = self.delivery.queued()
+        if self.coalescer:
+            queued += self.coalescer.queued()
+        return queued
+    
+    def _create_delivery_engine(self, token: Optional[str]):
+        """Create the delivery engine selected by DELIVERY_ENGINE."""
+        if DELIVERY_ENGINE == 'async' and token:
+            # Imported lazily so aiohttp is only needed when the async engine is used
+            from async_delivery import AsyncDeliveryEngine
+            logger.info("Using async delivery engine")
+            return AsyncDeliveryEngine(token, self._mark_message_sent, on_failed=self._handle_send_failure,
+                                       api_url=TELEGRAM_API_URL)
+        return RateLimitedDelivery(self.send_scheduled_message, workers=DELIVERY_WORKERS)
+    
     def _load_messages_from_db(self):
-        """Load existing scheduled messages from the database and schedule them."""
+        """
+        Load existing scheduled messages from the database and schedule them.
+        
+        Pending rows are streamed in chunks of RECOVERY_CHUNK_SIZE and registered
+        with the dispatcher in bulk. Messages whose delivery time passed while the
+        bot was down are not dropped: they are queued for a catch-up pass that is
+        spread out at CATCHUP_RATE messages per second, oldest first.
+        
+        With a horizon only messages due before its end are loaded; the refill
+        job brings the rest in as they come near.
+        """
+        started = time.monotonic()
+        loaded = 0
+        overdue = []
         try:
             # Import locally to avoid circular imports
             from database import app
-            from models import ScheduledMessage
+            from models import db, ScheduledMessage
             
             with app.app_context():
-                # Get all pending messages
-                pending_messages = ScheduledMessage.query.filter_by(is_sent=False).all()
-                logger.info(f"Loading {len(pending_messages)} pending messages from database")
+                # Message text is not loaded; it is fetched when the message comes due
+                query = db.select(
+                    ScheduledMessage.job_id,
+                    ScheduledMessage.user_id,
+                    ScheduledMessage.delivery_time,
+                    ScheduledMessage.recurrence
+                ).where(
+                    ScheduledMessage.is_sent == False
+                )
+                if self.horizon_end is not None:
+                    query = query.where(ScheduledMessage.delivery_time <= self.horizon_end)
+                query = query.execution_options(yield_per=RECOVERY_CHUNK_SIZE)
                 
-                for msg in pending_messages:
-                    # Check if message is still in the future
-                    if msg.delivery_time > datetime.now():
-                        # Add to scheduler
-                        self.scheduler.add_job(
-                            self.send_scheduled_message,
-                            'date',
-                            run_date=msg.delivery_time,
-                            args=[msg.user_id, msg.text, msg.job_id],
-                            id=msg.job_id,
-                            replace_existing=True
-                        )
-                        
-                        # Add to in-memory cache
-                        if msg.user_id not in self.messages:
-                            self.messages[msg.user_id] = []
-                        
-                        self.messages[msg.user_id].append(msg.to_dict())
-                        
-                        logger.info(f"Re-scheduled message {msg.job_id} for user {msg.user_id} at {msg.delivery_time}")
-                    else:
-                        # Message delivery time has passed
-                        logger.warning(f"Message {msg.job_id} delivery time has passed: {msg.delivery_time}")
-                        
-                # Log the scheduled jobs
-                self._log_scheduled_jobs()
+                now = datetime.now()
+                result = db.session.execute(query)
+                for rows in result.partitions():
+                    batch = []
+                    for job_id, user_id, delivery_time, recurrence in rows:
+                        if delivery_time <= now:
+                            overdue.append((delivery_time, job_id))
+                        batch.append(PendingMessage(job_id, user_id, delivery_time.timestamp(), recurrence))
+                    loaded += self._register_messages(batch, now=now.timestamp())
+                    logger.debug(f"Recovered {loaded} pending messages so far")
                 
+                result.close()
         except Exception as e:
             logger.error(f"Error loading messages from database: {e}", exc_info=True)
+        
+        if overdue:
+            self._schedule_catch_up(overdue)
+        
+        duration = time.monotonic() - started
+        self.recovery_stats = {
+            'source': 'database',
+            'loaded_messages': loaded,
+            'overdue_messages': len(overdue),
+            'duration_seconds': round(duration, 3),
+            'horizon_end': self.horizon_end.isoformat() if self.horizon_end else None,
+            'completed_at': datetime.now().isoformat()
+        }
+        logger.info(
+            f"Startup recovery loaded {loaded} pending messages "
+            f"({len(overdue)} overdue) in {duration:.3f}s"
+        )
+        self._log_summary()
     
-    def schedule_message(self, user_id: int, text: str, delivery_time: datetime) -> bool:
+    def _restore_from_snapshot(self) -> bool:
+        """
+        Restore the pending messages from the local snapshot and its journal.
+        
+        Instead of every pending row, the database is only asked for rows
+        inserted since the snapshot was taken and for the pending count. If the
+        restored schedule does not add up to that count (e.g. a crash lost a
+        journal line) the snapshot is discarded and the caller loads everything
+        from the database. Overdue messages go to the catch-up pass as usual.
+        
+        Returns:
+            True if the schedule was restored from the snapshot
+        """
+        if not self.snapshots:
+            return False
+        
+        started = time.monotonic()
+        try:
+            restored = self.snapshots.load()
+            if restored is None:
+                return False
+            records, max_id = restored
+            
+            # Import locally to avoid circular imports
+            from database import app
+            from models import db, ScheduledMessage
+            
+            with app.app_context():
+                delta = db.session.execute(
+                    db.select(
+                        ScheduledMessage.job_id,
+                        ScheduledMessage.user_id,
+                        ScheduledMessage.delivery_time,
+                        ScheduledMessage.recurrence
+                    ).where(ScheduledMessage.id > max_id, ScheduledMessage.is_sent == False)
+                ).all()
+                expected = db.session.execute(
+                    db.select(db.func.count()).select_from(ScheduledMessage)
+                    .where(ScheduledMessage.is_sent == False)
+                ).scalar()
+        except (SnapshotError, OSError, ValueError) as e:
+            logger.error(f"Could not load the schedule snapshot, loading from the database: {e}")
+            self.snapshots.reset()
+            return False
+        except Exception as e:
+            logger.error(f"Error checking the schedule snapshot against the database: {e}", exc_info=True)
+            self.snapshots.reset()
+            return False
+        
+        for job_id, user_id, delivery_time, recurrence in delta:
+            records[job_id] = PendingMessage(job_id, user_id, delivery_time.timestamp(), recurrence)
+        if len(records) != expected:
+            logger.warning(
+                f"Schedule snapshot holds {len(records)} pending messages but the database {expected}, "
+                f"loading from the database"
+            )
+            self.snapshots.reset()
+            return False
+        
+        now = time.time()
+        batch = list(records.values())
+        overdue = [(record.delivery_time, record.job_id) for record in batch if record.due_ts <= now]
+        loaded = self._register_messages(batch, now=now)
+        if overdue:
+            self._schedule_catch_up(overdue)
+        
+        duration = time.monotonic() - started
+        self.recovery_stats = {
+            'source': 'snapshot',
+            'loaded_messages': loaded,
+            'delta_messages': len(delta),
+            'overdue_messages': len(overdue),
+            'duration_seconds': round(duration, 3),
+            'horizon_end': None,
+            'completed_at': datetime.now().isoformat()
+        }
+        logger.info(
+            f"Startup recovery restored {loaded} pending messages from the snapshot "
+            f"({len(delta)} new in the database, {len(overdue)} overdue) in {duration:.3f}s"
+        )
+        self._log_summary()
+        return True
+    
+    def _schedule_catch_up(self, overdue: List[tuple]) -> None:
+        """
+        Spread overdue messages out so they are sent at CATCHUP_RATE per second.
+        
+        Args:
+            overdue: List of (delivery_time, job_id) pairs for messages that are already due
+        """
+        overdue.sort()
+        start = time.time()
+        self.dispatcher.schedule_many(
+            (job_id, start + index / CATCHUP_RATE)
+            for index, (_, job_id) in enumerate(overdue)
+        )
+        logger.warning(
+            f"Catching up {len(overdue)} overdue messages over "
+            f"{len(overdue) / CATCHUP_RATE:.1f}s"
+        )
+    
+    def schedule_message(self, user_id: int, text: str, delivery_time: datetime,
+                         recurrence: Optional[str] = None) -> bool:
         """
         Schedule a message to be sent at the specified time.
         
         Args:
             user_id: The Telegram user ID of the recipient
             text: The message text
-            delivery_time: When to send the message
+            delivery_time: When to send the message (the first occurrence if recurring)
+            recurrence: Canonical recurrence rule (str() of a Recurrence) for a recurring message
         
         Returns:
             True if scheduled successfully, False otherwise
@@ -129,6 +452,7 @@ class MessageScheduler:
             logger.error("Bot not initialized, cannot schedule message")
             return False
         
+        started = time.perf_counter()
         try:
             # Create a unique job ID
             job_id = f"msg_{user_id}_{delivery_time.timestamp()}"
@@ -140,72 +464,261 @@ class MessageScheduler:
                 'text': text,
                 'scheduled_time': scheduled_time,
                 'delivery_time': delivery_time,
-                'job_id': job_id
+                'job_id': job_id,
+                'recurrence': recurrence
             }
             
-            # Store in our in-memory dictionary
-            if user_id not in self.messages:
-                self.messages[user_id] = []
-            self.messages[user_id].append(message_data)
-            
             # Log the scheduled message details
             logger.debug(f"Attempting to schedule message with job_id={job_id}, user_id={user_id}, delivery_time={delivery_time}")
             
-            # Schedule the job
-            job = self.scheduler.add_job(
-                self.send_scheduled_message,
-                'date',
-                run_date=delivery_time,
-                args=[user_id, text, job_id],
-                id=job_id,
-                replace_existing=True
-            )
-            
-            logger.info(f"Scheduled message for user {user_id} at {delivery_time}, job_id={job_id}, next_run_time={job.next_run_time}")
-            
-            # Store in the database
+            # Store in the database as part of the next group commit, and only
+            # confirm once that commit has succeeded
+            future = self.ingestor.submit(message_data)
             try:
-                # Import locally to avoid circular imports
-                from database import app
-                from models import db, ScheduledMessage
-                
-                with app.app_context():
-                    # Check if message with this job_id already exists
-                    existing = ScheduledMessage.query.filter_by(job_id=job_id).first()
-                    if not existing:
-                        # Create a new record
-                        message = ScheduledMessage(
-                            user_id=user_id,
-                            text=text,
-                            scheduled_time=scheduled_time,
-                            delivery_time=delivery_time,
-                            job_id=job_id,
-                            is_sent=False
-                        )
-                        db.session.add(message)
-                        db.session.commit()
-                        logger.info(f"Stored message {job_id} in database with ID {message.id}")
-                    else:
-                        logger.warning(f"Message with job_id {job_id} already exists in database")
+                inserted = future.result(timeout=INGEST_TIMEOUT)
+            except FuturesTimeoutError:
+                logger.error(f"Timed out storing message {job_id} in database")
+                FAILURES.inc('schedule')
+                if not self.ingestor.withdraw(future):
+                    # Its commit is already running and may still store the row;
+                    # register it if it does, so it is not left undelivered
+                    logger.warning(f"Message {job_id} is still being committed and is scheduled if that succeeds")
+                    future.add_done_callback(lambda done: self._on_late_commit(done, message_data))
+                return False
             except Exception as db_error:
                 logger.error(f"Error storing message in database: {db_error}", exc_info=True)
-                # Continue even if DB storage fails - the in-memory scheduling still works
+                FAILURES.inc('schedule')
+                return False
             
-            # Log all scheduled jobs
-            self._log_scheduled_jobs()
+            self._on_stored(message_data, inserted)
+            
+            logger.info(f"Scheduled message for user {user_id} at {delivery_time}, job_id={job_id}")
             
             return True
             
         except Exception as e:
             logger.error(f"Error scheduling message: {e}", exc_info=True)
+            FAILURES.inc('schedule')
             return False
+        finally:
+            SCHEDULE_LATENCY.observe(time.perf_counter() - started)
+    
+    def _on_stored(self, message_data: Dict[str, Any], inserted: bool) -> None:
+        """
+        Schedule a message whose row the group commit has stored.
+        
+        Args:
+            message_data: The message data dictionary
+            inserted: False if the job_id already existed
+        """
+        job_id = message_data['job_id']
+        user_id = message_data['user_id']
+        if inserted:
+            logger.debug(f"Stored message {job_id} in database")
+            self.counters.scheduled()
+        else:
+            logger.warning(f"Message with job_id {job_id} already exists in database")
+        
+        # Store in our in-memory dictionary and hand it to the dispatcher;
+        # in claim mode the row is picked up from the database when due,
+        # and beyond the horizon it is loaded by a later refill
+        if self.claimer:
+            self.list_cache.invalidate(user_id)
+        else:
+            with self._horizon_lock:
+                if self._within_horizon(message_data['delivery_time']):
+                    self._register_message(message_data)
+                else:
+                    self.list_cache.invalidate(user_id)
+    
+    def _on_late_commit(self, future: Future, message_data: Dict[str, Any]) -> None:
+        """Schedule a message whose commit finished after schedule_message gave up on it."""
+        if future.cancelled() or future.exception() is not None:
+            return
+        try:
+            self._on_stored(message_data, future.result())
+            logger.info(f"Scheduled message {message_data['job_id']} after its commit finished late")
+        except Exception as e:
+            logger.error(f"Error scheduling late-committed message {message_data['job_id']}: {e}", exc_info=True)
+    
+    def schedule_messages_bulk(self, rows: List[Dict[str, Any]]) -> Set[str]:
+        """
+        Store and schedule a batch of messages with one INSERT and one commit.
+        
+        Used for bulk loads, where rows already arrive in batches, so they skip
+        the group-commit queue. Rows whose job_id already exists are left alone.
+        
+        Args:
+            rows: Message data dictionaries (user_id, text, scheduled_time,
+                delivery_time, job_id and optionally recurrence)
+        
+        Returns:
+            The job_ids that were inserted
+        
+        Raises:
+            Exception: If the insert or commit fails; nothing is scheduled then
+        """
+        # Import locally to avoid circular imports
+        from database import app
+        from models import db
+        
+        started = time.perf_counter()
+        with app.app_context():
+            try:
+                inserted = insert_scheduled_messages(rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                FAILURES.inc('db_commit')
+                raise
+        DB_COMMIT_LATENCY.observe(time.perf_counter() - started, 'bulk')
+        
+        new_rows = [row for row in rows if row['job_id'] in inserted]
+        self.counters.scheduled(len(new_rows))
+        for user_id in {row['user_id'] for row in new_rows}:
+            self.list_cache.invalidate(user_id)
+        if not self.claimer:
+            with self._horizon_lock:
+                batch = [
+                    PendingMessage.from_message_data(row) for row in new_rows
+                    if self._within_horizon(row['delivery_time'])
+                ]
+                self._register_messages(batch)
+            if self.snapshots:
+                self.snapshots.journal_scheduled(batch)
+        return inserted
+    
+    def _within_horizon(self, delivery_time: datetime) -> bool:
+        """Return True if a message due at delivery_time belongs in memory now."""
+        return self.horizon_end is None or delivery_time <= self.horizon_end
     
-    def _log_scheduled_jobs(self):
-        """Log all scheduled jobs for debugging purposes."""
-        jobs = self.scheduler.get_jobs()
-        logger.info(f"Current scheduled jobs ({len(jobs)}):")
-        for job in jobs:
-            logger.info(f"  Job ID: {job.id}, Next run: {job.next_run_time}")
+    def _register_message(self, message_data: Dict[str, Any]) -> None:
+        """
+        Add a pending message to the in-memory store and the dispatcher.
+        
+        Only a compact PendingMessage record is kept; the text stays in the database.
+        
+        Args:
+            message_data: The message data dictionary
+        """
+        record = PendingMessage.from_message_data(message_data)
+        job_id = record.job_id
+        user_id = record.user_id
+        
+        # Replace any existing entry with the same job_id
+        if job_id in self._pending:
+            self.remove_scheduled_message(self._pending[job_id].user_id, job_id)
+        
+        self._user_jobs.setdefault(user_id, set()).add(job_id)
+        self._pending[job_id] = record
+        self.list_cache.invalidate(user_id)
+        
+        self.dispatcher.schedule(job_id, record.due_ts)
+        if self.snapshots:
+            self.snapshots.journal_scheduled([record])
+    
+    def _register_messages(self, batch: List[PendingMessage], now: Optional[float] = None) -> int:
+        """
+        Add a batch of pending messages to the in-memory store and the dispatcher.
+        
+        Unlike _register_message this does not check for an existing entry, so it
+        is meant for records known to be new: the startup load into an empty store,
+        or rows a bulk insert just created. Messages that are already due
+        at ``now`` are stored but left for the caller to hand to the dispatcher.
+        
+        Args:
+            batch: The pending message records
+            now: Messages due at or before this Unix timestamp are not given to the dispatcher
+        
+        Returns:
+            The number of messages registered
+        """
+        entries = []
+        for record in batch:
+            self._user_jobs.setdefault(record.user_id, set()).add(record.job_id)
+            self._pending[record.job_id] = record
+            if now is None or record.due_ts > now:
+                entries.append((record.job_id, record.due_ts))
+        
+        self.dispatcher.schedule_many(entries)
+        return len(batch)
+    
+    def _fetch_texts(self, job_ids: List[str]) -> Dict[str, str]:
+        """
+        Load the text of a batch of messages from the database.
+        
+        Args:
+            job_ids: The IDs of the jobs
+        
+        Returns:
+            Mapping of job_id to message text (missing if the row no longer exists)
+        """
+        # Import locally to avoid circular imports
+        from database import app
+        from models import db, ScheduledMessage
+        
+        texts = {}
+        with app.app_context():
+            for start in range(0, len(job_ids), TEXT_FETCH_CHUNK_SIZE):
+                chunk = job_ids[start:start + TEXT_FETCH_CHUNK_SIZE]
+                texts.update(db.session.execute(
+                    db.select(ScheduledMessage.job_id, ScheduledMessage.text)
+                    .where(ScheduledMessage.job_id.in_(chunk))
+                ).all())
+        return texts
+    
+    def _dispatch_due_messages(self, job_ids: List[str]) -> None:
+        """
+        Fetch the text of due messages and hand them to the delivery stage.
+        
+        Args:
+            job_ids: The IDs of the jobs that are due
+        """
+        # A single lookup per job: a concurrent removal between a membership
+        # test and the read would raise and strand the whole popped batch
+        due = [record for record in map(self._pending.get, job_ids) if record is not None]
+        if not due:
+            return
+        
+        try:
+            texts = self._fetch_texts([record.job_id for record in due])
+        except Exception as e:
+            # Put the batch back so it is retried on a later tick
+            logger.error(f"Error loading text for {len(due)} due messages, retrying: {e}", exc_info=True)
+            FAILURES.inc('text_fetch')
+            retry_at = time.time() + TEXT_FETCH_RETRY_SECONDS
+            self.dispatcher.schedule_many((record.job_id, retry_at) for record in due)
+            return
+        
+        for record in due:
+            text = texts.get(record.job_id)
+            if text is None:
+                logger.warning(f"Due message {record.job_id} no longer in database, dropping it")
+                self.remove_scheduled_message(record.user_id, record.job_id)
+                continue
+            self.outbox.submit(record.user_id, text, record.job_id)
+    
+    def _deliver_claimed(self, claimed: List[ClaimedMessage]) -> None:
+        """
+        Hand messages claimed from the database to the delivery stage.
+        
+        Args:
+            claimed: (job_id, user_id, text, delivery_time) of each claimed message
+        """
+        for job_id, user_id, text, delivery_time, recurrence in claimed:
+            # Kept until the send is confirmed, for the delivery lag metric and recurrence
+            self._pending[job_id] = PendingMessage(job_id, user_id, delivery_time.timestamp(), recurrence)
+            self.outbox.submit(user_id, text, job_id)
+    
+    def _log_summary(self):
+        """Log one summary line of the scheduler's state; the cost does not grow with pending jobs."""
+        next_due = self.dispatcher.next_due()
+        next_run = datetime.fromtimestamp(next_due) if next_due is not None else None
+        logger.info(
+            f"Pending messages: {len(self.dispatcher)}, next delivery: {next_run}, "
+            f"delivery queued: {self._outbox_queued()}, in flight: {self.delivery.in_flight()}, "
+            f"unflushed sent: {self.sent_writer.pending()}"
+        )
     
     def send_scheduled_message(self, user_id: int, text: str, job_id: str) -> None:
         """
@@ -214,53 +727,279 @@ class MessageScheduler:
         Args:
             user_id: The Telegram user ID of the recipient
             text: The message text to send
-            job_id: The ID of the scheduled job
+            job_id: The ID of the scheduled job, or of a coalesced group
+        
+        Raises:
+            RetryAfter: If Telegram rate-limited the send; the delivery stage requeues it
         """
         try:
-            logger.info(f"Attempting to send scheduled message to user {user_id}, job_id={job_id}")
+            logger.debug(f"Attempting to send scheduled message to user {user_id}, job_id={job_id}")
             
             if not self.bot:
                 logger.error("Bot not initialized, cannot send message")
                 return
             
-            # Ensure we have the latest bot instance
-            token = os.environ.get("TELEGRAM_BOT_TOKEN")
-            if token:
-                self.bot = Bot(token)
-            
             # Send the message
-            result = self.bot.send_message(
-                chat_id=user_id,
-                text=f"🔔 *Scheduled Message Reminder*\n\n{text}",
-                parse_mode=ParseMode.MARKDOWN
-            )
+            started = time.perf_counter()
+            try:
+                result = self.bot.send_message(
+                    chat_id=user_id,
+                    text=format_reminder(text),
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            finally:
+                SEND_LATENCY.observe(time.perf_counter() - started)
             
             logger.info(f"Successfully sent scheduled message to user {user_id}, message_id={result.message_id}")
             
-            # Update the database to mark the message as sent
+        except RetryAfter:
+            FAILURES.inc('retry_after')
+            raise
+        except Exception as e:
+            logger.error(f"Error sending scheduled message: {e}", exc_info=True)
+            FAILURES.inc('send')
+            self._handle_send_failure(user_id, job_id, str(e) or type(e).__name__, is_permanent_error(e))
+            return
+        
+        # The message was delivered, so a bookkeeping error must not retry it
+        try:
+            self._mark_message_sent(user_id, job_id)
+        except Exception as e:
+            logger.error(f"Error recording delivered message {job_id}: {e}", exc_info=True)
+            FAILURES.inc('sent_bookkeeping')
+    
+    def _mark_message_sent(self, user_id: int, job_id: str) -> None:
+        """
+        Record a successful delivery and drop it from the store.
+        
+        The database update is batched by the write-behind queue. A coalesced
+        group stands for several messages, which are all recorded together.
+        
+        Args:
+            user_id: The Telegram user ID of the recipient
+            job_id: The ID of the scheduled job, or of a coalesced group
+        """
+        sent_at = datetime.now()
+        job_ids = self.coalescer.take_group(job_id) if self.coalescer else [job_id]
+        sent = []
+        for member in job_ids:
+            record = self._pending.get(member)
+            if record is not None:
+                DELIVERY_LAG.observe(max(0.0, sent_at.timestamp() - record.due_ts))
+                if record.recurrence and self._schedule_next_occurrence(record, sent_at):
+                    continue
+            sent.append(member)
+        if not sent:
+            return
+        
+        self.sent_writer.record_many(sent, sent_at)
+        self.counters.delivered(len(sent))
+        
+        # Remove the messages from our store
+        for member in sent:
+            self.remove_scheduled_message(user_id, member)
+    
+    def _handle_send_failure(self, user_id: int, job_id: str, reason: str, permanent: bool) -> None:
+        """
+        Retry a failed delivery later, or give up on it.
+        
+        A message's failed attempts are counted on its row. Until it has failed
+        RETRY_MAX_ATTEMPTS times it is handed back to the dispatcher (in claim
+        mode: released until then) with a jittered exponential backoff, so no
+        worker waits for the retry. A message that fails permanently (e.g. the
+        user blocked the bot) or runs out of attempts is moved to the
+        dead-letter table with the error; a recurring one that ran out of
+        attempts moves on to its next occurrence instead of stopping. A
+        coalesced group that fails permanently is split up, since one bad
+        member (e.g. unparsable Markdown) can fail the whole combined message.
+        
+        Args:
+            user_id: The Telegram user ID of the recipient
+            job_id: The ID of the scheduled job, or of a coalesced group
+            reason: The error
+            permanent: True if retrying cannot help
+        """
+        job_ids = self.coalescer.take_group(job_id) if self.coalescer else [job_id]
+        if permanent and len(job_ids) > 1:
+            self._send_separately(user_id, job_ids, reason)
+            return
+        for member in job_ids:
             try:
-                # Import locally to avoid circular imports
-                from database import app
-                from models import db, ScheduledMessage
-                
-                with app.app_context():
-                    # Find the message in the database
-                    message = ScheduledMessage.query.filter_by(job_id=job_id).first()
-                    if message:
-                        message.is_sent = True
-                        message.sent_at = datetime.now()
-                        db.session.commit()
-                        logger.info(f"Updated message {job_id} in database as sent")
-                    else:
-                        logger.warning(f"Message with job_id {job_id} not found in database")
-            except Exception as db_error:
-                logger.error(f"Error updating message in database: {db_error}", exc_info=True)
+                self._retry_or_dead_letter(member, reason, permanent)
+            except Exception as e:
+                logger.error(f"Error handling failed delivery of {member}: {e}", exc_info=True)
+                FAILURES.inc('retry')
+                if not self.claimer and member in self._pending:
+                    # Try again later rather than leave it stuck in memory;
+                    # in claim mode the lease runs out and it is claimed again
+                    self.dispatcher.schedule(member, time.time() + retry_delay(1))
+    
+    def _send_separately(self, user_id: int, job_ids: List[str], reason: str) -> None:
+        """
+        Send the members of a permanently failed group one by one.
+        
+        They go straight to the delivery engine, past the coalescer, so only a
+        member that fails on its own is retried or moved to the dead letters.
+        
+        Args:
+            user_id: The Telegram user ID of the recipient
+            job_ids: The group's member job IDs
+            reason: The group's error
+        """
+        members = [member for member in job_ids if member in self._pending]
+        logger.warning(f"Combined message of {len(members)} failed permanently, sending them separately: {reason}")
+        try:
+            texts = self._fetch_texts(members)
+        except Exception as e:
+            logger.error(f"Error loading text to resend {len(members)} messages separately: {e}", exc_info=True)
+            FAILURES.inc('text_fetch')
+            # Not the members' own failure, so retry them as a transient one
+            for member in members:
+                self._handle_send_failure(user_id, member, reason, False)
+            return
+        for member in members:
+            text = texts.get(member)
+            if text is None:
+                self.remove_scheduled_message(user_id, member)
+                continue
+            self.delivery.submit(user_id, text, member)
+    
+    def _retry_or_dead_letter(self, job_id: str, reason: str, permanent: bool) -> None:
+        """Count a failed attempt on one message and reschedule it or move it to the dead letters."""
+        record = self._pending.get(job_id)
+        if record is None:
+            # Cancelled while it was being sent
+            return
+        
+        attempts = record_failed_attempt(job_id)
+        if attempts is not None and not permanent and attempts < RETRY_MAX_ATTEMPTS:
+            delay = retry_delay(attempts)
+            if self.claimer:
+                postpone_claim(job_id, datetime.now() + timedelta(seconds=delay))
+                self._pending.pop(job_id, None)
+            else:
+                self.dispatcher.schedule(job_id, time.time() + delay)
+            self.counters.retried()
+            DELIVERY_RETRIES.inc()
+            logger.warning(f"Delivery of {job_id} failed (attempt {attempts}), retrying in {delay:.0f}s: {reason}")
+            return
+        
+        # A recurring message that can still be delivered keeps its row for the next occurrence
+        moves_on = bool(record.recurrence) and not permanent
+        if attempts is not None and move_to_dead_letters(job_id, reason, keep_row=moves_on):
+            DEAD_LETTERS.inc('permanent' if permanent else 'exhausted')
+            logger.error(
+                f"Moved {job_id} to dead letters after {attempts} attempt(s) "
+                f"({'permanent error' if permanent else 'out of attempts'}): {reason}"
+            )
+            if moves_on and self._schedule_next_occurrence(record, datetime.now()):
+                self.counters.dead_lettered(pending=False)
+                return
+            if moves_on:
+                # The rule is invalid, so the row has no next occurrence to move on to
+                self.cancel_message(record.user_id, job_id)
+                self.counters.dead_lettered(pending=False)
+                return
+            self.counters.dead_lettered()
+        
+        # Gone from the database (cancelled meanwhile) or moved to the dead letters
+        self.list_cache.invalidate(record.user_id)
+        if self.claimer:
+            self._pending.pop(job_id, None)
+        else:
+            self.remove_scheduled_message(record.user_id, job_id)
+    
+    def _schedule_next_occurrence(self, record: PendingMessage, sent_at: datetime) -> bool:
+        """
+        Move a recurring message's row on to its next occurrence.
+        
+        The row stays pending with the next delivery time, so a rule costs one
+        row and one dispatcher entry however often it fires.
+        
+        Args:
+            record: The pending record of the message that was just sent
+            sent_at: When it was sent
+        
+        Returns:
+            True if the next occurrence was scheduled, False if the rule is invalid
+            (the message is then treated as sent)
+        """
+        rule = parse_recurrence(record.recurrence)
+        if rule is None:
+            logger.error(f"Invalid recurrence {record.recurrence!r} on job {record.job_id}, not repeating it")
+            return False
+        next_time = rule.next_after(record.delivery_time, sent_at)
+        
+        try:
+            # Import locally to avoid circular imports
+            from database import app
+            from models import db, ScheduledMessage
             
-            # Remove the message from our store
-            self.remove_scheduled_message(user_id, job_id)
+            with app.app_context():
+                db.session.execute(
+                    db.update(ScheduledMessage)
+                    .where(ScheduledMessage.job_id == record.job_id)
+                    .values(delivery_time=next_time, sent_at=sent_at, attempts=None,
+                            claimed_by=None, lease_expires_at=None)
+                )
+                db.session.commit()
+        except Exception as e:
+            # The row keeps the occurrence just sent, so it may be sent again after a restart
+            logger.error(f"Error storing next occurrence of {record.job_id}: {e}", exc_info=True)
+            FAILURES.inc('recurrence')
+        
+        self.list_cache.invalidate(record.user_id)
+        if self.claimer:
+            # Claimed again from the database when the next occurrence is due
+            self._pending.pop(record.job_id, None)
+        else:
+            with self._horizon_lock:
+                if self._within_horizon(next_time):
+                    record.due_ts = next_time.timestamp()
+                    self.dispatcher.schedule(record.job_id, record.due_ts)
+                    if self.snapshots:
+                        self.snapshots.journal_scheduled([record])
+                else:
+                    # Loaded again by a horizon refill when the next occurrence comes near
+                    self.remove_scheduled_message(record.user_id, record.job_id)
+        logger.debug(f"Next occurrence of {record.job_id} at {next_time}")
+        return True
+    
+    def cancel_message(self, user_id: int, job_id: str) -> bool:
+        """
+        Delete a user's pending (one-off or recurring) message.
+        
+        Args:
+            user_id: The Telegram user ID of the owner
+            job_id: The ID of the scheduled job
+        
+        Returns:
+            True if a pending message was deleted, False otherwise
+        """
+        try:
+            # Import locally to avoid circular imports
+            from database import app
+            from models import db, ScheduledMessage
             
+            with app.app_context():
+                deleted = db.session.execute(
+                    db.delete(ScheduledMessage).where(
+                        ScheduledMessage.job_id == job_id,
+                        ScheduledMessage.user_id == user_id,
+                        ScheduledMessage.is_sent == False
+                    )
+                ).rowcount
+                db.session.commit()
         except Exception as e:
-            logger.error(f"Error sending scheduled message: {e}", exc_info=True)
+            logger.error(f"Error cancelling message {job_id}: {e}", exc_info=True)
+            return False
+        
+        self.remove_scheduled_message(user_id, job_id)
+        self.list_cache.invalidate(user_id)
+        if deleted:
+            self.counters.deleted(pending=deleted)
+            logger.info(f"Cancelled message {job_id} for user {user_id}")
+        return bool(deleted)
     
     def remove_scheduled_message(self, user_id: int, job_id: str) -> bool:
         """
@@ -274,27 +1013,24 @@ class MessageScheduler:
             True if removed successfully, False otherwise
         """
         try:
-            # Remove from scheduler if it exists
-            try:
-                self.scheduler.remove_job(job_id)
-                logger.info(f"Removed job {job_id} from scheduler")
-            except Exception as e:
-                logger.debug(f"Job {job_id} already removed from scheduler: {e}")
+            # Remove from the dispatcher if it is still pending
+            if self.dispatcher.cancel(job_id):
+                logger.debug(f"Removed job {job_id} from dispatcher")
+            else:
+                logger.debug(f"Job {job_id} already removed from dispatcher")
+            if self._pending.pop(job_id, None) is not None and self.snapshots:
+                self.snapshots.journal_removed([job_id])
+            self.list_cache.invalidate(user_id)
             
-            # Remove from our store
-            if user_id in self.messages:
-                original_count = len(self.messages[user_id])
-                self.messages[user_id] = [
-                    msg for msg in self.messages[user_id] 
-                    if msg['job_id'] != job_id
-                ]
-                new_count = len(self.messages[user_id])
-                
-                if original_count != new_count:
-                    logger.info(f"Removed message {job_id} from store for user {user_id}")
-                    return True
-                else:
-                    logger.debug(f"No message found with job_id {job_id} for user {user_id}")
+            # Remove from our store, dropping the user once they have nothing pending
+            user_jobs = self._user_jobs.get(user_id)
+            if user_jobs and job_id in user_jobs:
+                user_jobs.discard(job_id)
+                if not user_jobs:
+                    self._user_jobs.pop(user_id, None)
+                logger.debug(f"Removed message {job_id} from store for user {user_id}")
+                return True
+            logger.debug(f"No message found with job_id {job_id} for user {user_id}")
             return False
         except Exception as e:
             logger.error(f"Error removing scheduled message: {e}", exc_info=True)
@@ -303,61 +1039,229 @@ class MessageScheduler:
     def _schedule_database_cleanup(self):
         """Schedule a periodic task to clean up old messages from the database."""
         try:
-            # Schedule the cleanup job to run every day at midnight
+            # Schedule the cleanup job to run every RETENTION_INTERVAL_HOURS (daily by default)
             self.scheduler.add_job(
                 self._cleanup_old_messages,
                 'interval',
-                days=1,
+                hours=RETENTION_INTERVAL_HOURS,
                 id='db_cleanup_job',
                 replace_existing=True,
                 next_run_time=datetime.now()  # Run once immediately, then on schedule
             )
-            logger.info("Scheduled database cleanup job to run daily")
+            logger.info(f"Scheduled database cleanup job to run every {RETENTION_INTERVAL_HOURS}h")
         except Exception as e:
             logger.error(f"Error scheduling database cleanup: {e}", exc_info=True)
     
-    def _cleanup_old_messages(self):
-        """Remove messages older than one week from the database."""
+    def _schedule_counter_reconciliation(self):
+        """Schedule a periodic task to reconcile the message counters with the database."""
+        try:
+            self.scheduler.add_job(
+                self._reconcile_counters,
+                'interval',
+                seconds=COUNTER_RECONCILE_INTERVAL,
+                id='counter_reconcile_job',
+                replace_existing=True,
+                next_run_time=datetime.now()  # Run once immediately, then on schedule
+            )
+            logger.info(f"Scheduled counter reconciliation every {COUNTER_RECONCILE_INTERVAL}s")
+        except Exception as e:
+            logger.error(f"Error scheduling counter reconciliation: {e}", exc_info=True)
+    
+    def _schedule_horizon_refill(self):
+        """Schedule the periodic task that moves the horizon forward."""
+        interval = HORIZON_REFILL_INTERVAL
+        if interval >= HORIZON_SECONDS:
+            interval = HORIZON_SECONDS / 2
+            logger.warning(
+                f"HORIZON_REFILL_INTERVAL must be shorter than HORIZON_SECONDS, refilling every {interval}s"
+            )
+        try:
+            self.scheduler.add_job(
+                self._refill_horizon,
+                'interval',
+                seconds=interval,
+                id='horizon_refill_job',
+                replace_existing=True,
+                max_instances=1
+            )
+            logger.info(f"Holding messages due in the next {HORIZON_SECONDS}s, refilling every {interval}s")
+        except Exception as e:
+            logger.error(f"Error scheduling horizon refill: {e}", exc_info=True)
+    
+    def _refill_horizon(self) -> int:
+        """
+        Move the horizon forward and load the messages that now fall inside it.
+        
+        Pending rows due between the old and the new end of the horizon are read
+        through the pending-by-delivery-time index in chunks of RECOVERY_CHUNK_SIZE.
+        The end is moved before the query runs, so a message scheduled meanwhile
+        is either registered by schedule_message or already committed and
+        returned here; rows that are already held are skipped.
+        
+        Returns:
+            The number of messages loaded
+        """
+        with self._horizon_lock:
+            start = self.horizon_end
+            end = self.horizon_end = datetime.now() + timedelta(seconds=HORIZON_SECONDS)
+        
+        loaded = 0
         try:
             # Import locally to avoid circular imports
             from database import app
             from models import db, ScheduledMessage
             
             with app.app_context():
-                # Calculate the cutoff date (one week ago)
-                one_week_ago = datetime.now() - timedelta(days=7)
-                
-                # Find all messages that were sent more than a week ago
-                old_messages = ScheduledMessage.query.filter(
-                    ScheduledMessage.is_sent == True,
-                    ScheduledMessage.sent_at <= one_week_ago
-                ).all()
+                result = db.session.execute(
+                    db.select(
+                        ScheduledMessage.job_id,
+                        ScheduledMessage.user_id,
+                        ScheduledMessage.delivery_time,
+                        ScheduledMessage.recurrence
+                    ).where(
+                        ScheduledMessage.is_sent == False,
+                        ScheduledMessage.delivery_time > start,
+                        ScheduledMessage.delivery_time <= end
+                    ).execution_options(yield_per=RECOVERY_CHUNK_SIZE)
+                )
+                for rows in result.partitions():
+                    with self._horizon_lock:
+                        # Sent ones whose confirmation is not committed yet are skipped too
+                        loaded += self._register_messages([
+                            PendingMessage(job_id, user_id, delivery_time.timestamp(), recurrence)
+                            for job_id, user_id, delivery_time, recurrence in rows
+                            if job_id not in self._pending and not self.sent_writer.is_unflushed(job_id)
+                        ])
+                result.close()
+        except Exception as e:
+            logger.error(f"Error refilling the horizon, retrying from {start}: {e}", exc_info=True)
+            FAILURES.inc('horizon_refill')
+            # Rows already loaded are skipped when the same slice is read again
+            with self._horizon_lock:
+                self.horizon_end = start
+            return loaded
+        
+        if loaded:
+            logger.info(f"Horizon refill loaded {loaded} messages due by {end}")
+        return loaded
+    
+    def _schedule_snapshots(self, restored: bool):
+        """
+        Schedule periodic snapshots of the pending schedule, and one at exit.
+        
+        Args:
+            restored: Whether the schedule came from the snapshot; if it was
+                loaded from the database, a snapshot is written right away
+        """
+        job_options = {}
+        if not restored:
+            job_options['next_run_time'] = datetime.now()
+        try:
+            self.scheduler.add_job(
+                self._write_snapshot,
+                'interval',
+                seconds=SNAPSHOT_INTERVAL,
+                id='snapshot_job',
+                replace_existing=True,
+                max_instances=1,
+                **job_options
+            )
+            # After a clean shutdown the next start has no journal to replay
+            atexit.register(self._write_snapshot)
+            logger.info(f"Scheduled schedule snapshots to {SNAPSHOT_PATH} every {SNAPSHOT_INTERVAL}s")
+        except Exception as e:
+            logger.error(f"Error scheduling schedule snapshots: {e}", exc_info=True)
+    
+    def _write_snapshot(self):
+        """Write a snapshot of the pending schedule and start a new journal."""
+        try:
+            # Import locally to avoid circular imports
+            from database import app
+            from models import db, ScheduledMessage
+            
+            # Read before the schedule is captured: rows above it are checked
+            # against the database on the next start
+            with app.app_context():
+                max_id = db.session.execute(db.select(db.func.max(ScheduledMessage.id))).scalar() or 0
+            
+            started = time.perf_counter()
+            written = self.snapshots.write(lambda: list(self._pending.values()), max_id)
+            logger.info(f"Wrote schedule snapshot of {written} pending messages in {time.perf_counter() - started:.3f}s")
+        except Exception as e:
+            logger.error(f"Error writing schedule snapshot: {e}", exc_info=True)
+            FAILURES.inc('snapshot')
+    
+    def _schedule_log_summary(self):
+        """Schedule the periodic summary log line."""
+        try:
+            self.scheduler.add_job(
+                self._log_summary,
+                'interval',
+                seconds=LOG_SUMMARY_INTERVAL,
+                id='log_summary_job',
+                replace_existing=True
+            )
+            logger.info(f"Scheduled summary logging every {LOG_SUMMARY_INTERVAL}s")
+        except Exception as e:
+            logger.error(f"Error scheduling summary logging: {e}", exc_info=True)
+    
+    def _reconcile_counters(self):
+        """Reset the pending/sent counters from the database with a single grouped count."""
+        try:
+            # Import locally to avoid circular imports
+            from database import app
+            from models import db, ScheduledMessage
+            
+            with app.app_context():
+                counts = dict(db.session.execute(
+                    db.select(ScheduledMessage.is_sent, db.func.count())
+                    .group_by(ScheduledMessage.is_sent)
+                ).all())
+            
+            # Confirmations still buffered by the write-behind queue are already
+            # sent but not yet committed
+            unflushed = self.sent_writer.pending()
+            self.counters.reconcile(
+                pending=counts.get(False, 0) - unflushed,
+                sent=counts.get(True, 0) + unflushed,
+                dead_letters=count_dead_letters()
+            )
+        except Exception as e:
+            logger.error(f"Error reconciling message counters: {e}", exc_info=True)
+    
+    def _cleanup_old_messages(self):
+        """
+        Remove old messages from the database.
+        
+        Sent messages older than RETENTION_SENT_DAYS and unsent messages whose
+        delivery time is more than RETENTION_UNSENT_DAYS in the past are deleted
+        in bounded chunks (and archived first if RETENTION_ARCHIVE_DIR is set).
+        """
+        try:
+            # Import locally to avoid circular imports
+            from database import app
+            from models import ScheduledMessage
+            
+            with app.app_context():
+                now = datetime.now()
                 
-                if old_messages:
-                    # Delete the old messages
-                    count = len(old_messages)
-                    for message in old_messages:
-                        db.session.delete(message)
-                    
-                    db.session.commit()
-                    logger.info(f"Deleted {count} old messages from the database")
-                else:
+                # Messages that were sent before the retention window
+                count = purge_in_chunks(
+                    (ScheduledMessage.is_sent == True)
+                    & (ScheduledMessage.sent_at <= now - timedelta(days=RETENTION_SENT_DAYS)),
+                    'sent'
+                )
+                self.counters.deleted(sent=count)
+                if not count:
                     logger.info("No old messages to clean up")
                 
                 # Also clean up failed messages with passed delivery time
-                failed_messages = ScheduledMessage.query.filter(
-                    ScheduledMessage.is_sent == False,
-                    ScheduledMessage.delivery_time <= one_week_ago
-                ).all()
-                
-                if failed_messages:
-                    # Delete the failed messages
-                    count = len(failed_messages)
-                    for message in failed_messages:
-                        db.session.delete(message)
-                    
-                    db.session.commit()
-                    logger.info(f"Deleted {count} failed/expired messages from the database")
+                count = purge_in_chunks(
+                    (ScheduledMessage.is_sent == False)
+                    & (ScheduledMessage.delivery_time <= now - timedelta(days=RETENTION_UNSENT_DAYS)),
+                    'expired'
+                )
+                self.counters.deleted(pending=count)
         except Exception as e:
             logger.error(f"Error cleaning up old messages: {e}", exc_info=True)
     
@@ -365,14 +1269,23 @@ class MessageScheduler:
         """
         Get all scheduled messages for a user.
         
+        Served from the list cache when possible; the database is only
+        queried on a miss.
+        
         Args:
             user_id: The Telegram user ID
         
         Returns:
             A list of message data dictionaries
         """
+        messages = self.list_cache.get(user_id)
+        if messages is not None:
+            logger.debug(f"Retrieved {len(messages)} scheduled messages for user {user_id} from cache")
+            return messages
+        
+        # Taken before loading, so a change made meanwhile keeps the list out of the cache
+        generation = self.list_cache.generation()
         try:
-            # Try to get messages from the database first
             from database import app
             from models import ScheduledMessage
             
@@ -383,20 +1296,30 @@ class MessageScheduler:
                     is_sent=False
                 ).order_by(ScheduledMessage.delivery_time.asc()).all()
                 
-                if db_messages:
-                    # Convert to dictionary format
-                    messages = [msg.to_dict() for msg in db_messages]
-                    logger.info(f"Retrieved {len(messages)} scheduled messages for user {user_id} from database")
-                    return messages
-                else:
-                    # Fall back to in-memory cache if no DB messages found
-                    logger.debug(f"No scheduled messages found in database for user {user_id}, using in-memory cache")
+                # Skip messages already sent whose confirmation is not committed yet
+                messages = [
+                    msg.to_dict() for msg in db_messages
+                    if not self.sent_writer.is_unflushed(msg.job_id)
+                ]
+            logger.info(f"Retrieved {len(messages)} scheduled messages for user {user_id} from database")
+            self.list_cache.put(user_id, messages, generation)
+            return messages
         except Exception as e:
             logger.error(f"Error retrieving messages from database: {e}", exc_info=True)
             logger.debug("Falling back to in-memory message store")
         
-        # Fall back to in-memory cache
-        messages = self.messages.get(user_id, [])
-        logger.debug(f"Retrieved {len(messages)} scheduled messages for user {user_id} from in-memory cache")
+        # Fall back to the in-memory store, which does not hold message text
+        records = sorted(
+            (record for record in map(self._pending.get, list(self._user_jobs.get(user_id, ()))) if record is not None),
+            key=lambda record: record.due_ts
+        )
+        messages = [{
+            'user_id': record.user_id,
+            'job_id': record.job_id,
+            'delivery_time': record.delivery_time,
+            'text': "(message text unavailable)",
+            'recurrence': record.recurrence
+        } for record in records]
+        logger.debug(f"Retrieved {len(messages)} scheduled messages for user {user_id} from in-memory store")
         
         return messages
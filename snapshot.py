@@ -0,0 +1,275 @@
+import gc
+import glob
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+from pending import PendingMessage
+from logging_setup import configure_logging
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Snapshot of the pending schedule, with its journal at <path>.journal; empty disables it
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", "")
+
+# Seconds between snapshots; the journal only holds the events since the last one
+SNAPSHOT_INTERVAL = int(os.environ.get("SNAPSHOT_INTERVAL", "300"))
+
+SNAPSHOT_MAGIC = b"DESNAP\x00\x01"
+SNAPSHOT_VERSION = 1
+
+# magic, version, record count, string table size, database max(id) when taken,
+# time taken, CRC32 of the records, CRC32 of the string table; then a CRC32 of all that
+HEADER = struct.Struct('<8sIQQQdII')
+HEADER_CRC = struct.Struct('<I')
+HEADER_SIZE = HEADER.size + HEADER_CRC.size
+
+# due_ts, user_id, offset of the job ID in the string table, job ID length, recurrence length
+# (the recurrence follows the job ID); offsets and lengths count characters of the decoded table
+RECORD = struct.Struct('<dqIHH')
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing parts or fails its checksums."""
+
+def _checksummed(line: str) -> str:
+    return f"{line}\t{zlib.crc32(line.encode('utf-8')):08x}\n"
+
+class SnapshotStore:
+    """
+    Local snapshot and append-only journal of the pending schedule.
+
+    The snapshot is a flat binary file: a checksummed header, one fixed-size
+    record per pending message, sorted by due time, and a table holding the
+    job IDs and recurrence rules. It is read through mmap without parsing
+    anything but the records. Every change to the schedule after the snapshot
+    (a message registered or moved to its next occurrence, or removed) is
+    appended to the journal as one checksummed line.
+
+    On start the scheduler loads the snapshot, replays the journal over it and
+    only asks the database for rows inserted since the snapshot and for the
+    pending count; write() replaces the snapshot and starts a new journal.
+
+    Journal lines are flushed to the OS as they are written, like the sent
+    journal; a torn or corrupt line (a crash mid-write) is skipped, and the
+    scheduler's count check against the database catches what it missed.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        """
+        Initialize the store.
+
+        Args:
+            path: Path of the snapshot file
+        """
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self._journal = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.written_count = 0
+
+    def open(self) -> None:
+        """Open the journal for appending; events before this are not journaled."""
+        with self._lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def close(self) -> None:
+        """Close the journal."""
+        with self._lock:
+            if self._journal:
+                self._journal.close()
+                self._journal = None
+
+    def reset(self) -> None:
+        """Delete the snapshot and its journals, e.g. once they are found out of date."""
+        with self._lock:
+            if self._journal:
+                self._journal.close()
+                self._journal = None
+            for path in [self.path] + self._journal_files():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _journal_files(self) -> List[str]:
+        """Return the journals to replay, oldest first: a rotated one left by a crash, then the current one."""
+        paths = sorted(glob.glob(f"{glob.escape(self.journal_path)}.*"))
+        if os.path.exists(self.journal_path):
+            paths.append(self.journal_path)
+        return paths
+
+    def _append(self, text: str) -> None:
+        with self._lock:
+            if self._journal:
+                self._journal.write(text)
+                self._journal.flush()
+
+    def journal_scheduled(self, records: Iterable[PendingMessage]) -> None:
+        """
+        Journal messages registered or moved to a new due time.
+
+        Args:
+            records: The messages' pending records
+        """
+        self._append("".join(
+            _checksummed(f"S\t{record.job_id}\t{record.user_id}\t{record.due_ts!r}\t{record.recurrence or ''}")
+            for record in records
+        ))
+
+    def journal_removed(self, job_ids: Iterable[str]) -> None:
+        """
+        Journal messages removed from the schedule (sent, cancelled or dropped).
+
+        Args:
+            job_ids: The IDs of the jobs
+        """
+        self._append("".join(_checksummed(f"R\t{job_id}") for job_id in job_ids))
+
+    def write(self, capture, max_id: int) -> int:
+        """
+        Replace the snapshot with the current schedule and start a new journal.
+
+        The journal is rotated and the schedule captured under the journal's
+        lock, so every change is either in the snapshot or in the new journal.
+        Changes must therefore be applied before they are journaled. The
+        rotated journal is deleted once the new snapshot is in place; if the
+        process dies first, it is replayed over the previous snapshot instead.
+
+        Args:
+            capture: Callable returning the pending records
+            max_id: The largest scheduled_messages.id, read before capturing
+
+        Returns:
+            The number of records written
+        """
+        with self._write_lock:
+            return self._write(capture, max_id)
+
+    def _write(self, capture, max_id: int) -> int:
+        with self._lock:
+            if self._journal:
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+                self._journal.close()
+                os.replace(self.journal_path, f"{self.journal_path}.{time.time_ns()}")
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            # Including any left by a crash, which the new snapshot supersedes too
+            rotated = self._journal_files()[:-1] if self._journal else self._journal_files()
+            records = capture()
+
+        records.sort(key=lambda record: record.due_ts)
+        body = bytearray(RECORD.size * len(records))
+        parts = []
+        offset = 0
+        for index, record in enumerate(records):
+            recurrence = record.recurrence or ""
+            RECORD.pack_into(body, index * RECORD.size, record.due_ts, record.user_id,
+                             offset, len(record.job_id), len(recurrence))
+            parts.append(record.job_id)
+            parts.append(recurrence)
+            offset += len(record.job_id) + len(recurrence)
+        strings = "".join(parts).encode('utf-8')
+
+        header = HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(records), len(strings), max_id,
+                             time.time(), zlib.crc32(body), zlib.crc32(strings))
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'wb') as snapshot:
+            snapshot.write(header)
+            snapshot.write(HEADER_CRC.pack(zlib.crc32(header)))
+            snapshot.write(body)
+            snapshot.write(strings)
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(temporary, self.path)
+
+        for path in rotated:
+            os.remove(path)
+        self.written_count += 1
+        return len(records)
+
+    def load(self) -> Optional[Tuple[Dict[str, PendingMessage], int]]:
+        """
+        Load the snapshot and replay the journal over it.
+
+        Returns:
+            (pending records by job_id, the database max(id) when the snapshot
+            was taken), or None if there is no snapshot
+
+        Raises:
+            SnapshotError: If the snapshot is truncated or fails its checksums
+        """
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, 'rb') as snapshot:
+            size = os.fstat(snapshot.fileno()).st_size
+            if size < HEADER_SIZE:
+                raise SnapshotError(f"{self.path} is truncated")
+            with mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    records, max_id = self._read(view, size)
+                finally:
+                    view.release()
+
+        replayed = self._replay(records)
+        logger.info(f"Loaded {len(records)} pending messages from snapshot ({replayed} journal events)")
+        return records, max_id
+
+    def _read(self, view: memoryview, size: int) -> Tuple[Dict[str, PendingMessage], int]:
+        magic, version, count, strings_size, max_id, _, body_crc, strings_crc = HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise SnapshotError(f"{self.path} is not a version {SNAPSHOT_VERSION} snapshot")
+        if HEADER_CRC.unpack_from(view, HEADER.size)[0] != zlib.crc32(view[:HEADER.size]):
+            raise SnapshotError(f"{self.path} has a corrupt header")
+        body_end = HEADER_SIZE + count * RECORD.size
+        if size != body_end + strings_size:
+            raise SnapshotError(f"{self.path} is truncated")
+
+        records = {}
+        # The slices must be released before the mapping is closed
+        with view[HEADER_SIZE:body_end] as body, view[body_end:] as strings:
+            if zlib.crc32(body) != body_crc or zlib.crc32(strings) != strings_crc:
+                raise SnapshotError(f"{self.path} fails its checksum")
+            text = str(strings, 'utf-8')
+            # The records hold no reference cycles; collecting while millions are
+            # created would only rescan them
+            collecting = gc.isenabled()
+            gc.disable()
+            try:
+                for due_ts, user_id, offset, job_id_length, recurrence_length in RECORD.iter_unpack(body):
+                    end = offset + job_id_length
+                    job_id = text[offset:end]
+                    records[job_id] = PendingMessage(job_id, user_id, due_ts,
+                                                     text[end:end + recurrence_length] if recurrence_length else None)
+            finally:
+                if collecting:
+                    gc.enable()
+        return records, max_id
+
+    def _replay(self, records: Dict[str, PendingMessage]) -> int:
+        """Apply the journaled events to the snapshot's records; return how many were applied."""
+        replayed = 0
+        for path in self._journal_files():
+            with open(path, encoding='utf-8', errors='replace') as journal:
+                for line in journal:
+                    payload, _, crc = line.rstrip('\n').rpartition('\t')
+                    if not payload or crc != f"{zlib.crc32(payload.encode('utf-8')):08x}":
+                        logger.warning(f"Skipping corrupt snapshot journal line in {path}: {line!r}")
+                        continue
+                    fields = payload.split('\t')
+                    if fields[0] == 'S':
+                        job_id, user_id, due_ts, recurrence = fields[1:]
+                        records[job_id] = PendingMessage(job_id, int(user_id), float(due_ts), recurrence or None)
+                    elif fields[0] == 'R':
+                        records.pop(fields[1], None)
+                    replayed += 1
+        return replayed
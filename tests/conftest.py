@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the repository root, like the benchmarks import them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings are read at import, so they are set before any test imports the app
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/tests.db")
+os.environ["SENT_JOURNAL_PATH"] = ""
+os.environ["BULK_API_TOKEN"] = "test-token"
@@ -0,0 +1,51 @@
+"""
+HTTP-level tests for POST /api/messages/bulk.
+"""
+import json
+
+import pytest
+
+import main
+
+class FakeScheduler:
+    """Stores nothing; reports every row it is given as inserted."""
+
+    def __init__(self):
+        self.rows = []
+
+    def schedule_messages_bulk(self, rows):
+        self.rows.extend(rows)
+        return {row['job_id'] for row in rows}
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    fake = FakeScheduler()
+    # Serve requests without starting the bot and the real scheduler
+    monkeypatch.setattr(main, 'start_services', lambda: None)
+    monkeypatch.setattr(main, 'is_ready', lambda: True)
+    monkeypatch.setattr(main.telegram_bot, 'get_scheduler', lambda: fake)
+    return fake
+
+def post(lines):
+    client = main.app.test_client()
+    response = client.post('/api/messages/bulk', data="".join(json.dumps(line) + "\n" for line in lines),
+                           headers={'Authorization': 'Bearer test-token'})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+def test_rows_with_unusable_times_get_an_error_line_each(scheduler):
+    results = post([
+        {'user_id': 1, 'text': "before", 'time': "2h"},
+        {'user_id': 1, 'text': "February 31", 'time': "cron 0 0 31 2 *"},
+        {'user_id': 1, 'text': "too far", 'time': "99999999999999d"},
+        {'user_id': 1, 'text': "out of range", 'delivery_time': "0001-01-01T00:00:00+14:00"},
+        {'user_id': 1, 'text': "after", 'time': "daily 9am"},
+    ])
+    assert [result.get('status') for result in results[:-1]] == ['scheduled', 'error', 'error', 'error', 'scheduled']
+    assert results[-1] == {'summary': {'received': 5, 'scheduled': 2, 'duplicate': 0, 'error': 3}}
+    assert [row['text'] for row in scheduler.rows] == ["before", "after"]
+
+def test_requires_the_bearer_token(scheduler):
+    response = main.app.test_client().post('/api/messages/bulk', data="",
+                                           headers={'Authorization': 'Bearer wrong'})
+    assert response.status_code == 403
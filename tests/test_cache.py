@@ -0,0 +1,45 @@
+"""
+Tests for the /list cache's invalidation race and its text-size bound.
+"""
+from cache import UserMessageCache
+
+def message(job_id, text="hello"):
+    return {'job_id': job_id, 'text': text}
+
+def test_list_loaded_before_an_invalidation_is_not_cached():
+    cache = UserMessageCache()
+    generation = cache.generation()
+    stale = [message('a')]
+    # A message is scheduled while the list is being loaded
+    cache.invalidate(1)
+    cache.put(1, stale, generation)
+    assert cache.get(1) is None
+
+    cache.put(1, [message('a'), message('b')], cache.generation())
+    assert len(cache.get(1)) == 2
+
+def test_other_users_invalidations_do_not_block_a_put():
+    cache = UserMessageCache()
+    generation = cache.generation()
+    cache.invalidate(2)
+    cache.put(1, [message('a')], generation)
+    assert cache.get(1) is not None
+
+def test_forgotten_invalidations_still_block_older_puts():
+    cache = UserMessageCache(max_users=2)
+    generation = cache.generation()
+    for user_id in (1, 2, 3):
+        cache.invalidate(user_id)
+    # User 1's invalidation was dropped from the bounded history
+    cache.put(1, [message('a')], generation)
+    assert cache.get(1) is None
+
+def test_text_size_is_bounded():
+    cache = UserMessageCache(max_chars=100)
+    cache.put(1, [message('a', "x" * 60)])
+    cache.put(2, [message('b', "y" * 60)])
+    assert cache.get(1) is None
+    assert cache.get(2) is not None
+    cache.put(3, [message('c', "z" * 101)])
+    assert cache.get(3) is None
+    assert cache.stats()['message_chars'] == 60
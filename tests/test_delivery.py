@@ -0,0 +1,89 @@
+"""
+Tests that a RetryAfter from Telegram pauses every chat, not only the one that hit it.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from telegram.error import RetryAfter
+
+from async_delivery import AsyncDeliveryEngine
+from delivery import RateLimitedDelivery
+
+RETRY_AFTER = 1
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_threaded_delivery_pauses_other_chats_after_retry_after():
+    sent = {}
+    limited_at = []
+
+    def send(user_id, text, job_id):
+        if user_id == 1 and not limited_at:
+            limited_at.append(time.monotonic())
+            raise RetryAfter(RETRY_AFTER)
+        sent[user_id] = time.monotonic()
+
+    delivery = RateLimitedDelivery(send, workers=4, global_rate=100, chat_rate=100)
+    delivery.start()
+    delivery.submit(1, "first", "job_1")
+    assert wait_for(lambda: limited_at)
+    for user_id in (2, 3, 4):
+        delivery.submit(user_id, "other chat", f"job_{user_id}")
+    assert wait_for(lambda: len(sent) == 4)
+    delivery.stop()
+
+    for user_id in (2, 3, 4):
+        assert sent[user_id] - limited_at[0] >= RETRY_AFTER * 0.9
+
+@pytest.fixture
+def flood_limited_api():
+    """A Bot API that answers the first sendMessage with 429 and records the others."""
+    sent = {}
+    limited_at = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            params = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            if not limited_at:
+                limited_at.append(time.monotonic())
+                body = {'ok': False, 'error_code': 429, 'description': "Too Many Requests",
+                        'parameters': {'retry_after': RETRY_AFTER}}
+            else:
+                sent[params['chat_id']] = time.monotonic()
+                body = {'ok': True, 'result': {'message_id': 1}}
+            payload = json.dumps(body).encode()
+            self.send_response(200 if body['ok'] else 429)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", sent, limited_at
+    server.shutdown()
+
+def test_async_delivery_pauses_other_chats_after_retry_after(flood_limited_api):
+    api_url, sent, limited_at = flood_limited_api
+    engine = AsyncDeliveryEngine("123456:test", lambda user_id, job_id: None, api_url=api_url,
+                                 global_rate=100, chat_rate=100)
+    engine.start()
+    engine.submit(1, "first", "job_1")
+    assert wait_for(lambda: limited_at)
+    for user_id in (2, 3, 4):
+        engine.submit(user_id, "other chat", f"job_{user_id}")
+    assert wait_for(lambda: len(sent) == 4)
+    engine.stop()
+
+    for user_id in (2, 3, 4):
+        assert sent[user_id] - limited_at[0] >= RETRY_AFTER * 0.9
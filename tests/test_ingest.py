@@ -0,0 +1,70 @@
+"""
+Tests that a schedule request which times out on a slow commit is not left behind.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import ingest
+import scheduler
+from database import app, init_database
+from models import db, ScheduledMessage
+
+@pytest.fixture
+def slow_commit(monkeypatch):
+    """Make group commits wait until the returned event is set."""
+    release = threading.Event()
+    insert = ingest.insert_scheduled_messages
+
+    def slow_insert(rows):
+        release.wait(10)
+        return insert(rows)
+
+    monkeypatch.setattr(ingest, 'insert_scheduled_messages', slow_insert)
+    monkeypatch.setattr(scheduler, 'INGEST_TIMEOUT', 0.2)
+    yield release
+    release.set()
+
+@pytest.fixture
+def message_scheduler(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "123456:test")
+    init_database()
+    return scheduler.MessageScheduler()
+
+def stored(job_id):
+    with app.app_context():
+        return db.session.execute(
+            db.select(db.func.count()).select_from(ScheduledMessage).where(ScheduledMessage.job_id == job_id)
+        ).scalar()
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+def test_queued_row_is_withdrawn_on_timeout(message_scheduler, slow_commit):
+    delivery_time = datetime.now() + timedelta(days=1)
+    # The first request holds the committer, so the second one stays queued
+    first = threading.Thread(target=message_scheduler.schedule_message, args=(101, "first", delivery_time))
+    first.start()
+    time.sleep(0.05)
+    assert message_scheduler.schedule_message(102, "second", delivery_time) is False
+
+    slow_commit.set()
+    first.join()
+    job_id = f"msg_102_{delivery_time.timestamp()}"
+    assert stored(job_id) == 0
+    assert job_id not in message_scheduler._pending
+
+def test_row_committed_after_a_timeout_is_scheduled(message_scheduler, slow_commit):
+    delivery_time = datetime.now() + timedelta(days=1, minutes=1)
+    job_id = f"msg_103_{delivery_time.timestamp()}"
+    assert message_scheduler.schedule_message(103, "late", delivery_time) is False
+
+    slow_commit.set()
+    assert wait_for(lambda: job_id in message_scheduler._pending)
+    assert stored(job_id) == 1
+    assert message_scheduler.dispatcher.next_due() is not None
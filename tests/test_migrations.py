@@ -0,0 +1,23 @@
+"""
+Checks that every hot query is served by an index after the migrations run.
+"""
+import pytest
+
+from database import app, init_database
+from migrations import check_hot_query_plans, hot_queries
+from models import db
+
+@pytest.fixture(scope='module')
+def plans():
+    # Creates the schema and applies every migration to the test database
+    init_database()
+    with app.app_context():
+        return check_hot_query_plans(db.engine)
+
+def test_every_hot_query_is_checked(plans):
+    assert set(plans) == set(hot_queries())
+
+@pytest.mark.parametrize('name', sorted(hot_queries()))
+def test_hot_query_uses_an_index(plans, name):
+    indexed, plan = plans[name]
+    assert indexed, f"{name} scans the table:\n{plan}"
@@ -0,0 +1,37 @@
+"""
+Tests for recurrence rules that can never fire.
+"""
+from datetime import datetime
+
+import pytest
+
+from recurrence import parse_recurrence
+from timespec import parse_time_specification
+
+@pytest.mark.parametrize('spec', ["cron 0 0 31 2 *", "cron 0 0 30 2 *", "cron 0 0 31 4,6,9,11 *",
+                                  "interval 0", "every 99999999999999 weeks"])
+def test_rules_that_never_fire_are_rejected(spec):
+    assert parse_recurrence(spec) is None
+
+@pytest.mark.parametrize('spec', ["cron 0 0 29 2 *", "cron 0 0 31 2 1", "cron */15 9-17 * * 1-5",
+                                  "every 2h", "daily 9am", "interval 3600"])
+def test_rules_that_fire_have_a_next_occurrence(spec):
+    now = datetime(2026, 3, 4, 10, 15)
+    assert parse_recurrence(spec).next_after(now, now) > now
+
+@pytest.mark.parametrize('spec', ["monday 8:30", "mon 9am", "friday noon", "day 9am", "weekday 8:30"])
+def test_bare_days_are_one_off_times(spec):
+    assert parse_recurrence(spec) is None
+
+@pytest.mark.parametrize('spec', ["monday 8:30", "mon 9am", "friday noon"])
+def test_bare_weekdays_are_parsed_by_timespec(spec):
+    now = datetime(2026, 3, 4, 10, 15)
+    assert parse_time_specification(spec, now) > now
+
+@pytest.mark.parametrize('spec, rule', [
+    ("every monday 8:30", "cron 30 8 * * 1"), ("every day 9am", "cron 0 9 * * *"),
+    ("daily 9am", "cron 0 9 * * *"), ("weekdays 8:30", "cron 30 8 * * 1-5"),
+    ("weekends 10am", "cron 0 10 * * 0,6"), ("every mon, thu 18:00", "cron 0 18 * * 1,4"),
+])
+def test_repeating_day_specs(spec, rule):
+    assert str(parse_recurrence(spec)) == rule
@@ -0,0 +1,93 @@
+"""
+Equivalence and property tests for timespec against the parser bot.py used before it.
+"""
+import random
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+from timespec import parse_time_specification
+
+NOW = datetime(2026, 3, 4, 10, 15, 30)
+
+# Spellings the original parser understood, by seconds per unit
+SPELLINGS = {
+    86400: ['d', 'day', 'days'],
+    3600: ['h', 'hr', 'hour', 'hours'],
+    60: ['m', 'min', 'minute', 'minutes'],
+    1: ['s', 'sec', 'second', 'seconds'],
+}
+
+def legacy_parse(time_spec, now):
+    """The parser bot.py used before timespec, with an explicit now."""
+    minutes_pattern = re.compile(r'(\d+)\s*(?:m|min|minute|minutes)', re.IGNORECASE)
+    hours_pattern = re.compile(r'(\d+)\s*(?:h|hr|hour|hours)', re.IGNORECASE)
+    days_pattern = re.compile(r'(\d+)\s*(?:d|day|days)', re.IGNORECASE)
+    seconds_pattern = re.compile(r'(\d+)\s*(?:s|sec|second|seconds)', re.IGNORECASE)
+    total_seconds = 0
+    for pattern, factor in ((minutes_pattern, 60), (hours_pattern, 3600),
+                            (days_pattern, 86400), (seconds_pattern, 1)):
+        match = pattern.search(time_spec)
+        if match:
+            total_seconds += int(match.group(1)) * factor
+    if total_seconds > 0:
+        return now + timedelta(seconds=total_seconds)
+    return None
+
+def random_duration_spec(rng):
+    """A spec of distinct units in random order, spelling, case and spacing."""
+    units = rng.sample(sorted(SPELLINGS), rng.randint(1, len(SPELLINGS)))
+    parts = []
+    for unit in units:
+        spelling = rng.choice(SPELLINGS[unit])
+        spelling = spelling.upper() if rng.random() < 0.2 else spelling
+        parts.append(f"{rng.randint(1, 999)}{rng.choice(['', ' '])}{spelling}")
+    return rng.choice(['', ' ', ', ', ' and ']).join(parts)
+
+@pytest.mark.parametrize('spec', [
+    "5m", "2h", "1d", "30s", "30 seconds", "2 hours", "90 minutes",
+    "1h 30m", "1h30m", "1d2h", "1d 2h 3m 4s", "1d2h3m4s", "3 hours 15 mins",
+])
+def test_matches_legacy_parser(spec):
+    assert parse_time_specification(spec, NOW) == legacy_parse(spec, NOW)
+
+def test_random_duration_specs_match_legacy_parser():
+    rng = random.Random(12)
+    for _ in range(2000):
+        spec = random_duration_spec(rng)
+        assert parse_time_specification(spec, NOW) == legacy_parse(spec, NOW), spec
+
+def test_durations_are_order_independent():
+    rng = random.Random(34)
+    for _ in range(500):
+        parts = random_duration_spec(rng).split(' and ')
+        rng.shuffle(parts)
+        reordered = ' and '.join(parts)
+        assert parse_time_specification(reordered, NOW) == parse_time_specification(' and '.join(sorted(parts)), NOW)
+
+def test_results_are_in_the_future_or_none():
+    rng = random.Random(56)
+    for _ in range(500):
+        spec = random_duration_spec(rng)
+        result = parse_time_specification(spec, NOW)
+        assert result is None or result > NOW
+
+@pytest.mark.parametrize('spec', ["99999999999999d", "99999999999999999999w", "9999-12-31 23:59 + 2d"])
+def test_out_of_range_specs_are_rejected(spec):
+    assert parse_time_specification(spec, NOW) is None
+
+@pytest.mark.parametrize('spec', ["", "soon", "5mx", "1 month", "0m", "25:00", "13pm"])
+def test_invalid_specs_are_rejected(spec):
+    assert parse_time_specification(spec, NOW) is None
+
+@pytest.mark.parametrize('spec, expected', [
+    ("tomorrow 9am", datetime(2026, 3, 5, 9, 0)),
+    ("14:30", datetime(2026, 3, 4, 14, 30)),
+    ("9am", datetime(2026, 3, 5, 9, 0)),
+    ("2026-11-01 09:00", datetime(2026, 11, 1, 9, 0)),
+    ("tomorrow 9am + 30m", datetime(2026, 3, 5, 9, 30)),
+    ("next fri", datetime(2026, 3, 6, 10, 15, 30)),
+])
+def test_absolute_times(spec, expected):
+    assert parse_time_specification(spec, NOW) == expected
@@ -0,0 +1,51 @@
+"""
+Tests for the per-worker sent journals of claim mode.
+"""
+from datetime import datetime
+
+import pytest
+
+import write_behind
+from write_behind import (
+    SentWriteBehind, lock_sent_journal, replay_orphaned_sent_journals, sent_journal_path
+)
+
+@pytest.fixture
+def committed(monkeypatch):
+    records = []
+    monkeypatch.setattr(write_behind, 'mark_sent_in_db', records.extend)
+    return records
+
+def start_worker(base_path, worker_id):
+    journal_path = sent_journal_path(worker_id, base_path)
+    lock = lock_sent_journal(journal_path)
+    writer = SentWriteBehind(journal_path, interval=3600)
+    writer.start()
+    return journal_path, lock, writer
+
+def test_live_workers_journals_are_left_alone(tmp_path, committed):
+    base_path = str(tmp_path / 'sent_journal.log')
+    journal_path, lock, writer = start_worker(base_path, 'host:1')
+    writer.record('job_1', datetime.now())
+
+    assert replay_orphaned_sent_journals(base_path, own_path=sent_journal_path('host:2', base_path)) == 0
+    assert committed == []
+    # The live worker can still rotate and flush its journal
+    assert writer.flush() == 1
+    writer.stop()
+    lock.close()
+
+def test_journal_of_a_stopped_worker_is_adopted_once(tmp_path, committed):
+    base_path = str(tmp_path / 'sent_journal.log')
+    journal_path, lock, writer = start_worker(base_path, 'host:1')
+    writer.record('job_1', datetime.now())
+    # The worker dies without flushing, leaving the journal; the OS releases its lock
+    writer._buffer.clear()
+    writer.stop()
+    lock.close()
+
+    own_path = sent_journal_path('host:2', base_path)
+    assert replay_orphaned_sent_journals(base_path, own_path=own_path) == 1
+    assert [job_id for job_id, _ in committed] == ['job_1']
+    assert list(tmp_path.iterdir()) == []
+    assert replay_orphaned_sent_journals(base_path, own_path=own_path) == 0
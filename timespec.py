@@ -0,0 +1,173 @@
+"""
+Parser for the time specifications users send when scheduling a message.
+
+Supported forms (case-insensitive, combinable):
+    5m, 2 hours, 1d 3h 30m       relative durations; repeated units are summed
+    9am, 14:30, 9:15pm, noon     a time of day (today, or tomorrow if already past)
+    tomorrow 9am, today 18:00    a day word with an optional time of day
+    monday 8:30, next fri        the next such weekday, with an optional time
+    2026-11-01, 2026-11-01 09:00 an ISO date with an optional time
+    tomorrow 9am + 30m           an absolute time shifted by durations
+
+Durations may be written without spaces ("1h30m", "1d2h"). Filler words such
+as "in", "at", "on", "and" and "from now" are ignored. The
+input is scanned once with a single regular expression compiled at import, and
+the parsed form of each spec is memoized, so repeated specs like "1h" only pay
+for applying the result to the current time.
+"""
+import re
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Optional, Tuple
+
+# Seconds per duration unit, keyed by the first letter of the unit
+UNIT_SECONDS = {'w': 604800, 'd': 86400, 'h': 3600, 'm': 60, 's': 1}
+
+WEEKDAYS = {
+    'mon': 0, 'monday': 0,
+    'tue': 1, 'tues': 1, 'tuesday': 1,
+    'wed': 2, 'weds': 2, 'wednesday': 2,
+    'thu': 3, 'thur': 3, 'thurs': 3, 'thursday': 3,
+    'fri': 4, 'friday': 4,
+    'sat': 5, 'saturday': 5,
+    'sun': 6, 'sunday': 6,
+}
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<date>\d{4}-\d{2}-\d{2})(?:[t\s]+(?=\d))?
+      | (?P<clock_h>\d{1,2})(?::(?P<clock_m>\d{2}))?\s*(?P<ampm>am|pm)\b
+      | (?P<hm_h>\d{1,2}):(?P<hm_m>\d{2})\b
+      | (?P<amount>\d+)\s*(?P<unit>
+            w|wks?|weeks?|d|days?|h|hrs?|hours?|m|mins?|minutes?|s|secs?|seconds?
+        )(?![a-z])
+      | (?P<named_time>noon|midnight)\b
+      | (?P<day>today|tomorrow|tmrw|tmr)\b
+      | (?P<weekday>(?:mon|tue|wed|thu|fri|sat|sun)[a-z]*)\b
+      | (?P<filler>in|at|on|and|next|this|from\s+now|later|[,+])
+    )
+""", re.IGNORECASE | re.VERBOSE)
+
+# (duration_seconds, day_kind, day_value, time_of_day)
+#   day_kind is None, 'offset' (days from today), 'weekday' (0=Monday) or 'date'
+Plan = Tuple[int, Optional[str], object, Optional[time]]
+
+@lru_cache(maxsize=2048)
+def _compile_spec(spec: str) -> Optional[Plan]:
+    """Tokenize a normalized spec into a plan, or None if it is not understood."""
+    seconds = 0
+    day_kind = None
+    day_value = None
+    time_of_day = None
+    matched_anything = False
+
+    position = 0
+    end = len(spec)
+    while position < end:
+        match = _TOKEN_RE.match(spec, position)
+        if not match or match.end() == position:
+            if spec[position:].strip():
+                return None
+            break
+        position = match.end()
+        kind = match.lastgroup
+
+        if kind == 'filler':
+            continue
+        matched_anything = True
+
+        if kind == 'amount' or kind == 'unit':
+            seconds += int(match.group('amount')) * UNIT_SECONDS[match.group('unit')[0].lower()]
+        elif kind in ('clock_h', 'clock_m', 'ampm'):
+            hour = int(match.group('clock_h'))
+            minute = int(match.group('clock_m') or 0)
+            if not 1 <= hour <= 12 or minute > 59 or time_of_day is not None:
+                return None
+            hour = hour % 12 + (12 if match.group('ampm').lower() == 'pm' else 0)
+            time_of_day = time(hour, minute)
+        elif kind in ('hm_h', 'hm_m'):
+            hour = int(match.group('hm_h'))
+            minute = int(match.group('hm_m'))
+            if hour > 23 or minute > 59 or time_of_day is not None:
+                return None
+            time_of_day = time(hour, minute)
+        elif kind == 'named_time':
+            if time_of_day is not None:
+                return None
+            time_of_day = time(12, 0) if match.group('named_time').lower() == 'noon' else time(0, 0)
+        elif kind == 'day':
+            if day_kind is not None:
+                return None
+            day_kind = 'offset'
+            day_value = 0 if match.group('day').lower() == 'today' else 1
+        elif kind == 'weekday':
+            weekday = WEEKDAYS.get(match.group('weekday').lower())
+            if weekday is None or day_kind is not None:
+                return None
+            day_kind = 'weekday'
+            day_value = weekday
+        elif kind == 'date':
+            if day_kind is not None:
+                return None
+            try:
+                day_value = date.fromisoformat(match.group('date'))
+            except ValueError:
+                return None
+            day_kind = 'date'
+
+    if not matched_anything:
+        return None
+    return seconds, day_kind, day_value, time_of_day
+
+def parse_time_specification(time_spec: str, now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Parse a time specification into the delivery time.
+
+    Args:
+        time_spec: The user's time specification (see the module docstring)
+        now: The current time (defaults to datetime.now())
+
+    Returns:
+        The delivery time, or None if the spec is not understood or not in the future
+    """
+    if not time_spec:
+        return None
+    plan = _compile_spec(time_spec.strip().lower())
+    if plan is None:
+        return None
+    seconds, day_kind, day_value, time_of_day = plan
+
+    if now is None:
+        now = datetime.now()
+
+    try:
+        return _apply_plan(seconds, day_kind, day_value, time_of_day, now)
+    except OverflowError:
+        # A count too large for a datetime, e.g. "99999999999999d"
+        return None
+
+def _apply_plan(seconds: int, day_kind: Optional[str], day_value: object,
+                time_of_day: Optional[time], now: datetime) -> Optional[datetime]:
+    """Turn a parsed plan into the delivery time relative to now."""
+    if day_kind is None and time_of_day is None:
+        # Purely relative
+        return now + timedelta(seconds=seconds) if seconds > 0 else None
+
+    clock = time_of_day or now.time()
+    if day_kind == 'offset':
+        target = datetime.combine(now.date() + timedelta(days=day_value), clock)
+    elif day_kind == 'weekday':
+        days_ahead = (day_value - now.weekday()) % 7
+        target = datetime.combine(now.date() + timedelta(days=days_ahead), clock)
+        if target <= now:
+            target += timedelta(days=7)
+    elif day_kind == 'date':
+        target = datetime.combine(day_value, clock)
+    else:
+        # A bare time of day: today, or tomorrow if it has already passed
+        target = datetime.combine(now.date(), clock)
+        if target <= now:
+            target += timedelta(days=1)
+
+    target += timedelta(seconds=seconds)
+    return target if target > now else None
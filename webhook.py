@@ -0,0 +1,129 @@
+"""
+Webhook ingestion of Telegram updates.
+
+In webhook mode Telegram POSTs each update to the web app instead of the bot
+long-polling getUpdates from a thread inside the web process. The route only
+parses the update and puts it on a bounded queue; a fixed pool of worker
+threads runs the handlers. Updates are routed to workers by chat, so one
+user's updates are still handled in order (the scheduling conversation
+depends on it) while different chats are handled in parallel. Telegram
+re-sends updates it did not get a 2xx for, so repeated update_ids are
+dropped, and a full queue answers 503 to make Telegram retry later instead of
+buffering without bound.
+"""
+import logging
+import os
+import queue
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from telegram import Update
+from telegram.ext import Dispatcher
+from logging_setup import configure_logging
+from metrics import Gauge, FAILURES
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Number of threads handling webhook updates
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", "8"))
+
+# Maximum number of updates waiting for a worker, across all workers
+WEBHOOK_QUEUE_SIZE = int(os.environ.get("WEBHOOK_QUEUE_SIZE", "1000"))
+
+# Number of recent update_ids remembered to drop redeliveries
+WEBHOOK_DEDUPE_SIZE = int(os.environ.get("WEBHOOK_DEDUPE_SIZE", "10000"))
+
+class WebhookUpdateQueue:
+    """Bounded, deduplicating queue of webhook updates with a worker pool."""
+
+    def __init__(self, dispatcher: Dispatcher, workers: int = WEBHOOK_WORKERS,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE, dedupe_size: int = WEBHOOK_DEDUPE_SIZE):
+        """
+        Initialize the queue.
+
+        Args:
+            dispatcher: The python-telegram-bot dispatcher whose handlers process updates
+            workers: Number of worker threads
+            queue_size: Maximum number of queued updates across all workers
+            dedupe_size: Number of recent update_ids remembered
+        """
+        self.dispatcher = dispatcher
+        self.bot = dispatcher.bot
+        self.dedupe_size = dedupe_size
+        per_worker = max(1, -(-queue_size // workers))
+        self._queues: List[queue.Queue] = [queue.Queue(maxsize=per_worker) for _ in range(workers)]
+        self._threads: List[threading.Thread] = []
+        self._seen: "OrderedDict[int, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.duplicate_count = 0
+        self.rejected_count = 0
+        Gauge('webhook_queued_updates', 'Webhook updates waiting for a worker', self.queued)
+
+    def start(self) -> None:
+        """Start the worker threads."""
+        if self._threads:
+            return
+        for index, updates in enumerate(self._queues):
+            thread = threading.Thread(target=self._run, args=(updates,),
+                                      name=f'webhook-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Webhook workers started ({len(self._threads)} workers)")
+
+    def stop(self) -> None:
+        """Stop the workers after the updates already queued have been handled."""
+        for updates in self._queues:
+            updates.put(None)
+        for thread in self._threads:
+            thread.join(timeout=10)
+        self._threads = []
+
+    def queued(self) -> int:
+        """Return the number of updates waiting for a worker."""
+        return sum(updates.qsize() for updates in self._queues)
+
+    def submit(self, data: Dict[str, Any]) -> bool:
+        """
+        Queue an update received by the webhook.
+
+        Args:
+            data: The decoded JSON body of the webhook request
+
+        Returns:
+            True if the update was queued or is a duplicate, False if the queue is full
+        """
+        update = Update.de_json(data, self.bot)
+        if update is None:
+            return True
+
+        chat = update.effective_chat or update.effective_user
+        updates = self._queues[(chat.id if chat else update.update_id) % len(self._queues)]
+        with self._lock:
+            if update.update_id in self._seen:
+                self.duplicate_count += 1
+                logger.debug(f"Dropping duplicate update {update.update_id}")
+                return True
+            try:
+                updates.put_nowait(update)
+            except queue.Full:
+                self.rejected_count += 1
+                FAILURES.inc('webhook_queue_full')
+                return False
+            # Only remembered once queued, so a rejected update is accepted when retried
+            self._seen[update.update_id] = None
+            if len(self._seen) > self.dedupe_size:
+                self._seen.popitem(last=False)
+        return True
+
+    def _run(self, updates: queue.Queue) -> None:
+        while True:
+            update: Optional[Update] = updates.get()
+            if update is None:
+                break
+            try:
+                # Errors raised by handlers go to the dispatcher's error handlers
+                self.dispatcher.process_update(update)
+            except Exception as e:
+                logger.error(f"Error processing update {update.update_id}: {e}", exc_info=True)
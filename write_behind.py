@@ -0,0 +1,403 @@
+import atexit
+import glob
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from logging_setup import configure_logging
+from metrics import DB_COMMIT_LATENCY, FAILURES
+
+try:
+    import fcntl
+except ImportError:
+    # No flock (Windows): claim-mode workers cannot adopt each other's journals
+    fcntl = None
+
+# Configure logging
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Flush buffered "sent" confirmations at least this often (seconds) ...
+WRITE_BEHIND_INTERVAL = float(os.environ.get("WRITE_BEHIND_INTERVAL", "1.0"))
+
+# ... or as soon as this many are buffered
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", "500"))
+
+# Local journal of confirmations not yet committed; empty disables it. In claim
+# mode each worker journals to <path>.<WORKER_ID>
+SENT_JOURNAL_PATH = os.environ.get("SENT_JOURNAL_PATH", "sent_journal.log")
+
+# Maximum number of job IDs in one UPDATE ... WHERE job_id IN (...)
+UPDATE_CHUNK_SIZE = 1000
+
+class SentWriteBehind:
+    """
+    Write-behind queue for "mark as sent" updates.
+
+    Delivery workers call record() after Telegram accepts a message. Records are
+    buffered and flushed by a background thread every WRITE_BEHIND_INTERVAL
+    seconds or every WRITE_BEHIND_BATCH_SIZE records, as bulk
+    ``UPDATE ... SET is_sent = true WHERE job_id IN (...)`` statements in a
+    single transaction (one statement per distinct sent_at second).
+
+    Durability:
+        - Clean shutdown: stop() (also registered with atexit) flushes the buffer.
+        - Process crash: every record is appended to a local journal before
+          record() returns; the journal is replayed into the database on the next
+          start, before pending messages are loaded, so nothing that was sent is
+          sent again. Only a crash between Telegram's reply and the journal write
+          can cause a duplicate.
+        - Host loss: the journal is flushed to the OS on every record and fsynced
+          on every flush, so at most one interval of confirmations can be lost if
+          the disk survives; on an ephemeral disk those messages may be re-sent.
+
+    Each flush rotates the journal into a numbered segment that is deleted once
+    its records are committed, so the journal stays bounded by the flush backlog.
+    A journal and its segments belong to one process (see sent_journal_path());
+    if a rotation or commit fails, the batch stays buffered for the next flush.
+    """
+
+    def __init__(self, journal_path: Optional[str] = SENT_JOURNAL_PATH,
+                 interval: float = WRITE_BEHIND_INTERVAL, batch_size: int = WRITE_BEHIND_BATCH_SIZE):
+        """
+        Initialize the write-behind queue.
+
+        Args:
+            journal_path: Path of the local journal, or None/empty to disable it
+            interval: Maximum seconds between flushes
+            batch_size: Number of buffered records that triggers an early flush
+        """
+        self.journal_path = journal_path or None
+        self.interval = interval
+        self.batch_size = batch_size
+        self._buffer: List[Tuple[str, datetime]] = []
+        self._unflushed = set()
+        self._segments: List[str] = []
+        self._segment_seq = 0
+        self._journal = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.flushed_count = 0
+
+    def start(self) -> None:
+        """Open the journal and start the flush thread."""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            if self.journal_path:
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._run, name='sent-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        logger.info(f"Sent write-behind started (interval {self.interval}s, batch {self.batch_size})")
+
+    def stop(self) -> None:
+        """Stop the flush thread and flush everything still buffered."""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+        with self._cond:
+            if self._journal:
+                self._journal.close()
+                self._journal = None
+
+    def record(self, job_id: str, sent_at: datetime) -> None:
+        """
+        Buffer a sent confirmation.
+
+        Args:
+            job_id: The ID of the job that was sent
+            sent_at: When it was sent
+        """
+        self.record_many([job_id], sent_at)
+
+    def record_many(self, job_ids: List[str], sent_at: datetime) -> None:
+        """
+        Buffer the sent confirmations of messages delivered together.
+
+        They are journaled in one write and land in the same flush, so they
+        are marked sent by one UPDATE.
+
+        Args:
+            job_ids: The IDs of the jobs that were sent
+            sent_at: When they were sent
+        """
+        with self._cond:
+            if self._journal:
+                stamp = sent_at.isoformat()
+                try:
+                    self._journal.write("".join(f"{job_id}\t{stamp}\n" for job_id in job_ids))
+                    self._journal.flush()
+                except (OSError, ValueError) as e:
+                    # The messages were delivered; losing crash protection for
+                    # them must not turn into a failed (and retried) send
+                    logger.error(f"Could not journal {len(job_ids)} sent confirmations: {e}")
+                    FAILURES.inc('sent_journal')
+            self._buffer.extend((job_id, sent_at) for job_id in job_ids)
+            self._unflushed.update(job_ids)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def pending(self) -> int:
+        """Return the number of confirmations not yet committed."""
+        return len(self._unflushed)
+
+    def is_unflushed(self, job_id: str) -> bool:
+        """Return True if a job was sent but its confirmation is not committed yet."""
+        return job_id in self._unflushed
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._running:
+                    break
+                if len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.interval)
+                if not self._running:
+                    break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in sent write-behind flush: {e}", exc_info=True)
+
+    def _rotate_journal(self) -> None:
+        """
+        Move the current journal into a segment owned by the flush in progress.
+
+        The journal is reopened even if the move fails, so record() keeps
+        working; the records stay in it and go into the next segment.
+        """
+        if not self._journal:
+            return
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._journal.close()
+        try:
+            self._segment_seq += 1
+            segment = f"{self.journal_path}.segment.{self._segment_seq}"
+            os.replace(self.journal_path, segment)
+            self._segments.append(segment)
+        finally:
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def flush(self) -> int:
+        """
+        Commit every buffered confirmation.
+
+        Returns:
+            The number of confirmations committed
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch = self._buffer
+                if not batch:
+                    return 0
+                try:
+                    self._rotate_journal()
+                except OSError as e:
+                    logger.error(f"Error rotating sent journal {self.journal_path}: {e}", exc_info=True)
+                    FAILURES.inc('sent_journal')
+                    # Leave the batch buffered for the next flush
+                    return 0
+                self._buffer = []
+                segments = list(self._segments)
+
+            started = time.perf_counter()
+            try:
+                mark_sent_in_db(batch)
+            except Exception as e:
+                logger.error(f"Error flushing {len(batch)} sent confirmations: {e}", exc_info=True)
+                FAILURES.inc('db_commit')
+                # Keep the records and their journal segments for the next attempt
+                with self._cond:
+                    self._buffer[:0] = batch
+                return 0
+
+            DB_COMMIT_LATENCY.observe(time.perf_counter() - started, 'sent_update')
+            with self._cond:
+                for segment in segments:
+                    self._segments.remove(segment)
+                self._unflushed.difference_update(job_id for job_id, _ in batch)
+            for segment in segments:
+                try:
+                    os.remove(segment)
+                except OSError as e:
+                    logger.warning(f"Could not remove journal segment {segment}: {e}")
+
+            self.flushed_count += len(batch)
+            logger.debug(f"Flushed {len(batch)} sent confirmations")
+            return len(batch)
+
+def mark_sent_in_db(records: Iterable[Tuple[str, datetime]]) -> None:
+    """
+    Mark messages as sent with bulk UPDATEs in one transaction.
+
+    Args:
+        records: (job_id, sent_at) pairs; sent_at is grouped to the second
+    """
+    # Import locally to avoid circular imports
+    from database import app
+    from models import db, ScheduledMessage
+
+    by_second: Dict[datetime, List[str]] = {}
+    for job_id, sent_at in records:
+        by_second.setdefault(sent_at.replace(microsecond=0), []).append(job_id)
+
+    with app.app_context():
+        try:
+            for sent_at, job_ids in by_second.items():
+                for start in range(0, len(job_ids), UPDATE_CHUNK_SIZE):
+                    db.session.execute(
+                        db.update(ScheduledMessage)
+                        .where(
+                            ScheduledMessage.job_id.in_(job_ids[start:start + UPDATE_CHUNK_SIZE]),
+                            ScheduledMessage.is_sent == False
+                        )
+                        .values(is_sent=True, sent_at=sent_at)
+                        .execution_options(synchronize_session=False)
+                    )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+def sent_journal_path(worker_id: Optional[str] = None, base_path: Optional[str] = SENT_JOURNAL_PATH) -> Optional[str]:
+    """
+    Return the sent journal path of this process.
+
+    In claim mode several workers share the working directory, and each one
+    replays and deletes its journal on start, so every worker gets its own.
+    The default WORKER_ID changes with every process, so journals left by
+    workers that died are found through their lock files instead (see
+    replay_orphaned_sent_journals()).
+
+    Args:
+        worker_id: The claim-mode worker ID, or None for the single memory-mode process
+        base_path: The configured journal path, or None/empty if journaling is disabled
+
+    Returns:
+        The journal path, or None if journaling is disabled
+    """
+    if not base_path:
+        return None
+    if worker_id is None:
+        return base_path
+    return f"{base_path}.{re.sub(r'[^A-Za-z0-9_.-]', '_', worker_id)}"
+
+def replay_sent_journal(journal_path: Optional[str] = SENT_JOURNAL_PATH) -> int:
+    """
+    Apply confirmations left in this process's journal by a previous run and delete it.
+
+    Must run before pending messages are loaded so they are not sent twice.
+    Only the journal at journal_path and its own segments are touched; other
+    workers' journals are left alone.
+
+    Args:
+        journal_path: Path of the journal, or None/empty if journaling is disabled
+
+    Returns:
+        The number of confirmations replayed
+    """
+    if not journal_path:
+        return 0
+    paths = sorted(glob.glob(f"{glob.escape(journal_path)}.segment.*"))
+    if os.path.exists(journal_path):
+        paths.append(journal_path)
+    if not paths:
+        return 0
+
+    records = []
+    for path in paths:
+        with open(path, encoding='utf-8') as journal:
+            for line in journal:
+                job_id, _, sent_at = line.rstrip('\n').partition('\t')
+                try:
+                    records.append((job_id, datetime.fromisoformat(sent_at)))
+                except ValueError:
+                    # A torn final line from a crash mid-write
+                    logger.warning(f"Skipping malformed journal line in {path}: {line!r}")
+
+    if records:
+        mark_sent_in_db(records)
+    for path in paths:
+        os.remove(path)
+    logger.info(f"Replayed {len(records)} sent confirmations from {len(paths)} journal file(s)")
+    return len(records)
+
+def lock_sent_journal(journal_path: Optional[str]):
+    """
+    Mark a claim-mode worker's journal as owned by this process.
+
+    Takes an exclusive flock on <journal_path>.lock, held until the process
+    exits (the OS releases it even on a crash), so other workers only adopt
+    the journal once its owner is gone.
+
+    Args:
+        journal_path: Path of the worker's journal, or None/empty if journaling is disabled
+
+    Returns:
+        The open lock file, which must be kept referenced, or None
+    """
+    if not journal_path or fcntl is None:
+        return None
+    lock_file = open(f"{journal_path}.lock", 'a')
+    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    return lock_file
+
+def replay_orphaned_sent_journals(base_path: Optional[str] = SENT_JOURNAL_PATH,
+                                  own_path: Optional[str] = None) -> int:
+    """
+    Replay and delete the journals of claim-mode workers that are no longer running.
+
+    A journal is orphaned when nobody holds the lock on its lock file. Each
+    one is locked while it is replayed, so two starting workers never replay
+    the same journal, and live workers' journals are never touched.
+
+    Args:
+        base_path: The configured journal path, or None/empty if journaling is disabled
+        own_path: This worker's journal path, which is skipped
+
+    Returns:
+        The number of confirmations replayed
+    """
+    if not base_path or fcntl is None:
+        return 0
+    replayed = 0
+    for lock_path in glob.glob(f"{glob.escape(base_path)}.*.lock"):
+        journal_path = lock_path[:-len('.lock')]
+        if journal_path == own_path:
+            continue
+        try:
+            # Not created if the adopting worker already removed it
+            descriptor = os.open(lock_path, os.O_RDWR)
+        except FileNotFoundError:
+            continue
+        with os.fdopen(descriptor) as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Its worker is alive
+                continue
+            try:
+                replayed += replay_sent_journal(journal_path)
+            except Exception as e:
+                logger.error(f"Error replaying orphaned sent journal {journal_path}: {e}", exc_info=True)
+                continue
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+            logger.info(f"Adopted the sent journal of a stopped worker: {journal_path}")
+    return replayed